@@ -0,0 +1,219 @@
+import audioop
+import io
+import math
+import os
+import time
+import wave
+
+
+AUDIO_PREPROCESS_ENABLED = os.getenv("AUDIO_PREPROCESS_ENABLED", "true").lower() in ("1", "true", "yes")
+AUDIO_PREPROCESS_SAMPLE_RATE = int(os.getenv("AUDIO_PREPROCESS_SAMPLE_RATE", "16000"))
+# wav (16-bit PCM, standard library only) or opus (ogg/opus through ffmpeg, ~10x smaller)
+AUDIO_PREPROCESS_FORMAT = os.getenv("AUDIO_PREPROCESS_FORMAT", "wav").strip().lower()
+# Frames quieter than this are silence; 0 dBFS is full scale
+AUDIO_SILENCE_THRESHOLD_DBFS = float(os.getenv("AUDIO_SILENCE_THRESHOLD_DBFS", "-45"))
+# Audio kept on each side of the detected speech so word onsets are not clipped
+AUDIO_SILENCE_PADDING_MS = int(os.getenv("AUDIO_SILENCE_PADDING_MS", "250"))
+
+SAMPLE_WIDTH = 2
+FRAME_MS = 30
+# Consecutive loud frames needed to count as speech; shorter bursts are clicks
+MIN_SPEECH_FRAMES = 3
+OPUS_BITRATE = "24k"
+
+FORMATS = {
+    "wav": ("audio/wav", ".wav"),
+    "opus": ("audio/ogg", ".ogg"),
+}
+
+
+def decode_pcm(data, filename=None, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE):
+    """
+    Decode audio bytes to mono 16-bit little-endian PCM at sample_rate. WAV
+    is converted with the standard library; anything else goes through
+    pydub (and therefore ffmpeg).
+    """
+    try:
+        with wave.open(io.BytesIO(data), "rb") as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        from pydub import AudioSegment
+        segment = AudioSegment.from_file(io.BytesIO(data), format=_format_from_name(filename))
+        segment = segment.set_channels(1).set_frame_rate(sample_rate).set_sample_width(SAMPLE_WIDTH)
+        return segment.raw_data
+
+    if channels == 2:
+        frames = audioop.tomono(frames, width, 0.5, 0.5)
+    elif channels > 2:
+        frames = _first_channel(frames, width, channels)
+    if width != SAMPLE_WIDTH:
+        frames = audioop.lin2lin(frames, width, SAMPLE_WIDTH)
+    if rate != sample_rate:
+        frames, _ = audioop.ratecv(frames, SAMPLE_WIDTH, 1, rate, sample_rate, None)
+    return frames
+
+
+def _first_channel(frames, width, channels):
+    step = width * channels
+    return b"".join(frames[i:i + width] for i in range(0, len(frames), step))
+
+
+def _format_from_name(filename):
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    return extension or None
+
+
+def pcm_seconds(pcm, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE):
+    return len(pcm) / (sample_rate * SAMPLE_WIDTH)
+
+
+def frame_levels(pcm, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE, frame_ms=FRAME_MS):
+    """RMS level of each frame_ms frame in dBFS (-inf for digital silence)."""
+    frame_bytes = sample_rate * frame_ms // 1000 * SAMPLE_WIDTH
+    levels = []
+    for start in range(0, len(pcm) - frame_bytes + 1, frame_bytes):
+        rms = audioop.rms(pcm[start:start + frame_bytes], SAMPLE_WIDTH)
+        levels.append(20 * math.log10(rms / 32768) if rms else float("-inf"))
+    return levels
+
+
+def speech_frames(levels, threshold_dbfs=AUDIO_SILENCE_THRESHOLD_DBFS, min_frames=MIN_SPEECH_FRAMES):
+    """
+    Indexes of frames inside a run of at least min_frames frames above the
+    threshold: a minimal energy VAD that ignores isolated clicks.
+    """
+    voiced, run = [], []
+    for index, level in enumerate(levels):
+        if level > threshold_dbfs:
+            run.append(index)
+            continue
+        if len(run) >= min_frames:
+            voiced.extend(run)
+        run = []
+    if len(run) >= min_frames:
+        voiced.extend(run)
+    return voiced
+
+
+def speech_bounds(pcm, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE, threshold_dbfs=AUDIO_SILENCE_THRESHOLD_DBFS,
+                  padding_ms=AUDIO_SILENCE_PADDING_MS):
+    """(start, end) byte offsets of the speech in pcm with padding, or None if it is all silence."""
+    voiced = speech_frames(frame_levels(pcm, sample_rate), threshold_dbfs)
+    if not voiced:
+        return None
+    frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+    padding = sample_rate * padding_ms // 1000 * SAMPLE_WIDTH
+    start = max(0, voiced[0] * frame_bytes - padding)
+    end = min(len(pcm), (voiced[-1] + 1) * frame_bytes + padding)
+    return start, end
+
+
+def encode(pcm, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE, fmt=AUDIO_PREPROCESS_FORMAT):
+    """Mono 16-bit PCM as a WAV or Ogg/Opus file."""
+    if fmt == "opus":
+        from pydub import AudioSegment
+        segment = AudioSegment(pcm, sample_width=SAMPLE_WIDTH, frame_rate=sample_rate, channels=1)
+        out = io.BytesIO()
+        segment.export(out, format="ogg", codec="libopus", bitrate=OPUS_BITRATE)
+        return out.getvalue()
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(SAMPLE_WIDTH)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm)
+    return out.getvalue()
+
+
+def preprocess(data, filename=None, fmt=AUDIO_PREPROCESS_FORMAT, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE):
+    """
+    Downmix, resample and trim leading/trailing silence from an audio file.
+
+    Returns (processed, report). processed is (bytes, content_type,
+    extension), or None when the original should be sent as is: no speech
+    at all (report["speech_detected"] is False) or nothing would be saved,
+    as with an already small compressed upload that would only grow as WAV.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown AUDIO_PREPROCESS_FORMAT '{fmt}', expected one of: {', '.join(FORMATS)}")
+    started = time.perf_counter()
+    pcm = decode_pcm(data, filename, sample_rate)
+    seconds_in = pcm_seconds(pcm, sample_rate)
+    report = {
+        "applied": False,
+        "speech_detected": True,
+        "format": fmt,
+        "bytes_in": len(data),
+        "bytes_out": len(data),
+        "bytes_saved": 0,
+        "seconds_in": round(seconds_in, 3),
+        "seconds_out": round(seconds_in, 3),
+        "seconds_saved": 0.0,
+    }
+
+    bounds = speech_bounds(pcm, sample_rate)
+    if bounds is None:
+        report.update(speech_detected=False, ms=round((time.perf_counter() - started) * 1000, 1))
+        return None, report
+
+    trimmed = pcm[bounds[0]:bounds[1]]
+    encoded = encode(trimmed, sample_rate, fmt)
+    seconds_out = pcm_seconds(trimmed, sample_rate)
+    report["ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if len(encoded) >= len(data) and seconds_in - seconds_out < FRAME_MS / 1000:
+        return None, report
+
+    content_type, extension = FORMATS[fmt]
+    report.update(
+        applied=True,
+        bytes_out=len(encoded),
+        bytes_saved=len(data) - len(encoded),
+        seconds_out=round(seconds_out, 3),
+        seconds_saved=round(seconds_in - seconds_out, 3),
+    )
+    return (encoded, content_type, extension), report
+
+
+def _best_cut(levels, low, high, target, threshold_dbfs):
+    """Frame to cut at in [low, high]: middle of the longest silence, else the quietest frame; nearest target wins ties."""
+    best, best_key = None, None
+    run_start = None
+    for index in range(low, high + 2):
+        silent = index <= high and levels[index] <= threshold_dbfs
+        if silent and run_start is None:
+            run_start = index
+        elif not silent and run_start is not None:
+            middle = (run_start + index - 1) // 2
+            key = (index - run_start, -abs(middle - target))
+            if best_key is None or key > best_key:
+                best, best_key = middle, key
+            run_start = None
+    if best is not None:
+        return best
+    return min(range(low, high + 1), key=lambda i: (levels[i], abs(i - target)))
+
+
+def plan_segments(pcm, sample_rate=AUDIO_PREPROCESS_SAMPLE_RATE, target_seconds=30.0, overlap_ms=300,
+                  threshold_dbfs=AUDIO_SILENCE_THRESHOLD_DBFS):
+    """
+    Split points for long audio: (start, end) byte ranges of roughly
+    target_seconds, cut in the longest pause near each target and extended
+    by overlap_ms on both sides so words at a cut are not lost.
+    """
+    levels = frame_levels(pcm, sample_rate)
+    frame_bytes = sample_rate * FRAME_MS // 1000 * SAMPLE_WIDTH
+    target = max(1, int(target_seconds * 1000 / FRAME_MS))
+    cuts, start = [], 0
+    # Keep cutting while the rest would be more than 1.5 targets long
+    while len(levels) - start > target * 3 // 2:
+        cut = _best_cut(levels, start + target // 2, min(len(levels) - 1, start + target * 3 // 2),
+                        start + target, threshold_dbfs)
+        cuts.append(cut)
+        start = cut
+    overlap = sample_rate * overlap_ms // 1000 * SAMPLE_WIDTH
+    edges = [0] + [cut * frame_bytes for cut in cuts] + [len(pcm)]
+    return [
+        (max(0, edges[i] - overlap), min(len(pcm), edges[i + 1] + overlap))
+        for i in range(len(edges) - 1)
+    ]
@@ -0,0 +1,239 @@
+from logger import logger
+from flask import Request
+from werkzeug.utils import secure_filename
+import io
+import os
+import tempfile
+
+
+MAX_AUDIO_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Uploads up to this size stay in memory, larger ones are spooled to one temp file
+AUDIO_SPOOL_MEMORY_BYTES = int(os.getenv("AUDIO_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+
+class AudioTooLarge(Exception):
+    """The uploaded audio exceeds MAX_AUDIO_UPLOAD_BYTES."""
+
+    def __init__(self, size, limit):
+        super().__init__(f"Audio file is {size} bytes, the limit is {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+class UploadRequest(Request):
+    """
+    Flask request class that writes file parts straight into their final
+    buffer: memory for small bodies, a plain temp file (no
+    SpooledTemporaryFile rollover copy) for everything else.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= AUDIO_SPOOL_MEMORY_BYTES:
+            return io.BytesIO()
+        return tempfile.TemporaryFile("wb+")
+
+
+class BufferReader(io.RawIOBase):
+    """Independent, seekable reader over a shared AudioBuffer; reads one chunk at a time."""
+
+    def __init__(self, audio):
+        self._audio = audio
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._audio.read_at(self._pos, len(buffer))
+        n = len(chunk)
+        buffer[:n] = chunk
+        self._pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = self._audio.size + offset
+        self._pos = max(0, self._pos)
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+
+def part_filename(filename):
+    """
+    The client's file name made safe for a quoted multipart header: ASCII
+    letters, digits, dots, dashes and underscores only, so quotes and CR/LF
+    cannot end the header early. Falls back to "audio" plus the extension.
+    """
+    safe = secure_filename(filename or "")
+    extension = secure_filename(os.path.splitext(filename or "")[1].lstrip("."))
+    if safe and (not extension or safe.endswith(f".{extension}")):
+        return safe
+    return f"audio.{extension}" if extension else "audio"
+
+
+class MultipartStream(io.RawIOBase):
+    """
+    multipart/form-data body that streams the audio from the shared buffer.
+    Exposes __len__ so requests sends a Content-Length instead of building
+    the whole body in memory.
+    """
+
+    def __init__(self, fields, file_field, audio):
+        self.boundary = os.urandom(16).hex()
+        preamble = b""
+        for name, value in fields.items():
+            preamble += (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+                f"{value}\r\n"
+            ).encode("utf-8")
+        preamble += (
+            f"--{self.boundary}\r\n"
+            f'Content-Disposition: form-data; name="{file_field}"; filename="{part_filename(audio.filename)}"\r\n'
+            f"Content-Type: {audio.content_type}\r\n\r\n"
+        ).encode("utf-8")
+        epilogue = f"\r\n--{self.boundary}--\r\n".encode("utf-8")
+        self._segments = [AudioBuffer.from_bytes(preamble), audio, AudioBuffer.from_bytes(epilogue)]
+        self._length = sum(segment.size for segment in self._segments)
+        self._segment = 0
+        self._offset = 0
+
+    @property
+    def content_type(self):
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return sum(segment.size for segment in self._segments[:self._segment]) + self._offset
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        # Lets requests measure the remaining length and retries replay the body
+        if whence == io.SEEK_CUR:
+            offset += self.tell()
+        elif whence == io.SEEK_END:
+            offset += self._length
+        position = max(0, min(offset, self._length))
+        self._segment, self._offset = 0, position
+        while self._segment < len(self._segments) and self._offset >= self._segments[self._segment].size:
+            self._offset -= self._segments[self._segment].size
+            self._segment += 1
+        return position
+
+    def readinto(self, buffer):
+        written = 0
+        while written < len(buffer) and self._segment < len(self._segments):
+            segment = self._segments[self._segment]
+            chunk = segment.read_at(self._offset, len(buffer) - written)
+            n = len(chunk)
+            buffer[written:written + n] = chunk
+            written += n
+            self._offset += n
+            if self._offset >= segment.size:
+                self._segment += 1
+                self._offset = 0
+        return written
+
+
+class AudioBuffer:
+    """
+    The single in-process copy of an uploaded audio file: small uploads as
+    bytes, larger ones as a descriptor on the spooled temp file read with
+    pread(). Every transcription attempt opens its own reader over it instead
+    of seeking and re-reading the upload, and memory stays bounded by the
+    read chunk size.
+    """
+
+    def __init__(self, filename, content_type, data=None, fd=None, size=0):
+        self.filename = filename or "audio"
+        self.content_type = content_type or "application/octet-stream"
+        self._data = memoryview(data) if data is not None else None
+        self._fd = fd
+        self.size = len(data) if data is not None else size
+
+    def read_at(self, offset, n):
+        n = max(0, min(n, self.size - offset))
+        if n == 0:
+            return b""
+        if self._data is not None:
+            return self._data[offset:offset + n]
+        return os.pread(self._fd, n, offset)
+
+    def read_all(self):
+        return bytes(self.read_at(0, self.size))
+
+    def open(self):
+        return BufferReader(self)
+
+    def iter_chunks(self, chunk_size=UPLOAD_CHUNK_BYTES):
+        for start in range(0, self.size, chunk_size):
+            yield self.read_at(start, chunk_size)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    @classmethod
+    def from_bytes(cls, data, filename=None, content_type=None):
+        return cls(filename, content_type, data=data)
+
+    @classmethod
+    def _from_fileno(cls, fileno, filename, content_type, max_bytes):
+        size = os.fstat(fileno).st_size
+        if size > max_bytes:
+            raise AudioTooLarge(size, max_bytes)
+        # Our own descriptor keeps the (possibly already unlinked) file alive
+        # after Werkzeug closes the upload at the end of the request
+        return cls(filename, content_type, fd=os.dup(fileno), size=size)
+
+    @classmethod
+    def from_upload(cls, upload, max_bytes=MAX_AUDIO_UPLOAD_BYTES):
+        """Wrap a Werkzeug FileStorage without copying it when it is file-backed."""
+        stream = upload.stream
+        if isinstance(stream, io.BytesIO):
+            data = stream.getvalue()
+            if len(data) > max_bytes:
+                raise AudioTooLarge(len(data), max_bytes)
+            return cls.from_bytes(data, upload.filename, upload.content_type)
+
+        try:
+            stream.flush()
+            return cls._from_fileno(stream.fileno(), upload.filename, upload.content_type, max_bytes)
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            pass
+
+        # Not file-backed: spool once into a temp file, enforcing the limit as we go
+        logger.debug("Spooling non file-backed upload to a temp file")
+        with tempfile.TemporaryFile("wb+") as spool:
+            total = 0
+            stream.seek(0)
+            for chunk in iter(lambda: stream.read(UPLOAD_CHUNK_BYTES), b""):
+                total += len(chunk)
+                if total > max_bytes:
+                    raise AudioTooLarge(total, max_bytes)
+                spool.write(chunk)
+            spool.flush()
+            return cls._from_fileno(spool.fileno(), upload.filename, upload.content_type, max_bytes)
+
+    @classmethod
+    def from_path(cls, path, content_type=None, max_bytes=MAX_AUDIO_UPLOAD_BYTES):
+        with open(path, "rb") as f:
+            return cls._from_fileno(f.fileno(), os.path.basename(path), content_type, max_bytes)
@@ -0,0 +1,229 @@
+from logger import logger
+from cache import result_cache
+from pipeline_engine import STAGES, engine, run_stage
+from fast_path import try_fast_path
+from category_index import split_categories
+from prompts import (
+    BATCH_MAX_OUTPUT_TOKENS,
+    BATCH_OVERHEAD_TOKENS,
+    batch_prompt,
+    batch_record_line,
+    estimate_tokens,
+    fits_prompt,
+)
+from translate_and_classify import (
+    LLM_MODEL_NAME,
+    clean_classification,
+    fallback_classification,
+    fused_cache_key,
+    fused_ok,
+    response_flags,
+    run_pipeline_async,
+    strip_code_fences,
+    untranslated,
+)
+import asyncio
+import json
+import metrics
+import model_registry
+import os
+import upstream
+
+
+BATCH_MAX_RECORDS = int(os.getenv("BATCH_MAX_RECORDS", "500"))
+# Rough input budget per packed prompt (instructions + records)
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "3000"))
+BATCH_MAX_RECORDS_PER_PROMPT = int(os.getenv("BATCH_MAX_RECORDS_PER_PROMPT", "25"))
+
+BATCH_RESPONSE_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer"},
+            "translated_text": {"type": "string"},
+            "classified_items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "category": {"type": "string"},
+                        "item": {"type": "string"},
+                        "amount": {"type": "number"},
+                    },
+                    "required": ["category", "item", "amount"],
+                },
+            },
+        },
+        "required": ["id", "translated_text", "classified_items"],
+    },
+}
+
+BATCH_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": BATCH_RESPONSE_SCHEMA,
+    "max_output_tokens": BATCH_MAX_OUTPUT_TOKENS,
+}
+
+
+def _record_line(index, record):
+    return batch_record_line(index, record["text"], record["categories"])
+
+
+def pack_records(indexed_records, token_budget=BATCH_TOKEN_BUDGET, max_per_prompt=BATCH_MAX_RECORDS_PER_PROMPT):
+    """
+    Greedily group (index, record) pairs into packs whose prompt stays under
+    token_budget. A record larger than the budget gets a pack of its own.
+    """
+    packs = []
+    current, current_tokens = [], BATCH_OVERHEAD_TOKENS
+    for index, record in indexed_records:
+        tokens = estimate_tokens(_record_line(index, record))
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_per_prompt):
+            packs.append(current)
+            current, current_tokens = [], BATCH_OVERHEAD_TOKENS
+        current.append((index, record))
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def _build_prompt(pack):
+    return batch_prompt([_record_line(index, record) for index, record in pack])
+
+
+def _error_result(record, error):
+    categories = record.get("categories") or []
+    items = fallback_classification(record["text"], categories) if categories else []
+    for item in items:
+        item["error"] = error
+    return {
+        "original_text": record.get("text", ""),
+        "translated_text": "",
+        "classified_items": items,
+        "status": "error",
+        "error": error,
+    }
+
+
+def _success_result(record, translated_text, classified_items):
+    return {
+        "original_text": record["text"],
+        "translated_text": translated_text,
+        "classified_items": classified_items,
+        "status": "success",
+    }
+
+
+async def _classify_pack(pack):
+    """Run one packed prompt and return {index: result} for every record in it."""
+    try:
+        model = model_registry.get_model(LLM_MODEL_NAME, BATCH_GENERATION_CONFIG)
+        # Packed prompts are slow to generate: one attempt may use the whole stage timeout
+        response = await run_stage(
+            "batch", upstream.call_async, "gemini", model.generate_content_async, _build_prompt(pack),
+            attempt_timeout=STAGES["batch"].timeout,
+        )
+        metrics.record_usage("batch", response)
+        parsed = json.loads(strip_code_fences(response.text.strip()))
+        if not isinstance(parsed, list):
+            raise ValueError(f"Expected list but got {type(parsed)}")
+    except Exception as e:
+        logger.exception(f"Packed classification of {len(pack)} records failed")
+        return {index: _error_result(record, str(e)) for index, record in pack}
+
+    by_id = {}
+    for entry in parsed:
+        if isinstance(entry, dict) and isinstance(entry.get("id"), int):
+            by_id[entry["id"]] = entry
+
+    results = {}
+    for index, record in pack:
+        entry = by_id.get(index)
+        if entry is None:
+            results[index] = _error_result(record, "Record missing from model response")
+            continue
+        translated_text = str(entry.get("translated_text") or record["text"]).strip()
+        try:
+            items = clean_classification(entry.get("classified_items"), translated_text, record["categories"])
+        except Exception as e:
+            results[index] = _error_result(record, str(e))
+            continue
+        results[index] = _success_result(record, translated_text, items)
+    return results
+
+
+async def _classify_oversized(index, record, bypass_cache):
+    """A record over the prompt input budget, split into parts like a single /classify-expense call."""
+    try:
+        translation, items = await run_pipeline_async(record["text"], record["categories"], bypass_cache=bypass_cache)
+    except Exception as e:
+        logger.exception(f"Classification of oversized batch record {index} failed")
+        return {index: _error_result(record, str(e))}
+    if translation.get("status") == "error":
+        return {index: _error_result(record, f"Translation failed: {translation.get('error')}")}
+    result = _success_result(record, translation["translated_text"], items)
+    result.update(response_flags(translation))
+    return {index: result}
+
+
+async def classify_batch_async(records, bypass_cache=False):
+    """
+    Translate and classify many {text, categories} records.
+
+    Fast-path and cached records are answered directly; the rest are packed
+    several per prompt, dispatched concurrently (bounded by the "batch"
+    stage) and returned in input order. Records over the prompt input budget
+    are split and classified on their own instead of being cut to fit a
+    pack. Failures come back per record.
+    """
+    results = [None] * len(records)
+    pending, oversized = [], []
+    for index, record in enumerate(records):
+        text = str(record.get("text") or "").strip() if isinstance(record, dict) else ""
+        categories = split_categories(record.get("categories")) if isinstance(record, dict) else None
+        if not text or not categories:
+            results[index] = _error_result({"text": text, "categories": []}, "Missing text or categories")
+            continue
+        record = {"text": text, "categories": categories}
+
+        fast_items = try_fast_path(text, categories)
+        if fast_items is not None:
+            results[index] = {**_success_result(record, text, fast_items), **response_flags(untranslated(text))}
+            continue
+
+        if result_cache.enabled and not bypass_cache:
+            cached = result_cache.get(fused_cache_key(text, categories))
+            if cached is not None:
+                results[index] = _success_result(record, cached["translated_text"], cached["classified_items"])
+                continue
+        if not fits_prompt(text):
+            oversized.append((index, record))
+            continue
+        pending.append((index, record))
+
+    categories_by_index = {index: record["categories"] for index, record in pending}
+    packs = pack_records(pending)
+    logger.info(f"Batch of {len(records)} records: {len(pending)} to classify in {len(packs)} prompt(s)"
+                + (f", {len(oversized)} oversized on their own" if oversized else ""))
+
+    for pack_results in await asyncio.gather(
+            *(_classify_pack(pack) for pack in packs),
+            *(_classify_oversized(index, record, bypass_cache) for index, record in oversized)):
+        for index, result in pack_results.items():
+            results[index] = result
+            # Oversized records were cached part by part by the single-record pipeline
+            if result_cache.enabled and result["status"] == "success" and index in categories_by_index:
+                fused_result = {
+                    "translated_text": result["translated_text"],
+                    "classified_items": result["classified_items"],
+                    "status": "success",
+                }
+                if fused_ok(fused_result):
+                    result_cache.set(fused_cache_key(result["original_text"], categories_by_index[index]), fused_result)
+    return results
+
+
+def classify_batch(records, bypass_cache=False):
+    return engine.run_sync(classify_batch_async(records, bypass_cache=bypass_cache))
@@ -0,0 +1,442 @@
+"""
+Bulk import of archived voice expenses: transcribe and classify every audio
+file under a directory, appending one JSON line per file to an output file.
+
+    python batch_transcribe.py recordings/ --output results.jsonl --categories groceries "going out"
+
+The output doubles as the checkpoint: rerunning the same command after a
+crash skips every file that already has a successful line. Resuming first
+compacts the file: error lines are dropped, since those files are retried
+and get a new line, so a finished run has exactly one line per file. A run holds an
+exclusive lock on the output (a .lock file next to it), so two runs, from
+the CLI or from any server process, never append to the same file.
+"""
+from logger import logger
+from pipeline_engine import engine, request_budget
+from audio_upload import AudioBuffer
+from category_index import split_categories
+from concurrent.futures import ProcessPoolExecutor
+from transcription import TranscriptionError, preprocess_audio_async, resolve_backend, transcribe_audio_async
+from translate_and_classify import response_flags, run_pipeline_async
+from long_audio import transcribe_long_audio_async
+from expense_store import record_items
+from job_queue import get_job_store
+import argparse
+import asyncio
+import io
+import json
+import local_stt
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # Windows: runs are not guarded against each other
+    fcntl = None
+
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".aiff", ".ogg", ".webm")
+# Files transcribed and classified at the same time; the pipeline stages still cap upstream calls
+BATCH_AUDIO_CONCURRENCY = int(os.getenv("BATCH_AUDIO_CONCURRENCY", "8"))
+# Processes decoding non-WAV files with pydub/ffmpeg
+BATCH_AUDIO_CONVERT_WORKERS = int(os.getenv("BATCH_AUDIO_CONVERT_WORKERS", str(max(1, min(4, os.cpu_count() or 1)))))
+# The API may only read directories under this root and writes its output here
+BATCH_AUDIO_ROOT = os.path.abspath(os.getenv("BATCH_AUDIO_ROOT", "audio_imports"))
+BATCH_AUDIO_OUTPUT_DIR = os.path.abspath(os.getenv("BATCH_AUDIO_OUTPUT_DIR", "batch_results"))
+# Log progress every this many files
+PROGRESS_EVERY = 25
+# Seconds between the progress snapshots an API job stores for the other server processes
+PROGRESS_SAVE_SECONDS = 1.0
+
+
+def find_audio_files(directory):
+    """Relative paths of every audio file under directory, in a stable order."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in AUDIO_EXTENSIONS:
+                found.append(os.path.relpath(os.path.join(root, name), directory))
+    return found
+
+
+def convert_file(path):
+    """
+    Process-pool worker: the file as WAV bytes. WAV is passed through;
+    other formats are decoded with pydub (ffmpeg) and re-encoded.
+    """
+    if path.lower().endswith(".wav"):
+        with open(path, "rb") as f:
+            return f.read()
+    from pydub import AudioSegment
+    out = io.BytesIO()
+    AudioSegment.from_file(path).export(out, format="wav")
+    return out.getvalue()
+
+
+def lock_output(output_path):
+    """
+    Take the exclusive lock on output_path across processes and return the
+    open lock file; closing it releases the lock. RuntimeError when another
+    run holds it.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    lock = open(output_path + ".lock", "a")
+    if fcntl is not None:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock.close()
+            raise RuntimeError(f"Another batch run is writing {output_path}")
+    return lock
+
+
+def output_locked(output_path):
+    """Whether some run currently holds the lock on output_path."""
+    try:
+        lock_output(output_path).close()
+    except RuntimeError:
+        return True
+    return False
+
+
+def load_checkpoint(output_path):
+    """
+    Files already finished in a previous run. The file is rewritten with
+    only their first successful line: error lines (those files are about
+    to be retried), repeats and a last line cut short by a crash are
+    dropped, so appending continues on a clean line boundary and no file
+    ends up with more than one line. Call it while holding the output lock.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb") as f:
+        data = f.read()
+    kept = []
+    lines = data.split(b"\n")
+    if lines[-1]:
+        logger.warning(f"Dropping a partial last line from {output_path}")
+    for line in lines[:-1]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("status") == "success" and record.get("file") not in done:
+            done.add(record.get("file"))
+            kept.append(line + b"\n")
+    dropped = len([line for line in lines if line]) - len(kept)
+    if dropped:
+        logger.info(f"Compacting {output_path}: dropping {dropped} failed, repeated or partial lines")
+        partial = output_path + ".compact"
+        with open(partial, "wb") as f:
+            f.writelines(kept)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, output_path)
+    return done
+
+
+class BatchProgress:
+    """Counters of one batch run, readable from other threads while it runs."""
+
+    def __init__(self, total=0, skipped=0):
+        self.total = total
+        self.skipped = skipped
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.finished = None
+
+    @property
+    def processed(self):
+        return self.succeeded + self.failed
+
+    def files_per_second(self):
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        return self.processed / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            "files_total": self.total,
+            "skipped": self.skipped,
+            "processed": self.processed,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "seconds": round((self.finished or time.perf_counter()) - self.started, 3),
+            "files_per_second": round(self.files_per_second(), 3),
+        }
+
+
+async def _process_file(directory, relative_path, pool, categories, backend, mode):
+    started = time.perf_counter()
+    record = {"file": relative_path}
+    # Each file gets its own request budget rather than sharing one for the whole job
+    with request_budget():
+        loop = asyncio.get_running_loop()
+        try:
+            wav = await loop.run_in_executor(pool, convert_file, os.path.join(directory, relative_path))
+            audio = AudioBuffer.from_bytes(wav, os.path.splitext(os.path.basename(relative_path))[0] + ".wav", "audio/wav")
+            audio, record["audio_preprocessing"] = await preprocess_audio_async(audio)
+            chunked = None
+            if not record["audio_preprocessing"]["speech_detected"]:
+                transcript = ""
+            else:
+                chunked = await transcribe_long_audio_async(audio, categories, backend, mode,
+                                                            seconds=record["audio_preprocessing"].get("seconds_out"))
+                transcript = chunked["original_text"] if chunked else (await transcribe_audio_async(audio, backend) or "").strip()
+            if not transcript:
+                record.update(status="error", error="No speech detected")
+            elif chunked:
+                record.update(
+                    status="success" if chunked["status"] == "success" else "error",
+                    original_text=transcript,
+                    translated_text=chunked["translated_text"],
+                    classified_items=chunked["classified_items"],
+                    segments=chunked["segments"],
+                )
+                record.update(response_flags(chunked))
+            else:
+                translation, items = await run_pipeline_async(transcript, categories, mode)
+                if translation.get("status") == "error":
+                    record.update(status="error", error=f"Translation failed: {translation.get('error')}",
+                                  original_text=transcript)
+                else:
+                    record.update(
+                        status="success",
+                        original_text=transcript,
+                        translated_text=translation.get("translated_text", transcript),
+                        classified_items=items,
+                    )
+                    record.update(response_flags(translation))
+        except TranscriptionError as e:
+            record.update(status="error", error=f"Transcription failed: {e}")
+        except Exception as e:
+            logger.exception(f"Batch item {relative_path} failed")
+            record.update(status="error", error=f"{type(e).__name__}: {e}")
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+async def run_batch_async(directory, output_path, categories=None, backend=None, mode=None,
+                          concurrency=None, convert_workers=None, resume=True, progress=None, user_id=None):
+    """
+    Transcribe and classify every audio file under `directory`, appending
+    one JSON line per file to `output_path` as it finishes (not in input
+    order). With resume, files that already succeeded in output_path are
+    skipped. Items of successful files are also recorded in the expense
+    store under user_id. Returns the BatchProgress summary dict.
+    """
+    categories = split_categories(categories or []) or ["going out", "house expense", "groceries"]
+    backend = resolve_backend(backend)
+    files = find_audio_files(directory)
+    done = load_checkpoint(output_path) if resume else set()
+    pending = [path for path in files if path not in done]
+    progress = progress or BatchProgress()
+    progress.total, progress.skipped = len(files), len(files) - len(pending)
+    logger.info(f"Batch {directory}: {len(files)} files, {progress.skipped} already done, {len(pending)} to process")
+
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+    limit = asyncio.Semaphore(concurrency or BATCH_AUDIO_CONCURRENCY)
+    # Same start method as the local transcription workers: no fork of a threaded server
+    method = local_stt.LOCAL_STT_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"
+    pool = ProcessPoolExecutor(
+        max_workers=convert_workers or BATCH_AUDIO_CONVERT_WORKERS,
+        mp_context=multiprocessing.get_context(method),
+    )
+
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out:
+        async def one(path):
+            try:
+                record = await _process_file(directory, path, pool, categories, backend, mode)
+            finally:
+                limit.release()
+            # Written and flushed per file: a crash loses at most the files in flight
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            if record["status"] == "success":
+                record_items(record["classified_items"], user_id, "speech_batch")
+                progress.succeeded += 1
+            else:
+                progress.failed += 1
+            if progress.processed % PROGRESS_EVERY == 0:
+                logger.info(f"Batch progress: {progress.processed}/{len(pending)} "
+                            f"({progress.files_per_second():.2f} files/s)")
+
+        tasks = []
+        try:
+            for path in pending:
+                # Acquired here so only `concurrency` files are converted and held in memory at once
+                await limit.acquire()
+                tasks.append(asyncio.create_task(one(path)))
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+            progress.finished = time.perf_counter()
+
+    summary = progress.as_dict()
+    logger.info(f"Batch finished: {summary}")
+    return summary
+
+
+def run_batch(directory, output_path, **options):
+    """Sync wrapper around run_batch_async() for the CLI, holding the output lock for the run."""
+    lock = lock_output(output_path)
+    try:
+        return engine.run_sync(run_batch_async(directory, output_path, **options))
+    finally:
+        lock.close()
+
+
+class BatchJob:
+    """
+    A batch run started from the API, executed on its own thread of the
+    server process that received it. Its progress is stored in the job
+    database so the status endpoint works from every server process.
+    """
+
+    def __init__(self, directory, output_path, lock, **options):
+        self.id = uuid.uuid4().hex
+        self.directory = directory
+        self.output_path = output_path
+        self.progress = BatchProgress()
+        self.status = "running"
+        self.error = None
+        self._lock = lock
+        self._options = options
+        self._done = threading.Event()
+        # A fresh thread also starts with an empty context: no request deadline or timings leak in
+        self._thread = threading.Thread(target=self._run, name=f"batch-{self.id[:8]}", daemon=True)
+
+    def start(self):
+        self.save()
+        self._thread.start()
+        if get_job_store() is not None:
+            threading.Thread(target=self._report, name=f"batch-{self.id[:8]}-progress", daemon=True).start()
+        return self
+
+    def save(self):
+        job_store = get_job_store()
+        if job_store is None:
+            return
+        try:
+            job_store.save_batch(self.as_dict())
+        except sqlite3.Error as e:
+            logger.warning(f"Could not store progress of batch job {self.id}: {e}")
+
+    def _report(self):
+        while not self._done.wait(PROGRESS_SAVE_SECONDS):
+            self.save()
+
+    def _run(self):
+        try:
+            engine.run_sync(run_batch_async(self.directory, self.output_path, progress=self.progress, **self._options))
+            self.status = "finished"
+        except Exception as e:
+            logger.exception(f"Batch job {self.id} failed")
+            self.error = f"{type(e).__name__}: {e}"
+            self.status = "failed"
+        finally:
+            # Final state first, so a job started once the lock is free never sees this one running
+            self.save()
+            self._lock.close()
+            self._done.set()
+
+    def as_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "directory": self.directory,
+            "output": self.output_path,
+            "error": self.error,
+            **self.progress.as_dict(),
+        }
+
+
+# Jobs started by this process; the others are read from the job database
+_jobs = {}
+
+
+def resolve_import_directory(directory):
+    """Absolute path of `directory` inside BATCH_AUDIO_ROOT; ValueError when outside or missing."""
+    path = os.path.realpath(os.path.join(BATCH_AUDIO_ROOT, directory or ""))
+    if os.path.commonpath([path, os.path.realpath(BATCH_AUDIO_ROOT)]) != os.path.realpath(BATCH_AUDIO_ROOT):
+        raise ValueError("Directory must be inside BATCH_AUDIO_ROOT")
+    if not os.path.isdir(path):
+        raise ValueError(f"Directory not found: {directory}")
+    return path
+
+
+def start_job(directory, **options):
+    """
+    Start a background batch for a directory under BATCH_AUDIO_ROOT. The
+    output name is derived from the directory, so starting it again resumes.
+    Raises ValueError for a bad directory and RuntimeError when a run for
+    the same directory is still going, in this or any other process.
+    """
+    path = resolve_import_directory(directory)
+    name = os.path.relpath(path, os.path.realpath(BATCH_AUDIO_ROOT)).replace(os.sep, "__")
+    output_path = os.path.join(BATCH_AUDIO_OUTPUT_DIR, ("root" if name == "." else name) + ".jsonl")
+    try:
+        lock = lock_output(output_path)
+    except RuntimeError:
+        job_store = get_job_store()
+        running = job_store.running_batch(output_path) if job_store is not None else None
+        if running:
+            raise RuntimeError(f"Batch job {running} is already running for this directory") from None
+        raise
+    job = BatchJob(path, output_path, lock, **options)
+    _jobs[job.id] = job
+    return job.start()
+
+
+def get_job(job_id):
+    """Status dict of a batch job started by any server process; None when unknown."""
+    job = _jobs.get(job_id)
+    if job is not None:
+        return job.as_dict()
+    job_store = get_job_store()
+    state = job_store.get_batch(job_id) if job_store is not None else None
+    if state is not None and state["status"] == "running" and not output_locked(state["output"]):
+        # The process running it died before it could store the outcome
+        state.update(status="failed", error="Interrupted: the server process running it stopped")
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--output", default="batch_transcriptions.jsonl")
+    parser.add_argument("--categories", nargs="+", default=None)
+    parser.add_argument("--backend", default=None, help="elevenlabs or local (default TRANSCRIPTION_BACKEND)")
+    parser.add_argument("--mode", default=None, help="two_step or fused (default PIPELINE_MODE)")
+    parser.add_argument("--concurrency", type=int, default=BATCH_AUDIO_CONCURRENCY)
+    parser.add_argument("--convert-workers", type=int, default=BATCH_AUDIO_CONVERT_WORKERS)
+    parser.add_argument("--no-resume", action="store_true", help="start over instead of skipping finished files")
+    parser.add_argument("--user-id", default=None, help="user the items are recorded under in the expense store")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error(f"not a directory: {args.directory}")
+    try:
+        summary = run_batch(
+            args.directory, args.output, categories=args.categories, backend=args.backend, mode=args.mode,
+            concurrency=args.concurrency, convert_workers=args.convert_workers, resume=not args.no_resume,
+            user_id=args.user_id,
+        )
+    except RuntimeError as e:
+        parser.error(str(e))
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Audio preprocessing savings on synthetic voice notes: 44.1 kHz stereo WAV
+with leading/trailing silence around a speech-like signal. Reports bytes
+and seconds saved, the processing time, and the time to upload the
+original versus the processed file over a simulated uplink.
+
+    python benchmarks/bench_audio_preprocess.py --durations 5 30 180 --silence 3 --uplink-mbps 2
+"""
+import argparse
+import io
+import math
+import os
+import random
+import struct
+import sys
+import time
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import audio_preprocess  # noqa: E402
+
+RATE = 44100
+
+
+def voice_note(speech_seconds, silence_seconds, seed=0):
+    """Stereo 16-bit WAV: low noise, then syllable-like tone bursts, then low noise."""
+    rng = random.Random(seed)
+    frames = bytearray()
+
+    def noise(seconds):
+        for _ in range(int(seconds * RATE)):
+            sample = rng.randint(-40, 40)
+            frames.extend(struct.pack("<hh", sample, sample))
+
+    noise(silence_seconds)
+    for i in range(int(speech_seconds * RATE)):
+        syllable = 0.5 + 0.5 * math.sin(2 * math.pi * 4 * i / RATE)  # ~4 syllables per second
+        sample = int(8000 * syllable * math.sin(2 * math.pi * 180 * i / RATE)) + rng.randint(-200, 200)
+        frames.extend(struct.pack("<hh", sample, sample))
+    noise(silence_seconds)
+
+    out = io.BytesIO()
+    with wave.open(out, "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(bytes(frames))
+    return out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--durations", type=float, nargs="+", default=[5, 30, 180], help="speech seconds")
+    parser.add_argument("--silence", type=float, default=3.0, help="silence seconds on each side")
+    parser.add_argument("--uplink-mbps", type=float, default=2.0)
+    parser.add_argument("--format", default="wav", choices=sorted(audio_preprocess.FORMATS))
+    args = parser.parse_args()
+
+    bytes_per_second = args.uplink_mbps * 1e6 / 8
+    print(f"{'speech s':>8} {'in KB':>9} {'out KB':>9} {'in s':>7} {'out s':>7} {'prep ms':>8} "
+          f"{'upload in s':>11} {'upload out s':>12}")
+    for seconds in args.durations:
+        data = voice_note(seconds, args.silence)
+        start = time.perf_counter()
+        processed, report = audio_preprocess.preprocess(data, "note.wav", fmt=args.format)
+        elapsed = (time.perf_counter() - start) * 1000
+        out_bytes = len(processed[0]) if processed else len(data)
+        print(
+            f"{seconds:>8.0f} {len(data) / 1024:>9.0f} {out_bytes / 1024:>9.0f} "
+            f"{report['seconds_in']:>7.1f} {report['seconds_out']:>7.1f} {elapsed:>8.1f} "
+            f"{len(data) / bytes_per_second:>11.2f} {out_bytes / bytes_per_second:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
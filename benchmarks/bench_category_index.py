@@ -0,0 +1,56 @@
+"""
+Category validation cost per classified item: the original linear
+substring scan versus the cached CategoryIndex, for growing category lists.
+
+    python benchmarks/bench_category_index.py --sizes 3 100 500 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from category_index import get_index  # noqa: E402
+
+
+def linear_scan(category, categories):
+    """The loop clean_classification() used before the index."""
+    for valid_category in categories:
+        if (category.lower() == valid_category.lower() or
+                category.lower() in valid_category.lower() or
+                valid_category.lower() in category.lower()):
+            return valid_category
+    return categories[0]
+
+
+def per_item_us(func, names, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name in names:
+            func(name)
+    return (time.perf_counter() - start) / (repeat * len(names)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 100, 500, 2000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'categories':>10} {'linear us/item':>15} {'index us/item':>14} {'index build ms':>15}")
+    for size in args.sizes:
+        categories = [f"tenant category {i}" for i in range(size - 1)] + ["groceries"]
+        # Typical model answers: exact, different case, partial, unknown
+        names = ["groceries", "Groceries", f"tenant category {size // 2}", "category", "transport"]
+        start = time.perf_counter()
+        index = get_index(categories)
+        build_ms = (time.perf_counter() - start) * 1000
+        linear = per_item_us(lambda name: linear_scan(name, categories), names, args.repeat)
+        indexed = per_item_us(index.resolve, names, args.repeat)
+        print(f"{size:>10} {linear:>15.2f} {indexed:>14.2f} {build_ms:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
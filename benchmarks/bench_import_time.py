@@ -0,0 +1,147 @@
+"""
+Cold-start import profile of the app from `python -X importtime`: total
+import time of a module (endpoints by default) in fresh interpreters, the
+slowest direct imports and the modules with the most self time. Fails when
+one of the SDKs that must stay lazy shows up, when the median exceeds
+--max-ms, or when it regressed against a --baseline file.
+
+    python benchmarks/bench_import_time.py --runs 5 --output import-time.json
+    python benchmarks/bench_import_time.py --baseline import-time.json --tolerance 0.2
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first use only; importing any of them at startup is a regression
+LAZY_MODULES = ["google.generativeai", "elevenlabs", "requests"]
+
+LINE_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] in the order -X importtime prints them."""
+    entries = []
+    for line in stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            entries.append((module, int(own), int(cumulative), len(indent) // 2))
+    return entries
+
+
+def subtree(entries, module):
+    """The entries `import module` itself loaded (children print before their parent), ending with it."""
+    start = 0
+    for index, (name, _, _, depth) in enumerate(entries):
+        if depth == 0:
+            if name == module:
+                return entries[start:index + 1]
+            start = index + 1
+    raise ValueError(f"{module} not found in the importtime output")
+
+
+def profile_once(module, env):
+    """(wall seconds, entries of its subtree) for one fresh interpreter importing `module`."""
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - started
+    if result.returncode:
+        raise SystemExit(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return wall, subtree(parse_importtime(result.stderr), module)
+
+
+def summarize(module, runs, top):
+    """Medians across runs of the module's total, the process wall time and the heaviest imports."""
+    totals, walls, direct, own = [], [], {}, {}
+    for wall, entries in runs:
+        walls.append(wall)
+        totals.append(entries[-1][2])
+        for name, self_us, cumulative, depth in entries:
+            own.setdefault(name, []).append(self_us)
+            if depth == 1:
+                direct.setdefault(name, []).append(cumulative)
+    loaded = {name for _, entries in runs for name, *_ in entries}
+
+    def ranked(values):
+        medians = {name: statistics.median(samples) for name, samples in values.items()}
+        return [{"module": name, "ms": round(us / 1000, 1)}
+                for name, us in sorted(medians.items(), key=lambda item: -item[1])[:top]]
+
+    return {
+        "module": module,
+        "runs": len(runs),
+        "import_ms": round(statistics.median(totals) / 1000, 1),
+        "process_ms": round(statistics.median(walls) * 1000, 1),
+        "modules_loaded": len(loaded),
+        "slowest_direct_imports": ranked(direct),
+        "most_self_time": ranked(own),
+        "lazy_modules_loaded": sorted(
+            lazy for lazy in LAZY_MODULES if any(name == lazy or name.startswith(lazy + ".") for name in loaded)
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="endpoints")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=None, help="fail when the median import takes longer")
+    parser.add_argument("--output", default=None, help="write the summary as JSON")
+    parser.add_argument("--baseline", default=None, help="earlier --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before flagging")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Imports open the log file, the expense and the job database; keep them out of the tree
+        env = dict(
+            os.environ,
+            LOG_FILE=os.path.join(tmp, "app.log"), LOG_STDERR="false",
+            EXPENSE_DB_PATH=os.path.join(tmp, "expenses.db"),
+            JOBS_DB_PATH=os.path.join(tmp, "jobs.db"), JOBS_SPOOL_DIR=os.path.join(tmp, "job_spool"),
+        )
+        profile_once(args.module, env)  # compiles the bytecode caches, as on a deployed box
+        runs = [profile_once(args.module, env) for _ in range(args.runs)]
+    summary = summarize(args.module, runs, args.top)
+
+    print(f"import {summary['module']}: {summary['import_ms']} ms (median of {summary['runs']}), "
+          f"process {summary['process_ms']} ms, {summary['modules_loaded']} modules")
+    print("\nslowest direct imports (cumulative ms)")
+    for entry in summary["slowest_direct_imports"]:
+        print(f"  {entry['ms']:>8.1f}  {entry['module']}")
+    print("\nmost self time (ms)")
+    for entry in summary["most_self_time"]:
+        print(f"  {entry['ms']:>8.1f}  {entry['module']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nSaved {args.output}")
+
+    problems = [f"{name} is imported at startup" for name in summary["lazy_modules_loaded"]]
+    if args.max_ms is not None and summary["import_ms"] > args.max_ms:
+        problems.append(f"import took {summary['import_ms']} ms, budget {args.max_ms} ms")
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            before = json.load(f)["import_ms"]
+        if summary["import_ms"] > before * (1 + args.tolerance):
+            problems.append(f"import {before} -> {summary['import_ms']} ms (tolerance {args.tolerance:.0%})")
+    for problem in problems:
+        print(f"REGRESSION {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Accuracy of detect_language() on the labelled expense corpus, plus raw
+throughput. Every "en" result is a translation call the pipeline skips.
+
+    python benchmarks/bench_language_detect.py --iterations 200
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from language_detect import detect_language  # noqa: E402
+
+CORPUS = os.path.join(ROOT, "benchmarks", "data", "language_corpus.tsv")
+
+
+def load_corpus(path):
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, text = line.rstrip("\n").split("\t", 1)
+            samples.append((label, text))
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--corpus", default=CORPUS)
+    parser.add_argument("--iterations", type=int, default=200, help="passes over the corpus for throughput")
+    parser.add_argument("--verbose", action="store_true", help="print every misclassified sample")
+    args = parser.parse_args()
+
+    samples = load_corpus(args.corpus)
+    labels = sorted({label for label, _ in samples})
+    confusion = {(expected, got): 0 for expected in labels for got in labels}
+    for expected, text in samples:
+        got = detect_language(text)
+        confusion[(expected, got)] = confusion.get((expected, got), 0) + 1
+        if got != expected and args.verbose:
+            print(f"  expected {expected:<7} got {got:<7} {text}")
+
+    correct = sum(confusion[(label, label)] for label in labels)
+    # The costly mistake is sending Romanian text straight to classification
+    wrong_skip = sum(confusion.get((label, "en"), 0) for label in labels if label != "en")
+    print(f"samples: {len(samples)}  accuracy: {correct / len(samples):.1%}  wrongly skipped: {wrong_skip}")
+    print(f"{'expected':>10} " + " ".join(f"{label:>8}" for label in labels))
+    for expected in labels:
+        print(f"{expected:>10} " + " ".join(f"{confusion[(expected, got)]:>8}" for got in labels))
+
+    texts = [text for _, text in samples]
+    start = time.perf_counter()
+    for _ in range(args.iterations):
+        for text in texts:
+            detect_language(text)
+    elapsed = time.perf_counter() - start
+    calls = args.iterations * len(texts)
+    print(f"throughput: {calls / elapsed:,.0f} detections/s ({elapsed / calls * 1e6:.1f} us per call)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Load test of the HTTP API against fake Gemini and ElevenLabs upstreams:
+/classify-expense, /classify-expense/batch and /speech-to-text at fixed
+concurrency levels, reporting p50/p95/p99 latency and requests/s. Results
+are saved as JSON; pass an earlier file as --baseline to flag regressions.
+
+    python benchmarks/bench_load.py --concurrency 1 8 32 --requests 200 \\
+        --gemini-latency lognormal:600,0.5 --stt-latency lognormal:800,0.4 --failure-rate 0.01
+
+The app is started in a child process with the fake Gemini model installed
+and ELEVENLABS_BASE_URL pointing at the fake speech server; every request
+carries a different amount so neither the cache nor call coalescing hides
+the upstream latency, and the local fast path is off unless --fast-path is
+given. --url targets a server that is already running (with
+its own upstream setup) instead.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+sys.path.insert(0, ROOT)
+
+from fake_upstreams import FakeElevenLabsServer, TRANSCRIPTS  # noqa: E402
+from bench_audio_preprocess import voice_note  # noqa: E402
+
+CATEGORIES = ["going out", "house expense", "groceries"]
+
+
+def _text(rng):
+    return rng.choice(TRANSCRIPTS).format(amount=rng.randint(5, 100000))
+
+
+def classify_request(rng, audio):
+    return {"method": "POST", "path": "/classify-expense", "json": {"text": _text(rng), "categories": CATEGORIES}}
+
+
+def batch_request(rng, audio, size=10):
+    records = [{"text": _text(rng), "categories": CATEGORIES} for _ in range(size)]
+    return {"method": "POST", "path": "/classify-expense/batch", "json": {"records": records}}
+
+
+def speech_request(rng, audio):
+    return {
+        "method": "POST", "path": "/speech-to-text",
+        "files": {"audio": ("note.wav", io.BytesIO(audio), "audio/wav")},
+        "data": {"categories": ",".join(CATEGORIES)},
+    }
+
+
+SCENARIOS = {
+    "classify": classify_request,
+    "classify_batch": batch_request,
+    "speech": speech_request,
+}
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def run_level(base_url, scenario, concurrency, total, warmup, audio, seed=0):
+    """Send `total` requests with exactly `concurrency` in flight; returns the summary dict."""
+    build = SCENARIOS[scenario]
+    counter = iter(range(warmup + total))
+    counter_lock = threading.Lock()
+    latencies, statuses = [], {}
+    results_lock = threading.Lock()
+
+    def worker(number):
+        client = requests.Session()
+        # Distinct per scenario, level and worker so no two requests of a run repeat a text
+        rng = random.Random(f"{seed}-{scenario}-{concurrency}-{number}")
+        while True:
+            with counter_lock:
+                index = next(counter, None)
+            if index is None:
+                return
+            spec = build(rng, audio)
+            started = time.perf_counter()
+            try:
+                response = client.request(spec.pop("method"), base_url + spec.pop("path"), timeout=120, **spec)
+                status = response.status_code
+            except requests.RequestException as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if index < warmup:
+                continue
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    # Warm-up requests share the run but are left out of the numbers
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, number) for number in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    ok = sum(count for status, count in statuses.items() if status.startswith("2"))
+    ms = lambda value: round(value * 1000, 1) if value is not None else None  # noqa: E731
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "ok": ok,
+        "error_rate": round(1 - ok / len(latencies), 4) if latencies else None,
+        "statuses": statuses,
+        # Throughput counts the warm-up too, since it ran inside the same wall time
+        "rps": round((warmup + total) / wall, 2),
+        "p50_ms": ms(percentile(latencies, 0.50)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "max_ms": ms(latencies[-1] if latencies else None),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing results worse than the baseline by more than `tolerance` (a fraction)."""
+    previous = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        before = previous.get((result["scenario"], result["concurrency"]))
+        if before is None:
+            continue
+        name = f"{result['scenario']} @ {result['concurrency']}"
+        if before["p95_ms"] and result["p95_ms"] and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {result['p95_ms']} ms")
+        if before["rps"] and result["rps"] < before["rps"] * (1 - tolerance):
+            regressions.append(f"{name}: {before['rps']} -> {result['rps']} req/s")
+        if (result["error_rate"] or 0) > (before["error_rate"] or 0) + tolerance / 10:
+            regressions.append(f"{name}: error rate {before['error_rate']} -> {result['error_rate']}")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve(port, gemini_latency, failure_rate):
+    """Child process: the app with the fake Gemini model, on a threaded WSGI server."""
+    from fake_upstreams import install_fake_gemini
+    install_fake_gemini(gemini_latency, failure_rate)
+    from werkzeug.serving import make_server
+    import endpoints
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    make_server("127.0.0.1", port, endpoints.app, threaded=True).serve_forever()
+
+
+def start_app(args, tmp, stt_url):
+    port = free_port()
+    env = dict(
+        os.environ,
+        GEMINI_API_KEY="fake", GOOGLE_API_KEY="fake", ELEVENLABS_API_KEY="fake", ELEVENLABS_BASE_URL=stt_url,
+        LOG_FILE=os.path.join(tmp, "app.log"), LOG_STDERR="false",
+        EXPENSE_DB_PATH=os.path.join(tmp, "expenses.db"), BATCH_AUDIO_OUTPUT_DIR=os.path.join(tmp, "batch"),
+        FAST_PATH_ENABLED="true" if args.fast_path else "false",
+    )
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port),
+         "--gemini-latency", args.gemini_latency, "--failure-rate", str(args.failure_rate)],
+        env=env, cwd=tmp,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"App server exited with code {process.returncode}")
+        try:
+            requests.get(base_url + "/", timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise SystemExit("App server did not start within 60s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=200, help="measured requests per scenario and level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--gemini-latency", default="lognormal:600,0.5")
+    parser.add_argument("--stt-latency", default="lognormal:800,0.4")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of fake upstream calls that fail")
+    parser.add_argument("--fast-path", action="store_true", help="let the local fast path answer what it can")
+    parser.add_argument("--audio-seconds", type=float, default=5.0)
+    parser.add_argument("--url", default=None, help="load an already running server instead of starting one")
+    parser.add_argument("--output", default=None, help=f"results file (default {RESULTS_DIR}/load-<time>.json)")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown before flagging")
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve is not None:
+        serve(args.serve, args.gemini_latency, args.failure_rate)
+        return
+
+    audio = voice_note(args.audio_seconds, 0.5)
+    stt = process = None
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            base_url = args.url
+            if base_url is None:
+                stt = FakeElevenLabsServer(args.stt_latency, args.failure_rate).start()
+                process, base_url = start_app(args, tmp, stt.base_url)
+
+            results = []
+            print(f"{'scenario':<15} {'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    result = run_level(base_url, scenario, concurrency, args.requests, args.warmup, audio)
+                    results.append(result)
+                    print(f"{scenario:<15} {concurrency:>5} {result['rps']:>8.1f} {result['p50_ms']:>8} "
+                          f"{result['p95_ms']:>8} {result['p99_ms']:>8} {result['requests'] - result['ok']:>7}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+            if stt is not None:
+                stt.stop()
+
+    report = {
+        "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "settings": {key: value for key, value in vars(args).items() if key not in ("serve", "output", "baseline")},
+        "results": results,
+    }
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"load-{datetime.datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+log_analytics.py throughput on a synthetic app.log: classify, fused, fast
+path, speech and failing requests in the current loguru text format, with
+multi-line raw model responses and tracebacks. Reports MB/s and records/s
+per worker count and checks every run yields the same records.
+
+    python benchmarks/bench_log_analytics.py --size-mb 1024 --workers 1 4 8
+"""
+import argparse
+import datetime
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import log_analytics  # noqa: E402
+
+CATEGORIES = ["going out", "house expense", "groceries"]
+ITEMS = [("cinema tickets", "going out"), ("bread and milk", "groceries"), ("electricity bill", "house expense"),
+         ("pizza with friends", "going out"), ("detergent", "house expense"), ("vegetables", "groceries")]
+
+
+def _line(when, level, location, message):
+    return f"{when:%Y-%m-%d %H:%M:%S}.{when.microsecond // 1000:03d} | {level:<8} | {location} - {message}\n"
+
+
+def _request(rng, when):
+    """Log lines of one request and the time after it."""
+    amount = rng.randint(5, 900)
+    item, category = rng.choice(ITEMS)
+    text = f"Ieri am dat {amount} de lei pe {item}"
+    translated = f"Yesterday I spent {amount} lei on {item}"
+    items = [{"category": category, "item": item, "amount": float(amount)}]
+    raw = "```json\n[\n  {\n" + f'    "category": "{category}",\n    "item": "{item}",\n    "amount": {amount}\n' + "  }\n]\n```"
+    step = datetime.timedelta(milliseconds=rng.randint(5, 400))
+    lines = []
+
+    def log(level, location, message):
+        nonlocal when
+        lines.append(_line(when, level, location, message))
+        when += step
+
+    kind = rng.random()
+    if kind < 0.15:
+        log("INFO", "fast_path:classify:229", f"Fast path resolved {text!r} with confidence 0.93: {items}")
+    elif kind < 0.35:
+        log("INFO", "endpoints:speech_to_text:145", f"Processing audio file: note_{rng.randint(1, 99999)}.m4a")
+        log("INFO", "endpoints:speech_to_text:146", f"File size: {rng.randint(20000, 900000)}")
+        log("INFO", "endpoints:speech_to_text:147", "Content type: audio/mp4")
+        log("INFO", "transcription:_transcribe_elevenlabs:90", "Attempting ElevenLabs SDK transcription...")
+        log("INFO", "transcription:_transcribe_elevenlabs:95", f"SDK transcription successful: {text}")
+        log("INFO", "endpoints:speech_to_text:188", f"Final transcript (length: {len(text)}): {text}")
+        log("INFO", "endpoints:speech_to_text:197", "Starting translation...")
+    if kind >= 0.15:
+        mode = "fused" if rng.random() < 0.3 else "two_step"
+        log("INFO", "translate_and_classify:run_pipeline_async:385", f"Running {mode} pipeline")
+        if kind > 0.95:
+            log("ERROR", "translate_and_classify:translate_text_async:157", "Error in translate_text\n"
+                "Traceback (most recent call last):\n\n"
+                '  File "translate_and_classify.py", line 152, in translate_text_async\n'
+                "    response = await model.generate_content_async(prompt)\n\n"
+                "google.api_core.exceptions.ServiceUnavailable: 503 The model is overloaded.")
+            log("INFO", "translate_and_classify:classify_expense_async:262", f"Exception fallback result: {items}")
+        elif mode == "fused":
+            log("DEBUG", "translate_and_classify:translate_and_classify_async:320",
+                "Initializing fused translation and classification model...")
+            log("INFO", "translate_and_classify:translate_and_classify_async:325", f"Raw fused model response: {raw}")
+            log("INFO", "translate_and_classify:_clean_results:86", f"Final cleaned results: {items}")
+        else:
+            log("DEBUG", "translate_and_classify:translate_text_async:150", "Initializing translation model...")
+            log("INFO", "translate_and_classify:translate_text_async:154",
+                f'Translation response received: - Translation: "{translated}"\n- Notes: informal Romanian')
+            log("INFO", "translate_and_classify:classify_expense_async:225",
+                f"Processing text for classification: {translated}")
+            log("INFO", "translate_and_classify:classify_expense_async:236", f"Raw model response: {raw}")
+            log("DEBUG", "translate_and_classify:classify_expense_async:241", f"Parsed JSON successfully: {items}")
+            log("INFO", "translate_and_classify:_clean_results:86", f"Final cleaned results: {items}")
+    if 0.15 <= kind < 0.35:
+        log("INFO", "endpoints:speech_to_text:199",
+            f"Translation result: {{'translated_text': {translated!r}, 'status': 'success'}}")
+        log("INFO", "endpoints:speech_to_text:212", f"Classification result: {items}")
+    return "".join(lines), when
+
+
+def write_log(path, size_bytes, seed=0):
+    """Append synthetic requests to `path` until it holds size_bytes; returns the request count."""
+    rng = random.Random(seed)
+    when = datetime.datetime(2025, 1, 1, 8, 0, 0)
+    written, requests = 0, 0
+    with open(path, "w", encoding="utf-8") as out:
+        out.write(_line(when, "INFO", "endpoints:<module>:100", "Starting Flask server on port 5050"))
+        buffer = []
+        while written < size_bytes:
+            block, when = _request(rng, when)
+            buffer.append(block)
+            written += len(block)
+            requests += 1
+            if len(buffer) >= 1000:
+                out.write("".join(buffer))
+                buffer = []
+        out.write("".join(buffer))
+    return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=1024)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    parser.add_argument("--chunk-mb", type=int, default=log_analytics.CHUNK_BYTES // 1024 // 1024)
+    parser.add_argument("--format", choices=sorted(log_analytics.WRITERS), default="jsonl")
+    parser.add_argument("--log", default=None, help="reuse or keep the synthetic log at this path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = args.log or os.path.join(tmp, "app.log")
+        if not os.path.exists(log_path):
+            start = time.perf_counter()
+            requests = write_log(log_path, args.size_mb * 1024 * 1024)
+            print(f"Generated {os.path.getsize(log_path) / 1024 / 1024:.0f} MB, {requests} requests "
+                  f"in {time.perf_counter() - start:.1f}s")
+
+        print(f"{'workers':>7} {'seconds':>8} {'MB/s':>8} {'records':>9} {'records/s':>10}  output sha256")
+        for workers in args.workers:
+            output = os.path.join(tmp, f"records.{args.format}")
+            summary = log_analytics.run([log_path], output, args.format, workers, args.chunk_mb * 1024 * 1024)
+            digest = hashlib.sha256()
+            with open(output, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+            digest = digest.hexdigest()
+            print(f"{workers:>7} {summary['seconds']:>8.2f} {summary['mb_per_second']:>8.1f} "
+                  f"{summary['records']:>9} {summary['records'] / summary['seconds']:>10.0f}  {digest[:16]}")
+
+
+if __name__ == "__main__":
+    main()
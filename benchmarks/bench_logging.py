@@ -0,0 +1,115 @@
+"""
+/classify-expense requests per second under different logging setups, with
+Gemini replaced by an instant in-process fake that returns realistically
+sized (kilobyte) responses. Each setup runs in a fresh process writing to
+its own temp log file.
+
+    python benchmarks/bench_logging.py --requests 2000 --threads 8
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUPS = {
+    "off": {"LOG_ENABLED": "false"},
+    "legacy (sync, diagnose, full payloads)": {
+        "LOG_ENQUEUE": "false", "LOG_DIAGNOSE": "true", "LOG_PAYLOAD_MAX_CHARS": "0",
+    },
+    "sync + truncation": {"LOG_ENQUEUE": "false"},
+    "background writer + truncation": {},
+    "background + INFO + 10% payload sampling": {"LOG_LEVEL": "INFO", "LOG_PAYLOAD_SAMPLE_RATE": "0.1"},
+    "background + WARNING": {"LOG_LEVEL": "WARNING"},
+    "background + JSON": {"LOG_JSON": "true"},
+}
+
+TRANSLATION = "- Translation: \"Yesterday I spent 120 lei at the cinema with friends\"\n" + "Notes: " + "x" * 2000
+CLASSIFICATION = json.dumps(
+    [{"category": "going out", "item": f"cinema ticket {i} " + "y" * 40, "amount": 10 + i} for i in range(20)]
+)
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    def __init__(self, model_name=None, generation_config=None, **kwargs):
+        self.generation_config = generation_config
+
+    def _answer(self, prompt):
+        return FakeResponse(CLASSIFICATION if "Expense description" in prompt else TRANSLATION)
+
+    def generate_content(self, prompt, **kwargs):
+        return self._answer(prompt)
+
+    async def generate_content_async(self, prompt, **kwargs):
+        return self._answer(prompt)
+
+
+def run_child(total, threads):
+    sys.path.insert(0, ROOT)
+    import google.generativeai as genai
+    genai.GenerativeModel = FakeModel
+    import endpoints
+
+    body = {"text": "Ieri am dat 120 de lei pe bilete la cinema cu prietenii", "categories": ["going out", "groceries"]}
+    per_thread = total // threads
+    errors = []
+
+    def worker():
+        client = endpoints.app.test_client()
+        for _ in range(per_thread):
+            if client.post("/classify-expense", json=body).status_code != 200:
+                errors.append(1)
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    from loguru import logger
+    logger.complete()
+    print(json.dumps({"rps": per_thread * threads / elapsed, "errors": len(errors)}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.requests, args.threads)
+        return
+
+    print(f"{'setup':<42} {'req/s':>10} {'log size':>10}")
+    for name, overrides in SETUPS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            log_file = os.path.join(tmp, "app.log")
+            env = dict(
+                os.environ, LOG_FILE=log_file, LOG_STDERR="false", CACHE_ENABLED="false",
+                FAST_PATH_ENABLED="false", GOOGLE_API_KEY="bench", **overrides,
+            )
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child",
+                 "--requests", str(args.requests), "--threads", str(args.threads)],
+                env=env, capture_output=True, text=True, cwd=tmp, check=True,
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            size = os.path.getsize(log_file) / 1024 / 1024 if os.path.exists(log_file) else 0.0
+            print(f"{name:<42} {result['rps']:>10.0f} {size:>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
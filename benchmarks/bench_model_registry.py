@@ -0,0 +1,51 @@
+"""
+Per-call overhead of building a GenerativeModel on every request versus
+reusing the shared instance from model_registry. No network calls are made.
+
+    python benchmarks/bench_model_registry.py --iterations 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import google.generativeai as genai  # noqa: E402
+import model_registry  # noqa: E402
+from translate_and_classify import FUSED_GENERATION_CONFIG  # noqa: E402
+
+
+def per_call_us(func, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--model", default=os.getenv("LLM_MODEL_NAME") or "models/gemini-2.5-flash")
+    args = parser.parse_args()
+
+    model_registry.configure(api_key=os.getenv("GEMINI_API_KEY") or "benchmark-key")
+
+    cases = [
+        ("default config", None),
+        ("fused JSON config", FUSED_GENERATION_CONFIG),
+    ]
+    print(f"{'case':<20} {'per call (before)':>18} {'registry (after)':>18} {'speedup':>9}")
+    for name, config in cases:
+        before = per_call_us(
+            lambda: genai.GenerativeModel(model_name=args.model, generation_config=config),
+            args.iterations,
+        )
+        model_registry.clear()
+        model_registry.get_model(args.model, config)
+        after = per_call_us(lambda: model_registry.get_model(args.model, config), args.iterations)
+        print(f"{name:<20} {before:>15.2f} us {after:>15.2f} us {before / after:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Upstream Gemini calls and latency for bursts of identical /classify-expense
+requests, with and without single-flight coalescing. Gemini is replaced by
+an in-process fake that sleeps --latency seconds per call and counts calls;
+the result cache is off so every request would otherwise go upstream.
+
+    python benchmarks/bench_single_flight.py --burst 32 --distinct 4 --latency 0.5
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SETUPS = {
+    "no coalescing": {"SINGLE_FLIGHT_ENABLED": "false"},
+    "single-flight (per process)": {},
+}
+
+CLASSIFICATION = json.dumps([{"category": "going out", "item": "cinema tickets", "amount": 120}])
+
+
+def run_child(burst, distinct, latency):
+    sys.path.insert(0, ROOT)
+    import google.generativeai as genai
+
+    calls = []
+
+    class FakeResponse:
+        def __init__(self, text):
+            self.text = text
+
+    class SlowModel:
+        def __init__(self, model_name=None, generation_config=None, **kwargs):
+            self.generation_config = generation_config
+
+        def _answer(self, prompt):
+            calls.append(1)
+            return FakeResponse(CLASSIFICATION if "Expense description" in prompt else "- Translation: \"cinema\"")
+
+        def generate_content(self, prompt, **kwargs):
+            time.sleep(latency)
+            return self._answer(prompt)
+
+        async def generate_content_async(self, prompt, **kwargs):
+            await asyncio.sleep(latency)
+            return self._answer(prompt)
+
+    genai.GenerativeModel = SlowModel
+    import endpoints
+
+    bodies = [
+        {"text": f"Ieri am dat {100 + i} de lei pe bilete la cinema", "categories": ["going out", "groceries"]}
+        for i in range(distinct)
+    ]
+    latencies, errors = [], []
+
+    def worker(body):
+        client = endpoints.app.test_client()
+        start = time.perf_counter()
+        if client.post("/classify-expense", json=body).status_code != 200:
+            errors.append(1)
+        latencies.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=worker, args=(bodies[i % distinct],)) for i in range(burst)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print(json.dumps({
+        "calls": len(calls),
+        "elapsed": elapsed,
+        "p50": latencies[len(latencies) // 2],
+        "max": latencies[-1],
+        "errors": len(errors),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--burst", type=int, default=32, help="concurrent requests")
+    parser.add_argument("--distinct", type=int, default=4, help="distinct request bodies in the burst")
+    parser.add_argument("--latency", type=float, default=0.5, help="fake Gemini seconds per call")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.burst, args.distinct, args.latency)
+        return
+
+    print(f"{'setup':<30} {'upstream calls':>14} {'p50 s':>7} {'max s':>7} {'errors':>7}")
+    for name, overrides in SETUPS.items():
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(
+                os.environ, LOG_ENABLED="false", CACHE_ENABLED="false", FAST_PATH_ENABLED="false",
+                GOOGLE_API_KEY="bench", **overrides,
+            )
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--burst", str(args.burst),
+                 "--distinct", str(args.distinct), "--latency", str(args.latency)],
+                env=env, capture_output=True, text=True, cwd=tmp, check=True,
+            )
+            result = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{name:<30} {result['calls']:>14} {result['p50']:>7.2f} {result['max']:>7.2f} {result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Latency and accuracy of the transcription backends on a set of labelled
+recordings: ElevenLabs (network) against each installed local engine.
+The manifest is a TSV of `audio path<TAB>reference transcript` lines
+(paths relative to the manifest). Each backend runs in a fresh process, so
+the cold start includes loading the local models.
+
+    python benchmarks/bench_transcription_backends.py --manifest recordings.tsv \
+        --backends elevenlabs local:whisper_cpp local:vosk local:sphinx --concurrency 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORD_RE = re.compile(r"[\w']+", re.UNICODE)
+
+
+def load_manifest(path):
+    base = os.path.dirname(os.path.abspath(path))
+    entries = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip() and not line.startswith("#"):
+                audio, _, reference = line.rstrip("\n").partition("\t")
+                entries.append((os.path.join(base, audio), reference))
+    return entries
+
+
+def word_errors(reference, hypothesis):
+    """Word-level edit distance and reference length."""
+    ref = WORD_RE.findall(reference.casefold())
+    hyp = WORD_RE.findall(hypothesis.casefold())
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def run_child(backend, manifest, concurrency):
+    sys.path.insert(0, ROOT)
+    from audio_upload import AudioBuffer
+    from pipeline_engine import engine
+    import local_stt
+    import transcription
+
+    entries = load_manifest(manifest)
+    started = time.perf_counter()
+    if backend == "local":
+        local_stt.warm_up()
+    cold_start = time.perf_counter() - started
+
+    async def one(path):
+        audio = AudioBuffer.from_path(path)
+        start = time.perf_counter()
+        try:
+            text = await transcription.transcribe_audio_async(audio, backend)
+        except transcription.TranscriptionError as e:
+            text = None
+            print(f"{path}: {e}", file=sys.stderr)
+        finally:
+            audio.close()
+        return text, time.perf_counter() - start
+
+    async def sequential():
+        return [await one(path) for path, _ in entries]
+
+    async def concurrent():
+        limit = asyncio.Semaphore(concurrency)
+
+        async def bounded(path):
+            async with limit:
+                return await one(path)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(bounded(path) for path, _ in entries))
+        return time.perf_counter() - start
+
+    results = engine.run_sync(sequential())
+    wall = engine.run_sync(concurrent())
+    print(json.dumps({
+        "cold_start": cold_start,
+        "transcripts": [text for text, _ in results],
+        "latencies": [seconds for _, seconds in results],
+        "concurrent_wall": wall,
+    }))
+    if backend == "local":
+        local_stt.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--manifest", required=True)
+    parser.add_argument("--backends", nargs="+", default=["elevenlabs", "local:whisper_cpp", "local:vosk", "local:sphinx"])
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.manifest, args.concurrency)
+        return
+
+    entries = load_manifest(args.manifest)
+    print(f"{len(entries)} recordings, concurrency {args.concurrency}\n")
+    print(f"{'backend':<20} {'cold s':>7} {'p50 ms':>8} {'p95 ms':>8} {'files/s':>8} {'WER':>6} {'failed':>6}")
+    for target in args.backends:
+        backend, _, local_engine = target.partition(":")
+        env = dict(os.environ, LOG_STDERR="false", LOG_ENABLED="false")
+        if local_engine:
+            env["LOCAL_STT_ENGINE"] = local_engine
+        out = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", backend,
+             "--manifest", args.manifest, "--concurrency", str(args.concurrency)],
+            env=env, capture_output=True, text=True,
+        )
+        if out.returncode != 0 or not out.stdout.strip():
+            print(f"{target:<20} failed: {(out.stderr.strip().splitlines() or ['no output'])[-1]}")
+            continue
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        errors = words = failed = 0
+        for (_, reference), text in zip(entries, result["transcripts"]):
+            if text is None:
+                failed += 1
+                text = ""
+            e, n = word_errors(reference, text)
+            errors += e
+            words += n
+        latencies = [seconds * 1000 for seconds in result["latencies"]]
+        print(
+            f"{target:<20} {result['cold_start']:>7.2f} {statistics.median(latencies):>8.0f} "
+            f"{percentile(latencies, 0.95):>8.0f} {len(entries) / result['concurrent_wall']:>8.2f} "
+            f"{errors / max(words, 1):>6.1%} {failed:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
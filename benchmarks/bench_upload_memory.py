@@ -0,0 +1,118 @@
+"""
+Peak RSS per /speech-to-text upload: the legacy path (SDK upload, then
+requests `files=` re-reading the FileStorage) versus the AudioBuffer path
+(one buffered copy read with pread, streamed multipart retry).
+
+A local fake ElevenLabs server rejects every SDK upload so both paths fall
+back to the direct API call. Each measurement runs in a fresh process.
+
+    python benchmarks/bench_upload_memory.py --sizes-mb 1 10 25
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeSpeechToText(BaseHTTPRequestHandler):
+    """Drains the upload in chunks; SDK requests (and their retries) get a 400."""
+
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+        fail = not self.headers.get("User-Agent", "").startswith("python-requests")
+        body = json.dumps({"detail": "try again"} if fail else {"text": "coffee 15 lei"}).encode()
+        self.send_response(400 if fail else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_child(mode, path):
+    sys.path.insert(0, ROOT)
+    from werkzeug.datastructures import FileStorage
+
+    upload_stream = open(path, "rb")  # stands in for the spooled upload temp file
+    upload = FileStorage(stream=upload_stream, filename="note.wav", content_type="audio/wav")
+
+    if mode == "legacy":
+        import requests
+        from elevenlabs.client import ElevenLabs
+
+        client = ElevenLabs(api_key="bench", base_url=os.environ["ELEVENLABS_BASE_URL"])
+        before = peak_rss_mb()
+        try:
+            upload.seek(0)
+            client.speech_to_text.convert(file=upload, model_id="scribe_v1")
+        except Exception:
+            upload.seek(0)
+            url = f"{os.environ['ELEVENLABS_BASE_URL']}/v1/speech-to-text"
+            files = {"file": (upload.filename, upload, upload.content_type)}
+            requests.post(url, headers={"xi-api-key": "bench"}, files=files, data={"model_id": "scribe_v1"})
+    else:
+        from audio_upload import AudioBuffer
+        from transcription import transcribe_audio
+
+        before = peak_rss_mb()
+        audio = AudioBuffer.from_upload(upload)
+        transcribe_audio(audio)
+        audio.close()
+
+    print(json.dumps({"before": before, "after": peak_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes-mb", type=int, nargs="+", default=[1, 10, 25])
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(*args.child)
+        return
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeSpeechToText)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    env = dict(os.environ, ELEVENLABS_BASE_URL=f"http://127.0.0.1:{server.server_port}", ELEVENLABS_API_KEY="bench")
+
+    print(f"{'size':>7} {'legacy peak +RSS':>18} {'buffered peak +RSS':>20}")
+    for size_mb in args.sizes_mb:
+        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(size_mb):
+                f.write(chunk)
+            path = f.name
+        try:
+            deltas = {}
+            for mode in ("legacy", "buffered"):
+                out = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--child", mode, path],
+                    env=env, capture_output=True, text=True, cwd=tempfile.gettempdir(), check=True,
+                )
+                result = json.loads(out.stdout.strip().splitlines()[-1])
+                deltas[mode] = result["after"] - result["before"]
+            print(f"{size_mb:>5}MB {deltas['legacy']:>15.1f} MB {deltas['buffered']:>17.1f} MB")
+        finally:
+            os.remove(path)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
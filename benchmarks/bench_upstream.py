@@ -0,0 +1,105 @@
+"""
+Exercise the upstream client layer against a local fake HTTP server:
+pooled keep-alive vs one-off requests.post latency, success rate with
+retries against a flaky server, and fail-fast once the breaker opens.
+
+    python benchmarks/bench_upstream.py --calls 300 --failure-rate 0.2
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import requests  # noqa: E402
+import upstream  # noqa: E402
+from pipeline_engine import request_budget  # noqa: E402
+
+
+class FakeProvider(BaseHTTPRequestHandler):
+    """200 with a small JSON body, 503 for a fraction of calls, or always 503 when down."""
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+    failure_rate = 0.0
+    down = False
+
+    def do_POST(self):
+        remaining = int(self.headers.get("Content-Length") or 0)
+        while remaining > 0:
+            remaining -= len(self.rfile.read(min(remaining, 64 * 1024)))
+        fail = self.down or random.random() < self.failure_rate
+        body = b'{"detail": "unavailable"}' if fail else b'{"text": "coffee 15 lei"}'
+        self.send_response(503 if fail else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def timed(func, calls):
+    latencies, failures = [], 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception:
+            failures += 1
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies, failures
+
+
+def report(label, latencies, failures):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<34} ok {len(latencies) - failures:>5}/{len(latencies):<5} "
+          f"p50 {statistics.median(latencies):7.2f} ms  p95 {p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=300)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeProvider)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1/speech-to-text"
+    upstream.UPSTREAM_BACKOFF_BASE_SECONDS = 0.005
+
+    def one_off():
+        response = requests.post(url, data=b"x" * 1024)
+        if response.status_code != 200:
+            raise RuntimeError(response.status_code)
+
+    def pooled(retries=0):
+        upstream.request("elevenlabs", "POST", url, data=b"x" * 1024, retries=retries)
+
+    report("requests.post, no session", *timed(one_off, args.calls))
+    report("upstream.request, pooled", *timed(pooled, args.calls))
+
+    FakeProvider.failure_rate = args.failure_rate
+    upstream.breakers["elevenlabs"].failure_threshold = args.calls  # keep it closed here
+    report(f"{args.failure_rate:.0%} failures, no retries", *timed(lambda: pooled(0), args.calls))
+    report(f"{args.failure_rate:.0%} failures, 2 retries", *timed(lambda: pooled(2), args.calls))
+
+    FakeProvider.down = True
+    breaker = upstream.breakers["elevenlabs"]
+    breaker.failure_threshold = 5
+    breaker.record_success()
+    with request_budget(30):
+        report("provider down, breaker", *timed(lambda: pooled(2), args.calls))
+    print(f"breaker: {breaker.stats()}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Stand-ins for Gemini and ElevenLabs with configurable latency and failure
+rates, for load tests that must not spend real quota.
+
+FakeGenerativeModel replaces google.generativeai.GenerativeModel in the
+process under test and answers translation, classification, fused and
+batch prompts with well-formed output. FakeElevenLabsServer is a local
+HTTP server for /v1/speech-to-text; point ELEVENLABS_BASE_URL at it.
+
+Latency specs, in milliseconds:
+
+    fixed:200  uniform:100-400  normal:300,50  lognormal:300,0.5  exp:250
+
+lognormal takes the median and sigma; every draw is clipped at zero.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import ast
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+
+
+TRANSCRIPTS = [
+    "Ieri am dat {amount} de lei pe bilete la cinema cu prietenii",
+    "Azi am cumparat paine si lapte de {amount} lei",
+    "Am platit factura la lumina, {amount} de lei",
+    "Am luat pizza cu colegii si am dat {amount} lei",
+    "Detergent si saci de gunoi, {amount} lei",
+]
+
+
+def parse_latency(spec):
+    """Sampler rng -> seconds for a latency spec (see the module docstring)."""
+    kind, _, args = str(spec).strip().partition(":")
+    try:
+        values = [float(v) for v in re.split(r"[,-]", args) if v] if args else []
+        if kind == "fixed" and len(values) == 1:
+            ms = values[0]
+            return lambda rng: ms / 1000
+        if kind == "uniform" and len(values) == 2:
+            low, high = values
+            return lambda rng: rng.uniform(low, high) / 1000
+        if kind == "normal" and len(values) == 2:
+            mean, stdev = values
+            return lambda rng: max(0.0, rng.gauss(mean, stdev)) / 1000
+        if kind == "lognormal" and len(values) == 2:
+            median, sigma = values
+            return lambda rng: rng.lognormvariate(math.log(median), sigma) / 1000
+        if kind == "exp" and len(values) == 1:
+            mean = values[0]
+            return lambda rng: rng.expovariate(1 / mean) / 1000
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid latency spec '{spec}', expected e.g. fixed:200, uniform:100-400, lognormal:300,0.5")
+
+
+class Faults:
+    """Latency draws and injected failures shared by both fakes."""
+
+    def __init__(self, latency="fixed:0", failure_rate=0.0, seed=None):
+        self.sample = parse_latency(latency)
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+
+    def draw(self):
+        """(delay_seconds, fail) for one call."""
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            self.failures += fail
+            return self.sample(self._rng), fail
+
+
+class FakeUsage:
+    def __init__(self, prompt, text):
+        self.prompt_token_count = len(prompt) // 4 + 1
+        self.candidates_token_count = len(text) // 4 + 1
+        self.total_token_count = self.prompt_token_count + self.candidates_token_count
+
+
+class FakeResponse:
+    def __init__(self, prompt, text):
+        self.text = text
+        self.usage_metadata = FakeUsage(prompt, text)
+
+
+class FakeStream(FakeResponse):
+    """Async-iterable response of generate_content_async(stream=True), a few characters per chunk."""
+
+    def __init__(self, prompt, text, chunk_delay):
+        super().__init__(prompt, text)
+        self._chunk_delay = chunk_delay
+
+    async def __aiter__(self):
+        for start in range(0, len(self.text), 24):
+            await asyncio.sleep(self._chunk_delay)
+            yield FakeResponse("", self.text[start:start + 24])
+
+
+def _first_amount(text):
+    match = re.search(r"\d+(?:[.,]\d+)?", text)
+    return float(match.group(0).replace(",", ".")) if match else 0
+
+
+def _categories(prompt):
+    match = re.search(r"Available categories: (\[.*?\])", prompt)
+    try:
+        return ast.literal_eval(match.group(1)) if match else ["other"]
+    except (ValueError, SyntaxError):
+        return ["other"]
+
+
+def _quoted(prompt, label):
+    match = re.search(label + r': "(.*?)"\n', prompt, re.S)
+    return match.group(1) if match else ""
+
+
+def _items(text, categories):
+    return [{"category": categories[0] if categories else "other", "item": text[:60], "amount": _first_amount(text)}]
+
+
+def answer(prompt):
+    """Well-formed model output for each kind of prompt the app sends."""
+    if "Records:" in prompt:
+        records = [json.loads(line) for line in map(str.strip, prompt.splitlines()) if line.startswith('{"id"')]
+        return json.dumps([
+            {"id": r["id"], "translated_text": r["text"], "classified_items": _items(r["text"], r["categories"])}
+            for r in records
+        ])
+    if "Expense description:" in prompt:
+        return json.dumps(_items(_quoted(prompt, "Expense description"), _categories(prompt)))
+    text = _quoted(prompt, "Original text")
+    if "Available categories:" in prompt:
+        return json.dumps({"translated_text": text, "classified_items": _items(text, _categories(prompt))})
+    return text
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel; configure the class attribute `faults` before use."""
+
+    faults = Faults()
+
+    def __init__(self, model_name=None, generation_config=None, **kwargs):
+        self.model_name = model_name
+        self.generation_config = generation_config
+
+    def _call(self, prompt):
+        delay, fail = self.faults.draw()
+        return delay, fail, answer(prompt)
+
+    @staticmethod
+    def _error():
+        from google.api_core.exceptions import ServiceUnavailable
+        return ServiceUnavailable("Injected failure from the fake Gemini model")
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        delay, fail, text = self._call(prompt)
+        time.sleep(delay)
+        if fail:
+            raise self._error()
+        return FakeResponse(prompt, text)
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        delay, fail, text = self._call(prompt)
+        if stream:
+            # First chunk after a fraction of the latency, the rest spread over it
+            await asyncio.sleep(delay / 4)
+            if fail:
+                raise self._error()
+            return FakeStream(prompt, text, delay * 3 / 4 / max(1, len(text) // 24))
+        await asyncio.sleep(delay)
+        if fail:
+            raise self._error()
+        return FakeResponse(prompt, text)
+
+
+def install_fake_gemini(latency, failure_rate, seed=None):
+    """Replace genai.GenerativeModel in this process; call before the app is imported."""
+    import google.generativeai as genai
+    FakeGenerativeModel.faults = Faults(latency, failure_rate, seed)
+    genai.GenerativeModel = FakeGenerativeModel
+    return FakeGenerativeModel.faults
+
+
+class _SpeechHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+            size = 0
+            while True:
+                length = int(self.rfile.readline().split(b";")[0], 16)
+                if not length:
+                    self.rfile.readline()
+                    return size
+                self.rfile.read(length + 2)
+                size += length
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        return length
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/v1/speech-to-text":
+            self._read_body()
+            return self._reply(404, {"detail": "Not found"})
+        self._read_body()
+        delay, fail = self.server.faults.draw()
+        time.sleep(delay)
+        if fail:
+            return self._reply(503, {"detail": {"status": "service_unavailable", "message": "Injected failure"}})
+        text = random.choice(TRANSCRIPTS).format(amount=random.randint(5, 900))
+        self._reply(200, {
+            "language_code": "ron",
+            "language_probability": 0.98,
+            "text": text,
+            "words": [],
+        })
+
+
+class FakeElevenLabsServer(ThreadingHTTPServer):
+    """Threaded fake of ElevenLabs' speech-to-text API, started on a background thread."""
+
+    daemon_threads = True
+
+    def __init__(self, latency="fixed:0", failure_rate=0.0, host="127.0.0.1", port=0, seed=None):
+        super().__init__((host, port), _SpeechHandler)
+        self.faults = Faults(latency, failure_rate, seed)
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-elevenlabs", daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    """Run the fake ElevenLabs server in the foreground."""
+    import argparse
+    parser = argparse.ArgumentParser(description="Fake ElevenLabs speech-to-text server")
+    parser.add_argument("--port", type=int, default=int(os.getenv("FAKE_ELEVENLABS_PORT", "8765")))
+    parser.add_argument("--latency", default="lognormal:800,0.4")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeElevenLabsServer(args.latency, args.failure_rate, port=args.port)
+    print(f"Fake ElevenLabs listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+from logger import logger
+from single_flight import single_flight
+from collections import OrderedDict
+from functools import wraps
+import hashlib
+import inspect
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", str(24 * 60 * 60)))
+# Empty path disables the on-disk tier
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", "")
+
+
+def normalize_text(text):
+    """Case-fold and collapse whitespace so trivially different inputs share a key."""
+    return " ".join(str(text or "").casefold().split())
+
+
+def make_key(kind, text, categories, model_name, prompt_version):
+    """Content-addressed key for one LLM call."""
+    payload = json.dumps({
+        "kind": kind,
+        "text": normalize_text(text),
+        "categories": sorted(normalize_text(c) for c in categories or []),
+        "model": model_name or "",
+        "prompt_version": prompt_version,
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LRUTier:
+    """In-process LRU with per-entry TTL. Values are stored serialized."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """On-disk tier that survives restarts. Expired rows are dropped lazily."""
+
+    def __init__(self, path, ttl_seconds=CACHE_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        if hasattr(os, "register_at_fork"):
+            # SQLite connections must not be shared with a forked server worker
+            os.register_at_fork(after_in_child=self._connect)
+
+    def _connect(self):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < time.time():
+                with self._conn:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            return value
+
+    def set(self, key, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + self.ttl_seconds),
+            )
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM llm_cache")
+
+
+class ResultCache:
+    """Two-tier (memory, then optional disk) cache for LLM results with hit/miss counters."""
+
+    def __init__(self, memory=None, disk=None, enabled=True):
+        self.memory = memory if memory is not None else LRUTier()
+        self.disk = disk
+        self.enabled = enabled
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "bypassed": 0}
+
+    def _count(self, *names):
+        with self._stats_lock:
+            for name in names:
+                self._stats[name] += 1
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("hits", "memory_hits")
+            return json.loads(value)
+        if self.disk is not None:
+            try:
+                value = self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk cache read failed: {e}")
+                value = None
+            if value is not None:
+                self.memory.set(key, value)
+                self._count("hits", "disk_hits")
+                return json.loads(value)
+        self._count("misses")
+        return None
+
+    def set(self, key, result):
+        value = json.dumps(result, ensure_ascii=False)
+        self.memory.set(key, value)
+        if self.disk is not None:
+            try:
+                self.disk.set(key, value)
+            except sqlite3.Error as e:
+                logger.warning(f"Disk cache write failed: {e}")
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["memory_entries"] = len(self.memory)
+        stats["memory_evictions"] = self.memory.evictions
+        stats["enabled"] = self.enabled
+        stats["disk_enabled"] = self.disk is not None
+        return stats
+
+    def cached(self, kind, key_func, should_cache):
+        """
+        Decorator for fn(text, categories, ...) LLM calls.
+
+        key_func(text, categories) builds the key, should_cache(result) filters
+        out error results. Callers can pass bypass_cache=True to force a fresh
+        call; the fresh result still refreshes the cache. Async calls that miss
+        are coalesced with identical calls already in flight (single_flight).
+        """
+        def lookup(text, categories, bypass_cache):
+            key = key_func(text, categories)
+            if bypass_cache:
+                self._count("bypassed")
+                return key, None
+            result = self.get(key)
+            if result is not None:
+                logger.debug(f"Cache hit for {kind}")
+            return key, result
+
+        def store(key, result):
+            if should_cache(result):
+                self.set(key, result)
+            return result
+
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+                @wraps(func)
+                async def async_wrapper(text, categories, *args, bypass_cache=False, **kwargs):
+                    if self.enabled:
+                        key, result = lookup(text, categories, bypass_cache)
+                        if result is not None:
+                            return result
+                    else:
+                        key = key_func(text, categories)
+                    # Identical calls already in flight share one upstream request
+                    result, leader = await single_flight.do(key, lambda: func(text, categories, *args, **kwargs))
+                    return store(key, result) if leader and self.enabled else result
+                return async_wrapper
+
+            @wraps(func)
+            def wrapper(text, categories, *args, bypass_cache=False, **kwargs):
+                if not self.enabled:
+                    return func(text, categories, *args, **kwargs)
+                key, result = lookup(text, categories, bypass_cache)
+                if result is not None:
+                    return result
+                return store(key, func(text, categories, *args, **kwargs))
+            return wrapper
+        return decorator
+
+
+result_cache = ResultCache(
+    memory=LRUTier(CACHE_MAX_ENTRIES, CACHE_TTL_SECONDS),
+    disk=SQLiteTier(CACHE_DB_PATH, CACHE_TTL_SECONDS) if CACHE_DB_PATH else None,
+    enabled=CACHE_ENABLED,
+)
@@ -0,0 +1,146 @@
+from functools import lru_cache
+import difflib
+import os
+import re
+import unicodedata
+
+
+# Similarity (0-1) a misspelled category needs to be accepted; 0 disables fuzzy matching
+CATEGORY_FUZZY_CUTOFF = float(os.getenv("CATEGORY_FUZZY_CUTOFF", "0.8"))
+CATEGORY_INDEX_CACHE_SIZE = int(os.getenv("CATEGORY_INDEX_CACHE_SIZE", "256"))
+# Shortest prefix that may stand for a whole category ("groc" -> "groceries")
+MIN_PREFIX_LENGTH = 3
+# Resolved names remembered per index; models repeat the same few answers
+RESOLVE_MEMO_SIZE = 1024
+
+_SEPARATORS_RE = re.compile(r"[\s_\-/]+")
+_STRIP_RE = re.compile(r"[^\w ]+", re.UNICODE)
+
+
+def normalize_category(name):
+    """Casefold, strip diacritics and punctuation, collapse separators: ' Going-Out! ' -> 'going out'."""
+    decomposed = unicodedata.normalize("NFKD", str(name).casefold())
+    folded = "".join(char for char in decomposed if not unicodedata.combining(char))
+    return " ".join(_STRIP_RE.sub("", _SEPARATORS_RE.sub(" ", folded)).split())
+
+
+def split_categories(categories):
+    """
+    Flatten a category list (or one string) into individual categories:
+    comma-joined entries are split, blanks dropped and duplicates removed
+    while keeping the caller's order.
+    """
+    if isinstance(categories, str):
+        categories = [categories]
+    result, seen = [], set()
+    for entry in categories or []:
+        for part in str(entry).split(","):
+            part = part.strip()
+            key = normalize_category(part)
+            if key and key not in seen:
+                seen.add(key)
+                result.append(part)
+    return result
+
+
+class CategoryIndex:
+    """
+    Precompiled lookup tables mapping whatever category name the model
+    returned onto one of the caller's categories. Lookups try, in order:
+    exact (normalized) name, a prefix of a category, a category contained in
+    the returned text, shared words, then optional fuzzy matching. Earlier
+    categories win ties, as with the original linear scan.
+    """
+
+    def __init__(self, categories):
+        self.categories = split_categories(categories)
+        self.default = self.categories[0] if self.categories else None
+        self._exact = {}
+        self._prefix = {}
+        self._tokens = {}
+        self._max_words = 1
+        for position, category in enumerate(self.categories):
+            key = normalize_category(category)
+            self._exact.setdefault(key, category)
+            for end in range(MIN_PREFIX_LENGTH, len(key)):
+                self._prefix.setdefault(key[:end], category)
+            words = key.split()
+            self._max_words = max(self._max_words, len(words))
+            for word in words:
+                self._tokens.setdefault(word, []).append(position)
+        self._names = list(self._exact)
+        self._names_by_length = {}
+        for key in self._names:
+            self._names_by_length.setdefault(len(key), []).append(key)
+        self._memo = {}
+
+    def match(self, name):
+        """Return the caller category for `name`, or None when nothing fits."""
+        key = normalize_category(name)
+        if not key:
+            return None
+        found = self._exact.get(key) or self._prefix.get(key)
+        if found:
+            return found
+
+        words = key.split()
+        # Longest category phrase inside the returned text ("groceries and food")
+        for size in range(min(self._max_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                found = self._exact.get(" ".join(words[start:start + size]))
+                if found:
+                    return found
+
+        # Most shared words ("house" -> "house expense")
+        votes = {}
+        for word in words:
+            for position in self._tokens.get(word, ()):
+                votes[position] = votes.get(position, 0) + 1
+        if votes:
+            position = min(votes, key=lambda p: (-votes[p], p))
+            return self.categories[position]
+
+        if CATEGORY_FUZZY_CUTOFF > 0:
+            close = difflib.get_close_matches(key, self._fuzzy_candidates(key), n=1, cutoff=CATEGORY_FUZZY_CUTOFF)
+            if close:
+                return self._exact[close[0]]
+        return None
+
+    def _fuzzy_candidates(self, key):
+        # ratio() <= 2 * min(len) / (len(a) + len(b)): skip names whose length alone rules them out
+        size = len(key)
+        low = int(size * CATEGORY_FUZZY_CUTOFF / (2 - CATEGORY_FUZZY_CUTOFF))
+        high = int(size * (2 - CATEGORY_FUZZY_CUTOFF) / CATEGORY_FUZZY_CUTOFF) + 1
+        return [name for length in range(low, high + 1) for name in self._names_by_length.get(length, ())]
+
+    def resolve(self, name):
+        """match(), trying each part of a comma-joined answer, else the first category."""
+        memo_key = str(name)
+        found = self._memo.get(memo_key)
+        if found is not None:
+            return found
+        found = self._resolve(name)
+        if len(self._memo) < RESOLVE_MEMO_SIZE:
+            self._memo[memo_key] = found
+        return found
+
+    def _resolve(self, name):
+        found = self.match(name)
+        if found is None and "," in str(name):
+            for part in str(name).split(","):
+                found = self.match(part)
+                if found:
+                    break
+        return found or self.default
+
+
+@lru_cache(maxsize=CATEGORY_INDEX_CACHE_SIZE)
+def _cached_index(categories):
+    return CategoryIndex(categories)
+
+
+def get_index(categories):
+    """The CategoryIndex for a category list, built once per distinct list."""
+    if isinstance(categories, str):
+        categories = [categories]
+    return _cached_index(tuple(str(category) for category in categories))
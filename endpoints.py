@@ -1,38 +1,170 @@
-import google.generativeai as genai
-from flask import Flask, request, jsonify
-from logger import logger
+from flask import Flask, Response, g, request, jsonify, stream_with_context, url_for
+from logger import log_payload, logger
 import os
-from translate_and_classify import classify_expense, translate_text
-from flask_swagger_ui import get_swaggerui_blueprint
+import time
+from contextlib import ExitStack
+from translate_and_classify import response_flags, run_pipeline, warm_up_models
+from transcription import TranscriptionError, preprocess_audio, resolve_backend, transcribe_audio
+from audio_upload import MAX_AUDIO_UPLOAD_BYTES, AudioBuffer, AudioTooLarge, UploadRequest
+from streaming import NDJSON_MIMETYPE, SSE_MIMETYPE, classify_events, format_event, speech_events
+from pipeline_engine import engine, request_budget
+from batch_classify import BATCH_GENERATION_CONFIG, BATCH_MAX_RECORDS, classify_batch
+from cache import result_cache
+from single_flight import single_flight
+from expense_store import (
+    EXPENSE_QUERIES_OWN_USER_ONLY, EXPENSE_USER_HEADER, get_expense_store, parse_timestamp, record_items,
+)
+from job_queue import callback_url_error, get_job_store
+import batch_transcribe
+from category_index import split_categories
+from long_audio import transcribe_long_audio
+import fast_path
+import local_stt
+import metrics
+import upstream
 from flask_cors import CORS
-from elevenlabs.client import ElevenLabs
+
+# Serve the Swagger UI at /docs; production deployments can leave it out
+SWAGGER_ENABLED = os.getenv("SWAGGER_ENABLED", "true").lower() in ("1", "true", "yes")
+# Import the Gemini SDK and build the model clients at import time instead of
+# on the first request. Off by default so cold starts and test imports stay
+# fast; main.py warms up in its master process either way
+WARM_UP_ON_IMPORT = os.getenv("WARM_UP_ON_IMPORT", "false").lower() in ("1", "true", "yes")
+
+app = Flask(__name__)
+# Upload parts go straight to memory or one mmap-able temp file, capped in size
+app.request_class = UploadRequest
+app.config['MAX_CONTENT_LENGTH'] = MAX_AUDIO_UPLOAD_BYTES + 64 * 1024  # room for the other form fields
+CORS(app)
 
 ######## TEST ENDPOINTS IN SWAGGER  #########
-SWAGGER_URL = '/docs'
-API_URL = '/static/swagger.yaml'
-swaggerui_blueprint = get_swaggerui_blueprint(
-    SWAGGER_URL,
-    API_URL,
-    config={'app_name': "Expense Classifier API"}
-)
+if SWAGGER_ENABLED:
+    from flask_swagger_ui import get_swaggerui_blueprint
+    SWAGGER_URL = '/docs'
+    API_URL = '/static/swagger.yaml'
+    swaggerui_blueprint = get_swaggerui_blueprint(
+        SWAGGER_URL,
+        API_URL,
+        config={'app_name': "Expense Classifier API"}
+    )
+    app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
-genai.configure(api_key=os.getenv('GEMINI_API_KEY'))
-LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME")
 
-elevenlabs_client = ElevenLabs(api_key=os.getenv('ELEVENLABS_API_KEY'))
+def warm_up():
+    """Configure genai and build the shared model clients off the request path"""
+    warm_up_models(extra_configs=(BATCH_GENERATION_CONFIG,))
 
-app = Flask(__name__)
-CORS(app)
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+
+if WARM_UP_ON_IMPORT:
+    warm_up()
 
 DEFAULT_CATEGORIES = ["going out", "house expense", "groceries"]
 
+# Send "X-Cache-Bypass: 1" to skip cached LLM results and force fresh calls
+CACHE_BYPASS_HEADER = 'X-Cache-Bypass'
+
+
+@app.errorhandler(413)
+def request_too_large(e):
+    return jsonify({
+        "error": "Audio file too large",
+        "details": f"Uploads are limited to {MAX_AUDIO_UPLOAD_BYTES} bytes"
+    }), 413
+
+
+@app.before_request
+def start_request_budget():
+    # Every upstream call made for this request shares REQUEST_BUDGET_SECONDS
+    g.request_budget = ExitStack()
+    g.request_budget.enter_context(request_budget())
+    g.request_started = time.perf_counter()
+    if metrics.SERVER_TIMING_ENABLED:
+        g.timings_token = metrics.start_request_timings()
+
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed responses are measured up to their headers only
+    elapsed = time.perf_counter() - g.get('request_started', time.perf_counter())
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    metrics.HTTP_DURATION.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+    token = g.pop('timings_token', None)
+    if token is not None:
+        response.headers['Server-Timing'] = metrics.server_timing_header(metrics.finish_request_timings(token), elapsed)
+    return response
+
+
+@app.teardown_request
+def end_request_budget(exc):
+    budget = g.pop('request_budget', None)
+    if budget is not None:
+        budget.close()
+
+
+def cache_bypass_requested():
+    return request.headers.get(CACHE_BYPASS_HEADER, '').strip().lower() in ('1', 'true', 'yes')
+
+def request_user():
+    """User the request's expenses are recorded under (EXPENSE_USER_HEADER), or None"""
+    return request.headers.get(EXPENSE_USER_HEADER, '').strip() or None
+
+def job_requested():
+    """Clients opt into background processing with "Prefer: respond-async" or async=1"""
+    flag = request.form.get('async') or request.args.get('async') or ''
+    return 'respond-async' in request.headers.get('Prefer', '').lower() or flag.strip().lower() in ('1', 'true', 'yes')
+
+def submit_speech_job(audio_file, audio, backend):
+    """Spool the upload as a background job and answer 202 with where to poll for it"""
+    job_store = get_job_store()
+    if job_store is None:
+        return jsonify({"error": "Background jobs are disabled"}), 503
+    callback_url = (request.form.get('callback_url') or request.args.get('callback_url') or '').strip() or None
+    rejected = callback_url and callback_url_error(callback_url, resolve=False)
+    if rejected:
+        return jsonify({"error": "Invalid callback_url", "details": rejected}), 400
+    params = {
+        "categories": split_categories(request.form.getlist('categories')) or DEFAULT_CATEGORIES,
+        "backend": backend,
+        "mode": request.form.get('mode') or request.args.get('mode'),
+        "bypass_cache": cache_bypass_requested(),
+        "user_id": request_user(),
+        "filename": audio_file.filename,
+        "content_type": audio_file.content_type,
+    }
+    job = job_store.submit("speech", params, audio, callback_url)
+    logger.info(f"Queued speech job {job['job_id']} for {audio_file.filename} ({audio.size} bytes)")
+    status_url = url_for('get_job', job_id=job["job_id"])
+    response = jsonify({**job, "status_url": status_url})
+    response.headers['Location'] = status_url
+    return response, 202
+
+def stream_events(events, source=None):
+    """Stream (event, data) pairs from an async generator as NDJSON or SSE; items are recorded under `source`"""
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'sse' if SSE_MIMETYPE in request.headers.get('Accept', '') else 'ndjson'
+    user = request_user()
+
+    def body():
+        for event, data in engine.iterate_sync(events):
+            if event == 'item' and source:
+                record_items([data], user, source)
+            yield format_event(event, data, fmt)
+
+    return Response(
+        stream_with_context(body()),
+        mimetype=SSE_MIMETYPE if fmt == 'sse' else NDJSON_MIMETYPE,
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 ####### Speech to text endpoint #######
 @app.route('/speech-to-text', methods=['POST'])
 def speech_to_text():
     """
-    Receives audio file from frontend, converts to text using ElevenLabs Scribe,
-    then classifies the expense using the existing classify_expense flow.
+    Receives audio file from frontend, converts to text using ElevenLabs Scribe
+    or the local engine (form field / query parameter "backend"), then
+    classifies the expense using the existing classify_expense flow. Long
+    recordings are split into segments that are processed concurrently.
     """
     if 'audio' not in request.files:
         return jsonify({"error": "No audio file provided"}), 400
@@ -41,87 +173,58 @@ def speech_to_text():
     transcript = None
 
     try:
-        # Get categories from form data first
-        categories = request.form.getlist('categories')
+        backend = resolve_backend(request.form.get('backend') or request.args.get('backend'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        audio = AudioBuffer.from_upload(audio_file)
+    except AudioTooLarge as e:
+        return jsonify({"error": "Audio file too large", "details": str(e)}), 413
+
+    if job_requested():
+        try:
+            return submit_speech_job(audio_file, audio, backend)
+        finally:
+            audio.close()
+
+    try:
+        # Get categories from form data first ("a,b,c" or repeated fields)
+        categories = split_categories(request.form.getlist('categories'))
         if not categories:
             categories = DEFAULT_CATEGORIES
         
         logger.info(f"Processing audio file: {audio_file.filename}")
-        logger.info(f"File size: {audio_file.content_length}")
+        logger.info(f"File size: {audio.size}")
         logger.info(f"Content type: {audio_file.content_type}")
 
+        # Trimmed, mono, resampled copy; the report goes back to the client
+        prepared, preprocessing = preprocess_audio(audio)
+        if not preprocessing["speech_detected"]:
+            logger.warning("Audio contains no speech, skipping transcription")
+            return jsonify({
+                "error": "No speech detected",
+                "details": "The audio file contains only silence",
+                "original_text": "",
+                "translated_text": "",
+                "classified_items": [],
+                "audio_preprocessing": preprocessing
+            }), 400
+
+        mode = request.form.get('mode') or request.args.get('mode')
         try:
-            # Try ElevenLabs SDK first
-            logger.info("Attempting ElevenLabs SDK transcription...")
-            
-            # Reset file pointer to beginning
-            audio_file.seek(0)
-            
-            transcript_response = elevenlabs_client.speech_to_text.convert(
-                file=audio_file,
-                model_id="scribe_v1",
-                language_code=None,  # Auto-detect
-                timestamps_granularity="word",
-                diarize=False,  # Simplified - disable speaker detection for now
-                tag_audio_events=False,  # Simplified - disable audio events for now
-            )
-            
-            # Extract transcript text
-            if hasattr(transcript_response, 'text'):
-                transcript = transcript_response.text
-            elif hasattr(transcript_response, 'transcript'):
-                transcript = transcript_response.transcript
-            else:
-                transcript = str(transcript_response)
-                
-            logger.info(f"SDK transcription successful: '{transcript}'")
-            
-        except Exception as sdk_error:
-            logger.error(f"ElevenLabs SDK failed: {sdk_error}")
-            
-            try:
-                # Fallback to direct API call
-                logger.info("Attempting direct API call to ElevenLabs...")
-                
-                # Reset file pointer again
-                audio_file.seek(0)
-                
-                import requests
-                
-                url = "https://api.elevenlabs.io/v1/speech-to-text"
-                headers = {
-                    "xi-api-key": os.getenv('ELEVENLABS_API_KEY')
-                }
-                
-                files = {
-                    "file": (audio_file.filename, audio_file, audio_file.content_type)
-                }
-                
-                data = {
-                    "model_id": "scribe_v1",
-                    "timestamps_granularity": "word"
-                }
-                
-                response = requests.post(url, headers=headers, files=files, data=data)
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    transcript = result.get('text', '')
-                    logger.info(f"API transcription successful: '{transcript}'")
-                else:
-                    logger.error(f"API call failed with status {response.status_code}: {response.text}")
-                    raise Exception(f"API call failed: {response.status_code}")
-                    
-            except Exception as api_error:
-                logger.error(f"Direct API call also failed: {api_error}")
-                
-                # Ultimate fallback - return error but allow manual text input
-                return jsonify({
-                    "error": "Speech-to-text service unavailable",
-                    "details": f"Both SDK and API failed. SDK: {str(sdk_error)}, API: {str(api_error)}",
-                    "suggestion": "Please try using the text classification endpoint directly",
-                    "fallback_transcript": "Could not transcribe audio"
-                }), 500
+            # Long recordings: overlapping segments transcribed and classified concurrently
+            chunked = transcribe_long_audio(prepared, categories, backend, mode, bypass_cache=cache_bypass_requested(),
+                                            seconds=preprocessing.get("seconds_out"))
+            transcript = chunked["original_text"] if chunked else transcribe_audio(prepared, backend)
+        except TranscriptionError as e:
+            # Ultimate fallback - return error but allow manual text input
+            return jsonify({
+                "error": "Speech-to-text service unavailable",
+                "details": str(e),
+                "suggestion": "Please try using the text classification endpoint directly",
+                "fallback_transcript": "Could not transcribe audio"
+            }), 500
 
         # Validate transcript
         if not transcript or not transcript.strip():
@@ -135,12 +238,18 @@ def speech_to_text():
             }), 400
 
         transcript = transcript.strip()
-        logger.info(f"Final transcript: '{transcript}' (length: {len(transcript)})")
+        log_payload("INFO", f"Final transcript (length: {len(transcript)})", transcript)
+
+        if chunked:
+            # Already translated and classified segment by segment
+            chunked["audio_preprocessing"] = preprocessing
+            record_items(chunked["classified_items"], request_user(), "speech")
+            return jsonify(chunked)
 
-        # Step 1: Translate text if needed
+        # Step 1 + 2: Translate and classify (two calls, or one in fused mode)
         logger.info("Starting translation...")
-        translation = translate_text(transcript, categories)
-        logger.info(f"Translation result: {translation}")
+        translation, classification_list = run_pipeline(transcript, categories, mode, bypass_cache=cache_bypass_requested())
+        log_payload("INFO", "Translation result", translation)
         
         if translation.get('status') == 'error':
             logger.error(f"Translation failed: {translation.get('error')}")
@@ -152,12 +261,8 @@ def speech_to_text():
                 "classified_items": []
             }), 500
 
-        # Step 2: Classify
         translated_text = translation.get('translated_text', transcript)
-        logger.info(f"Classifying text: '{translated_text}'")
-        
-        classification_list = classify_expense(translated_text, categories)
-        logger.info(f"Classification result: {classification_list}")
+        log_payload("INFO", "Classification result", classification_list)
 
         if not classification_list:
             logger.warning("Classification returned empty list")
@@ -168,12 +273,16 @@ def speech_to_text():
                 "amount": 0
             }]
 
-        return jsonify({
+        record_items(classification_list, request_user(), "speech")
+        result = {
             "original_text": transcript,
             "translated_text": translated_text,
             "classified_items": classification_list,
+            "audio_preprocessing": preprocessing,
             "status": "success"
-        })
+        }
+        result.update(response_flags(translation))
+        return jsonify(result)
 
     except Exception as e:
         logger.exception("Unexpected error in speech-to-text endpoint")
@@ -188,6 +297,67 @@ def speech_to_text():
                 "categories": categories if 'categories' in locals() else []
             }
         }), 500
+    finally:
+        audio.close()
+
+
+####### Streaming speech to text: transcript, translation, then each item #######
+@app.route('/speech-to-text/stream', methods=['POST'])
+def speech_to_text_stream():
+    if 'audio' not in request.files:
+        return jsonify({"error": "No audio file provided"}), 400
+
+    categories = split_categories(request.form.getlist('categories')) or DEFAULT_CATEGORIES
+    try:
+        backend = resolve_backend(request.form.get('backend') or request.args.get('backend'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    audio_file = request.files['audio']
+    logger.info(f"Streaming audio file: {audio_file.filename}")
+    try:
+        # Outlives the request's file objects, so the generator can keep reading it
+        audio = AudioBuffer.from_upload(audio_file)
+    except AudioTooLarge as e:
+        return jsonify({"error": "Audio file too large", "details": str(e)}), 413
+
+    response = stream_events(speech_events(audio, categories, bypass_cache=cache_bypass_requested(), backend=backend),
+                             source="speech_stream")
+    response.call_on_close(audio.close)
+    return response
+
+
+####### Bulk import: transcribe and classify a folder of recordings #######
+@app.route('/speech-to-text/batch', methods=['POST'])
+def speech_to_text_batch():
+    """
+    Starts a background job over a directory under BATCH_AUDIO_ROOT and
+    returns its id; results are appended to a JSONL file as files finish.
+    Posting the same directory again resumes from that file.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        backend = resolve_backend(data.get('backend'))
+        job = batch_transcribe.start_job(
+            data.get('directory'),
+            categories=split_categories(data.get('categories') or []) or DEFAULT_CATEGORIES,
+            backend=backend,
+            mode=data.get('mode'),
+            user_id=request_user(),
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify(job.as_dict()), 202
+
+
+@app.route('/speech-to-text/batch/<job_id>', methods=['GET'])
+def speech_to_text_batch_status(job_id):
+    """Progress and throughput of a batch job, whichever server process runs it"""
+    job = batch_transcribe.get_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
 
 
 # Simple test endpoint to verify ElevenLabs connection
@@ -196,6 +366,7 @@ def test_elevenlabs():
     """Test ElevenLabs API connection"""
     try:
         # Test if we can create a client
+        from elevenlabs.client import ElevenLabs
         client = ElevenLabs(api_key=os.getenv('ELEVENLABS_API_KEY'))
         
         return jsonify({
@@ -218,18 +389,17 @@ def classify():
     data = request.get_json()
     
     text = data.get('text', '').strip()
-    categories = data.get('categories', [])
+    categories = split_categories(data.get('categories', []))
     
     if not text or not categories:
         return jsonify({"error": "Missing text or categories"}), 400
     
-    # Step 1: Translate
-    translation = translate_text(text, categories)
+    # Step 1 + 2: Translate and classify (two calls, or one in fused mode)
+    mode = data.get('mode') or request.args.get('mode')
+    translation, classification_list = run_pipeline(text, categories, mode, bypass_cache=cache_bypass_requested())
     if translation.get('status') == 'error':
         return jsonify({"error": "Translation failed", "details": translation.get('error')}), 500
     
-    # Step 2: Classify
-    classification_list = classify_expense(translation['translated_text'], categories)
     if not classification_list:
         return jsonify({"error": "Classification failed", "details": "Empty list returned"}), 500
     
@@ -239,12 +409,149 @@ def classify():
         "classified_items": classification_list,
         "status": "success"
     }
+    result.update(response_flags(translation))
+    record_items(classification_list, request_user(), "classify")
     return jsonify(result)
 
+#### STREAMING CLASSIFY: translation, then each item as the model emits it #####
+@app.route('/classify-expense/stream', methods=['POST'])
+def classify_stream():
+    data = request.get_json(silent=True) or {}
+
+    text = data.get('text', '').strip()
+    categories = split_categories(data.get('categories', []))
+
+    if not text or not categories:
+        return jsonify({"error": "Missing text or categories"}), 400
+
+    return stream_events(classify_events(text, categories, bypass_cache=cache_bypass_requested()), source="classify_stream")
+
+#### CLASSIFY MANY EXPENSES IN ONE REQUEST #####
+@app.route('/classify-expense/batch', methods=['POST'])
+def classify_batch_endpoint():
+    """Batch endpoint: records are packed into shared prompts and classified concurrently"""
+    data = request.get_json(silent=True) or {}
+    records = data.get('records')
+
+    if not isinstance(records, list) or not records:
+        return jsonify({"error": "Missing records"}), 400
+    if len(records) > BATCH_MAX_RECORDS:
+        return jsonify({"error": f"Too many records (max {BATCH_MAX_RECORDS})"}), 400
+
+    results = classify_batch(records, bypass_cache=cache_bypass_requested())
+    failed = sum(1 for result in results if result["status"] == "error")
+    user = request_user()
+    for result in results:
+        if result["status"] == "success":
+            record_items(result["classified_items"], user, "classify_batch")
+    return jsonify({
+        "results": results,
+        "count": len(results),
+        "failed": failed,
+        "status": "success" if not failed else "partial"
+    })
+
+##### BACKGROUND JOBS #####
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of a background job, with the result once it has finished"""
+    job_store = get_job_store()
+    if job_store is None:
+        return jsonify({"error": "Background jobs are disabled"}), 503
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+##### EXPENSE QUERIES #####
+def expense_query_args():
+    """
+    (user_id, start, end) from the query string; user_id falls back to EXPENSE_USER_HEADER, None means all users.
+    Neither is authenticated: any caller can read any user's totals unless EXPENSE_QUERIES_OWN_USER_ONLY
+    restricts queries to the header user and a proxy in front sets that header
+    """
+    if EXPENSE_QUERIES_OWN_USER_ONLY:
+        user = request_user()
+        if user is None:
+            raise PermissionError(f"The {EXPENSE_USER_HEADER} header is required")
+    else:
+        user = request.args.get('user_id') or request_user()
+    return user, parse_timestamp(request.args.get('start')), parse_timestamp(request.args.get('end'))
+
+@app.route('/expenses/totals', methods=['GET'])
+def expense_totals():
+    """Per-category totals of recorded expenses over [start, end)"""
+    expense_store = get_expense_store()
+    if expense_store is None:
+        return jsonify({"error": "Expense store is disabled"}), 503
+    try:
+        user, start, end = expense_query_args()
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 401
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    totals = expense_store.category_totals(user, start, end)
+    return jsonify({
+        "user_id": user,
+        "start": start,
+        "end": end,
+        "totals": totals,
+        "total": round(sum(entry["total"] for entry in totals), 2),
+    })
+
+@app.route('/expenses/sum', methods=['GET'])
+def expense_sum():
+    """Sum of recorded expenses over [start, end), optionally for one category"""
+    expense_store = get_expense_store()
+    if expense_store is None:
+        return jsonify({"error": "Expense store is disabled"}), 503
+    try:
+        user, start, end = expense_query_args()
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 401
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    category = request.args.get('category') or None
+    return jsonify({
+        "user_id": user,
+        "category": category,
+        "start": start,
+        "end": end,
+        **expense_store.range_sum(user, category, start, end),
+    })
+
+##### CACHE STATS #####
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss counters of the LLM result cache and in-flight call coalescing"""
+    return jsonify({**result_cache.stats(), "single_flight": single_flight.stats()})
+
+##### FAST PATH STATS #####
+@app.route('/fast-path/stats', methods=['GET'])
+def fast_path_stats():
+    """How many requests the local classifier resolved without the LLM"""
+    return jsonify(fast_path.stats())
+
+##### PROMETHEUS METRICS #####
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latency histograms, in-flight gauges, transcription paths and token usage"""
+    return Response(metrics.registry.render(), content_type=metrics.PROMETHEUS_CONTENT_TYPE)
+
+##### UPSTREAM STATS #####
+@app.route('/upstream/stats', methods=['GET'])
+def upstream_stats():
+    """Circuit breaker state per upstream provider"""
+    return jsonify(upstream.stats())
+
 ##### HOME ROUTE #####
 @app.route('/', methods=['GET'])
 def home():
     return jsonify({"status": "running"})
 
 if __name__ == '__main__':
+    warm_up()
+    if resolve_backend() == 'local':
+        # Load the local models before serving; not at import, worker processes import this module too
+        local_stt.warm_up()
     app.run(debug=True, port=5050)
\ No newline at end of file
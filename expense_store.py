@@ -0,0 +1,300 @@
+from logger import logger
+from datetime import datetime, timezone
+import atexit
+import collections
+import math
+import metrics
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+
+EXPENSE_STORE_ENABLED = os.getenv("EXPENSE_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+EXPENSE_DB_PATH = os.getenv("EXPENSE_DB_PATH", os.path.join("data", "expenses.db"))
+# Most queued records written in one transaction
+EXPENSE_WRITE_BATCH_SIZE = int(os.getenv("EXPENSE_WRITE_BATCH_SIZE", "512"))
+# Request header naming the user the recorded expenses belong to. The app does not
+# authenticate it: in production an authenticating proxy should set it and drop the client's
+EXPENSE_USER_HEADER = os.getenv("EXPENSE_USER_HEADER", "X-User-Id")
+# Expense queries read only the EXPENSE_USER_HEADER user and ignore ?user_id=; without this,
+# any caller can read any user's (or all users') totals
+EXPENSE_QUERIES_OWN_USER_ONLY = os.getenv("EXPENSE_QUERIES_OWN_USER_ONLY", "false").lower() in ("1", "true", "yes")
+
+ANONYMOUS_USER = "anonymous"
+DAY_SECONDS = 86400
+
+ITEMS_WRITTEN = metrics.registry.register(metrics.Counter(
+    "expense_items_written_total", "Classified items persisted to the expense store by source", ("source",)))
+WRITE_ERRORS = metrics.registry.register(metrics.Counter(
+    "expense_write_errors_total", "Expense store write batches that failed and were dropped"))
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS expenses ("
+    "id INTEGER PRIMARY KEY, user_id TEXT NOT NULL, category TEXT NOT NULL COLLATE NOCASE, "
+    "item TEXT, amount REAL NOT NULL, source TEXT, created_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_user_time ON expenses (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_category_time ON expenses (category, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_expenses_time ON expenses (created_at)",
+    # Per user, category and UTC day; kept in the same transaction as the rows it sums
+    "CREATE TABLE IF NOT EXISTS expense_daily ("
+    "user_id TEXT NOT NULL, category TEXT NOT NULL COLLATE NOCASE, day INTEGER NOT NULL, "
+    "total REAL NOT NULL, count INTEGER NOT NULL, PRIMARY KEY (user_id, category, day))",
+    "CREATE INDEX IF NOT EXISTS idx_expense_daily_user_day ON expense_daily (user_id, day)",
+    "CREATE INDEX IF NOT EXISTS idx_expense_daily_category_day ON expense_daily (category, day)",
+    "CREATE INDEX IF NOT EXISTS idx_expense_daily_day ON expense_daily (day)",
+)
+
+
+def parse_timestamp(value):
+    """Unix seconds or an ISO 8601 date/time (UTC unless it has an offset) as unix seconds; None passes through."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid timestamp '{value}', expected unix seconds or ISO 8601") from None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _amount(value):
+    try:
+        amount = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return amount if math.isfinite(amount) else 0.0
+
+
+def _rows(user_id, source, created_at, items):
+    for item in items or []:
+        if isinstance(item, dict) and item.get("category"):
+            yield (user_id, str(item["category"]).strip(), str(item.get("item") or ""),
+                   _amount(item.get("amount")), source, created_at)
+
+
+class ExpenseStore:
+    """
+    Classified items in SQLite (WAL), with a daily rollup per user and
+    category. Requests only enqueue: a background thread writes whatever
+    has queued up in one transaction, the way the log sink batches lines.
+    Queries read through per-thread connections, which WAL lets run
+    alongside the writer.
+    """
+
+    def __init__(self, path, batch_size=EXPENSE_WRITE_BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._stats_lock = threading.Lock()
+        self._stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._start()
+        conn = self._conn()
+        for statement in SCHEMA:
+            conn.execute(statement)
+        atexit.register(self.stop)
+        if hasattr(os, "register_at_fork"):
+            # A forked server worker needs its own writer thread and connections
+            os.register_at_fork(after_in_child=self._start)
+
+    def _start(self):
+        self._local = threading.local()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="expense-writer", daemon=True)
+        self._thread.start()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def record(self, items, user_id=None, source=None, created_at=None):
+        """Queue classified items for writing; never blocks on the database."""
+        rows = list(_rows(user_id or ANONYMOUS_USER, source, created_at or time.time(), items))
+        if rows:
+            self._queue.put(rows)
+            self._count("queued", len(rows))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is written."""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            batch, waiters = [], []
+            while entry is not None:
+                if isinstance(entry, threading.Event):
+                    waiters.append(entry)
+                else:
+                    batch.extend(entry)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    entry = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                self._write(batch)
+            for waiter in waiters:
+                waiter.set()
+            if entry is None:
+                return
+
+    def _write(self, rows):
+        rollup = {}
+        for user_id, category, _, amount, _, created_at in rows:
+            day = int(created_at // DAY_SECONDS)
+            # Categories compare case-insensitively, like the NOCASE columns
+            name, total, count = rollup.get((user_id, category.casefold(), day), (category, 0.0, 0))
+            rollup[(user_id, category.casefold(), day)] = (name, total + amount, count + 1)
+        conn = self._conn()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT INTO expenses (user_id, category, item, amount, source, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.executemany(
+                "INSERT INTO expense_daily (user_id, category, day, total, count) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (user_id, category, day) DO UPDATE SET "
+                "total = total + excluded.total, count = count + excluded.count",
+                [(user_id, name, day, total, count) for (user_id, _, day), (name, total, count) in rollup.items()],
+            )
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            WRITE_ERRORS.inc()
+            self._count("failed", len(rows))
+            logger.error(f"Expense store write of {len(rows)} items failed: {e}")
+            return
+        self._count("written", len(rows))
+        self._count("batches")
+        for source, count in collections.Counter(row[4] or "unknown" for row in rows).items():
+            ITEMS_WRITTEN.inc(count, source=source)
+
+    def _aggregate(self, user_id=None, category=None, start=None, end=None):
+        """
+        {category: (total, count)} over [start, end). Whole UTC days come from
+        the daily rollup; only the partial days at either edge read rows,
+        through the (user|category|time, created_at) indexes.
+        """
+        filters, params = [], []
+        if user_id is not None:
+            filters.append("user_id = ?")
+            params.append(user_id)
+        if category is not None:
+            filters.append("category = ?")
+            params.append(category)
+
+        first_day = None if start is None else math.ceil(start / DAY_SECONDS)
+        end_day = None if end is None else math.floor(end / DAY_SECONDS)
+        ranges, days = [], None
+        if first_day is not None and end_day is not None and first_day >= end_day:
+            ranges.append((start, end))
+        else:
+            days = (first_day, end_day)
+            if start is not None:
+                ranges.append((start, first_day * DAY_SECONDS))
+            if end is not None:
+                ranges.append((end_day * DAY_SECONDS, end))
+
+        totals = {}
+
+        def add(rows):
+            for name, total, count in rows:
+                previous = totals.get(name.casefold(), (name, 0.0, 0))
+                totals[name.casefold()] = (previous[0], previous[1] + total, previous[2] + count)
+
+        conn = self._conn()
+        if days is not None:
+            where = list(filters)
+            day_params = list(params)
+            if days[0] is not None:
+                where.append("day >= ?")
+                day_params.append(days[0])
+            if days[1] is not None:
+                where.append("day < ?")
+                day_params.append(days[1])
+            add(conn.execute(
+                "SELECT category, SUM(total), SUM(count) FROM expense_daily"
+                + (" WHERE " + " AND ".join(where) if where else "") + " GROUP BY category",
+                day_params,
+            ))
+        for low, high in ranges:
+            if low >= high:
+                continue
+            add(conn.execute(
+                "SELECT category, SUM(amount), COUNT(*) FROM expenses WHERE "
+                + " AND ".join(filters + ["created_at >= ?", "created_at < ?"]) + " GROUP BY category",
+                params + [low, high],
+            ))
+        return {name: (total, count) for name, total, count in totals.values()}
+
+    def category_totals(self, user_id=None, start=None, end=None):
+        """Per-category totals over [start, end), largest first."""
+        totals = self._aggregate(user_id, None, start, end)
+        return [
+            {"category": name, "total": round(total, 2), "count": count}
+            for name, (total, count) in sorted(totals.items(), key=lambda entry: -entry[1][0])
+        ]
+
+    def range_sum(self, user_id=None, category=None, start=None, end=None):
+        """Total and item count over [start, end), optionally for one category."""
+        totals = self._aggregate(user_id, category, start, end).values()
+        return {"total": round(sum(total for total, _ in totals), 2), "count": sum(count for _, count in totals)}
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["pending"] = stats["queued"] - stats["written"] - stats["failed"]
+        stats["path"] = self.path
+        return stats
+
+
+_expense_store = None
+_expense_store_lock = threading.Lock()
+
+
+def get_expense_store():
+    """
+    The process-wide ExpenseStore, opened on first use (the server opens it in
+    its preload step); None when the store is disabled.
+    """
+    global _expense_store
+    if _expense_store is None and EXPENSE_STORE_ENABLED and EXPENSE_DB_PATH:
+        with _expense_store_lock:
+            if _expense_store is None:
+                _expense_store = ExpenseStore(EXPENSE_DB_PATH)
+    return _expense_store
+
+
+def record_items(items, user_id=None, source=None):
+    """Persist classified items when the store is enabled."""
+    store = get_expense_store()
+    if store is not None:
+        store.record(items, user_id, source)
@@ -0,0 +1,297 @@
+from logger import logger
+import metrics
+import os
+import re
+import threading
+import unicodedata
+
+
+FAST_PATH_ENABLED = os.getenv("FAST_PATH_ENABLED", "true").lower() in ("1", "true", "yes")
+# Results below this confidence fall through to the LLM
+FAST_PATH_THRESHOLD = float(os.getenv("FAST_PATH_THRESHOLD", "0.8"))
+# Short inputs only: long sentences usually hold several expenses
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "8"))
+
+# Keywords (English and Romanian, without diacritics) for common category names.
+# A caller category picks these up when its normalized name matches a key.
+CATEGORY_LEXICON = {
+    "going out": [
+        "restaurant", "pizza", "burger", "bar", "pub", "club", "cinema", "film", "movie", "concert",
+        "cafe", "coffee", "cafea", "bere", "beer", "cocktail", "party", "petrecere", "sushi",
+        "shaorma", "kebab", "iesire", "prietenii", "friends", "teatru", "theatre", "bowling",
+    ],
+    "house expense": [
+        "rent", "chirie", "utilities", "utilitati", "electricity", "curent", "lumina", "gaz", "gas bill",
+        "water", "apa", "internet", "wifi", "intretinere", "furniture", "mobila", "repair", "reparatie",
+        "cleaning", "curatenie", "detergent", "ikea", "dedeman", "bricolaj",
+    ],
+    "groceries": [
+        "groceries", "cumparaturi", "supermarket", "market", "piata", "lidl", "kaufland", "carrefour",
+        "auchan", "mega", "profi", "linella", "bread", "paine", "milk", "lapte", "eggs", "oua", "meat",
+        "carne", "fruit", "fructe", "vegetables", "legume", "cheese", "branza", "food", "mancare",
+    ],
+    "transport": [
+        "taxi", "uber", "bolt", "yandex", "bus", "autobuz", "troleibuz", "tram", "tramvai", "metro",
+        "metrou", "train", "tren", "fuel", "benzina", "motorina", "parking", "parcare", "ticket", "bilet",
+    ],
+    "health": [
+        "pharmacy", "farmacie", "medicine", "medicamente", "doctor", "dentist", "stomatolog", "clinic",
+        "clinica", "analize", "pastile", "pills",
+    ],
+}
+
+CURRENCY_TOKENS = {"lei", "leu", "ron", "mdl", "bani", "euro", "eur", "usd", "dollars", "dollar", "dolari", "€", "$"}
+
+NUMBER_WORDS = {
+    # English
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14,
+    "fifteen": 15, "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20,
+    "thirty": 30, "forty": 40, "fifty": 50, "sixty": 60, "seventy": 70, "eighty": 80, "ninety": 90,
+    # Romanian (diacritics are stripped before lookup)
+    "unu": 1, "una": 1, "un": 1, "o": 1, "doi": 2, "doua": 2, "trei": 3, "patru": 4, "cinci": 5,
+    "sase": 6, "sapte": 7, "opt": 8, "noua": 9, "zece": 10, "unsprezece": 11, "doisprezece": 12,
+    "douasprezece": 12, "treisprezece": 13, "paisprezece": 14, "cincisprezece": 15,
+    "saisprezece": 16, "saptesprezece": 17, "optsprezece": 18, "nouasprezece": 19,
+    "douazeci": 20, "treizeci": 30, "patruzeci": 40, "cincizeci": 50, "saizeci": 60,
+    "saptezeci": 70, "optzeci": 80, "nouazeci": 90,
+}
+MULTIPLIER_WORDS = {
+    "hundred": 100, "suta": 100, "sute": 100,
+    "thousand": 1000, "mie": 1000, "mii": 1000,
+}
+# Joiners inside number phrases ("douazeci si cinci", "one hundred and five")
+NUMBER_JOINERS = {"si", "and", "de"}
+FILLER_WORDS = {
+    "am", "pe", "for", "on", "at", "in", "la", "de", "the", "a", "an", "i", "spent", "cheltuit",
+    "paid", "platit", "bought", "cumparat", "dat", "azi", "today", "si", "and",
+}
+
+# Words that turn the sentence into something other than a plain expense: a
+# negation ("did not pay", "n-am platit") or money coming back (a refund)
+NEGATION_WORDS = {
+    "not", "no", "didn", "didnt", "don", "dont", "never", "nu", "n", "nici", "niciodata",
+    "refund", "refunded", "reimbursed", "returned", "cashback", "received",
+    "rambursare", "rambursat", "returnat", "retur", "restituit", "primit", "incasat",
+}
+# Confidence caps: below FAST_PATH_THRESHOLD, so these inputs go to the LLM
+NEGATION_CONFIDENCE = 0.1
+AMBIGUOUS_AMOUNT_CONFIDENCE = 0.5
+
+TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)*|[€$]|[^\W\d_]+", re.UNICODE)
+
+_stats_lock = threading.Lock()
+_stats = {"attempts": 0, "hits": 0}
+
+
+def _fold(text):
+    """Lowercase and strip diacritics (ș -> s, ă -> a) for lexicon lookups."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def tokenize(text):
+    return [_fold(token) for token in TOKEN_RE.findall(text.casefold())]
+
+
+def parse_number(token):
+    """
+    (value, ambiguous) for a digit token. With both separators the last one
+    is the decimal mark ("1,500.50", "1.500,50"); a repeated one groups
+    thousands ("1,500,000"). A single one before exactly three digits
+    ("1,500", "2.500") is read as thousands but flagged ambiguous, since
+    English and Romanian use the two marks the other way around.
+    """
+    separators = [char for char in token if char in ",."]
+    if not separators:
+        return float(token), False
+    if len(set(separators)) == 2:
+        decimal = separators[-1]
+        thousands = "," if decimal == "." else "."
+        return float(token.replace(thousands, "").replace(decimal, ".")), False
+    if len(separators) > 1:
+        return float(token.replace(separators[0], "")), False
+    whole, fraction = token.replace(",", ".").split(".")
+    if len(fraction) == 3:
+        return float(whole + fraction), True
+    return float(f"{whole}.{fraction}"), False
+
+
+def extract_amounts(tokens):
+    """
+    Return (amounts, amount_token_indexes, has_currency, ambiguous). Handles
+    digits (see parse_number) and English/Romanian number-word phrases;
+    ambiguous is True when a digit amount could be read two ways.
+    """
+    amounts, used, has_currency, ambiguous = [], set(), False, False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in CURRENCY_TOKENS:
+            has_currency = True
+            used.add(i)
+            i += 1
+            continue
+        if token[0].isdigit():
+            value, unclear = parse_number(token)
+            ambiguous |= unclear
+            used.add(i)
+            i += 1
+            # "3 mii", "2 thousand"
+            if i < len(tokens) and tokens[i] in MULTIPLIER_WORDS:
+                value *= MULTIPLIER_WORDS[tokens[i]]
+                used.add(i)
+                i += 1
+            amounts.append(value)
+            continue
+        if token in NUMBER_WORDS or token in MULTIPLIER_WORDS:
+            # "o" and "un"/"una" are also articles: only count them before a multiplier
+            if token in ("o", "un", "una") and not (i + 1 < len(tokens) and tokens[i + 1] in MULTIPLIER_WORDS):
+                i += 1
+                continue
+            total, current, j = 0, 0, i
+            while j < len(tokens):
+                word = tokens[j]
+                if word in NUMBER_WORDS:
+                    current += NUMBER_WORDS[word]
+                elif word in MULTIPLIER_WORDS:
+                    multiplier = MULTIPLIER_WORDS[word]
+                    if multiplier == 1000:
+                        total += max(current, 1) * multiplier
+                        current = 0
+                    else:
+                        current = max(current, 1) * multiplier
+                elif word in NUMBER_JOINERS and j + 1 < len(tokens) and (
+                        tokens[j + 1] in NUMBER_WORDS or tokens[j + 1] in MULTIPLIER_WORDS):
+                    pass
+                else:
+                    break
+                used.add(j)
+                j += 1
+            amounts.append(float(total + current))
+            i = j
+            continue
+        i += 1
+    return amounts, used, has_currency, ambiguous
+
+
+def _category_keywords(category):
+    folded = _fold(str(category)).strip()
+    keywords = set(tokenize(str(category))) - FILLER_WORDS
+    keywords.add(folded)
+    parts = {part.strip() for part in folded.split(",")}
+    for name, words in CATEGORY_LEXICON.items():
+        if name == folded or name in parts:
+            keywords.update(words)
+    return keywords
+
+
+def build_index(categories):
+    """keyword -> set of caller categories the keyword points to."""
+    index = {}
+    for category in categories:
+        for keyword in _category_keywords(category):
+            index.setdefault(keyword, set()).add(category)
+    return index
+
+
+def fast_classify(text, categories):
+    """
+    Try to resolve a short expense locally. Returns (items, confidence);
+    items is None when no category could be matched.
+    """
+    words = TOKEN_RE.findall(text.casefold())
+    tokens = [_fold(word) for word in words]
+    if not tokens or not categories:
+        return None, 0.0
+
+    amounts, amount_indexes, has_currency, ambiguous = extract_amounts(tokens)
+    index = build_index(categories)
+    folded_text = " ".join(tokens)
+
+    votes = {}
+    for i, token in enumerate(tokens):
+        if i in amount_indexes:
+            continue
+        for category in index.get(token, ()):
+            votes[category] = votes.get(category, 0) + 1
+    # Multi-word keywords ("gas bill", "going out")
+    for keyword, matched in index.items():
+        if " " in keyword and keyword in folded_text:
+            for category in matched:
+                votes[category] = votes.get(category, 0) + 1
+
+    if not votes:
+        return None, 0.0
+
+    ranked = sorted(votes.items(), key=lambda kv: kv[1], reverse=True)
+    category = ranked[0][0]
+    unique = len(ranked) == 1 or ranked[0][1] > ranked[1][1]
+
+    confidence = 0.5 if unique else 0.2
+    if len(amounts) == 1:
+        confidence += 0.3
+    elif not amounts:
+        confidence += 0.1
+    if len(tokens) <= FAST_PATH_MAX_WORDS:
+        confidence += 0.1
+    if has_currency or len(amounts) == 1:
+        confidence += 0.1
+    if ambiguous:
+        confidence = min(confidence, AMBIGUOUS_AMOUNT_CONFIDENCE)
+    if NEGATION_WORDS.intersection(tokens):
+        confidence = min(confidence, NEGATION_CONFIDENCE)
+
+    item_words = [words[i] for i, t in enumerate(tokens) if i not in amount_indexes and t not in FILLER_WORDS]
+    item = " ".join(item_words) or text.strip()[:50]
+    items = [{
+        "category": category,
+        "item": item,
+        "amount": amounts[0] if len(amounts) == 1 else 0
+    }]
+    return items, round(min(confidence, 1.0), 2)
+
+
+def try_fast_path(text, categories, threshold=None):
+    """
+    Return classified items when the local classifier is confident enough,
+    otherwise None so the caller goes to the LLM. Counts attempts and hits.
+    """
+    if not FAST_PATH_ENABLED:
+        return None
+    threshold = FAST_PATH_THRESHOLD if threshold is None else threshold
+    items, confidence = fast_classify(text, categories)
+    hit = items is not None and confidence >= threshold
+    with _stats_lock:
+        _stats["attempts"] += 1
+        if hit:
+            _stats["hits"] += 1
+    if hit:
+        logger.info(f"Fast path resolved {text!r} with confidence {confidence}: {items}")
+        return items
+    logger.debug(f"Fast path declined {text!r} (confidence {confidence})")
+    return None
+
+
+def stats():
+    with _stats_lock:
+        result = dict(_stats)
+    result["hit_rate"] = round(result["hits"] / result["attempts"], 4) if result["attempts"] else 0.0
+    result["enabled"] = FAST_PATH_ENABLED
+    result["threshold"] = FAST_PATH_THRESHOLD
+    return result
+
+
+def _collect_attempts():
+    with _stats_lock:
+        return {("hit",): _stats["hits"], ("miss",): _stats["attempts"] - _stats["hits"]}
+
+
+metrics.registry.register(metrics.Counter(
+    "fast_path_attempts_total", "Inputs tried on the local fast path, by result (hit, miss)", ("result",),
+    collect=_collect_attempts,
+))
+metrics.registry.register(metrics.Gauge(
+    "fast_path_hit_rate", "Share of fast path attempts resolved without a model call",
+    collect=lambda: {(): stats()["hit_rate"]},
+))
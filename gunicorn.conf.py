@@ -0,0 +1,56 @@
+"""
+gunicorn settings for the production server (`python main.py` runs gunicorn
+with this file). Everything comes from the SERVE_* environment variables or
+.env, so the same settings work when gunicorn is started directly:
+
+    gunicorn -c gunicorn.conf.py "main:preload()"
+"""
+from dotenv import load_dotenv
+
+# Every module reads its settings at import, so .env has to be applied before
+# the app is preloaded; variables already set in the environment win
+load_dotenv()
+
+import os  # noqa: E402
+
+
+SERVE_HOST = os.getenv("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "5050"))
+# Worker processes forked from the preloaded master
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", str(os.cpu_count() or 1)))
+# Request threads per worker. Upstream calls run on each worker's pipeline
+# engine loop, so these threads mostly wait on it rather than compete for the GIL
+SERVE_THREADS = int(os.getenv("SERVE_THREADS", "16"))
+# Seconds a stopping worker keeps serving in-flight requests before it exits anyway
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+# Idle seconds before a keep-alive connection is closed and its thread freed
+SERVE_KEEPALIVE_SECONDS = int(os.getenv("SERVE_KEEPALIVE_SECONDS", "5"))
+SERVE_BACKLOG = int(os.getenv("SERVE_BACKLOG", "1024"))
+SERVE_ACCESS_LOG = os.getenv("SERVE_ACCESS_LOG", "false").lower() in ("1", "true", "yes")
+# Seconds a worker may go without notifying the master before it is killed and
+# replaced. Requests are bounded by REQUEST_BUDGET_SECONDS well below this
+SERVE_WORKER_TIMEOUT = int(os.getenv("SERVE_WORKER_TIMEOUT", "180"))
+
+bind = [f"[{SERVE_HOST}]:{SERVE_PORT}" if ":" in SERVE_HOST else f"{SERVE_HOST}:{SERVE_PORT}"]
+workers = max(1, SERVE_WORKERS)
+worker_class = "gthread"
+threads = max(1, SERVE_THREADS)
+backlog = SERVE_BACKLOG
+keepalive = SERVE_KEEPALIVE_SECONDS
+graceful_timeout = SERVE_GRACEFUL_TIMEOUT
+timeout = SERVE_WORKER_TIMEOUT
+accesslog = "-" if SERVE_ACCESS_LOG else None
+# The master imports and warms up the app once (SDKs, model clients, category
+# index); workers share that memory copy-on-write and start ready
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Imported here: this file is also read by gunicorn processes that never load the app
+    from main import warm_up_worker
+    warm_up_worker()
+
+
+def worker_exit(server, worker):
+    from main import finish_worker
+    finish_worker()
@@ -0,0 +1,642 @@
+"""
+Durable background jobs for /speech-to-text. The web tier spools the
+upload to disk, inserts a row into SQLite and answers 202 with the job id;
+worker processes, a separate process type, claim jobs, run the speech
+pipeline and store the result for GET /jobs/<id>. When the job has a
+callback URL the result is also POSTed there.
+
+    python main.py worker                     # one worker process; run as many as the queue needs
+
+Claims are leases renewed while the job runs. A worker that dies leaves
+its jobs to be claimed again once JOB_LEASE_SECONDS pass, up to
+JOB_MAX_ATTEMPTS times; failed upstream calls are retried with backoff
+the same way.
+"""
+from logger import logger
+from pipeline_engine import engine, request_budget
+from audio_upload import AudioBuffer
+from transcription import TranscriptionError, preprocess_audio_async, resolve_backend, transcribe_audio_async
+from translate_and_classify import response_flags, run_pipeline_async, warm_up_models
+from long_audio import transcribe_long_audio_async
+from expense_store import record_items
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import hmac
+import ipaddress
+import json
+import metrics
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from urllib.parse import urlparse
+
+
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "true").lower() in ("1", "true", "yes")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", os.path.join("data", "jobs.db"))
+# Uploads wait here until their job finishes; must be shared by the web and worker processes.
+# Both defaults are under data/, which is git-ignored; spooled audio is readable by the owner only
+JOBS_SPOOL_DIR = os.getenv("JOBS_SPOOL_DIR", os.path.join("data", "job_spool"))
+# Jobs one worker process runs at the same time; the pipeline stages still cap upstream calls
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "4"))
+# A running job whose lease is not renewed for this long is handed to another worker
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Seconds an idle worker waits before looking for new jobs again
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1.0"))
+# Time budget of one job attempt, in place of REQUEST_BUDGET_SECONDS; long recordings need more
+JOB_BUDGET_SECONDS = float(os.getenv("JOB_BUDGET_SECONDS", "600"))
+# Seconds a stopping worker waits for its running jobs before handing them back to the queue
+JOB_GRACEFUL_TIMEOUT = float(os.getenv("JOB_GRACEFUL_TIMEOUT", "60"))
+# Finished jobs (and their results) are deleted after this many seconds
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", str(7 * 86400)))
+# When set, callbacks carry X-Job-Signature: sha256=<HMAC of the body with this secret>
+JOB_CALLBACK_SECRET = os.getenv("JOB_CALLBACK_SECRET", "")
+# Comma-separated hosts (a leading dot allows subdomains) callbacks may go to. When
+# empty, any host is allowed whose addresses are all public; listed hosts skip that check
+JOB_CALLBACK_ALLOWED_HOSTS = [
+    host.strip().lower().rstrip(".") for host in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+JOB_CALLBACK_TIMEOUT_SECONDS = float(os.getenv("JOB_CALLBACK_TIMEOUT_SECONDS", "10"))
+JOB_CALLBACK_MAX_ATTEMPTS = int(os.getenv("JOB_CALLBACK_MAX_ATTEMPTS", "5"))
+
+# Backoff before retrying a failed attempt or callback: base * 2**(attempt - 1), capped
+RETRY_BASE_SECONDS = 15
+RETRY_MAX_SECONDS = 600
+PURGE_EVERY_SECONDS = 3600
+FINISHED = ("succeeded", "failed")
+
+JOBS_FINISHED = metrics.registry.register(metrics.Counter(
+    "jobs_finished_total", "Background jobs finished by kind and final status", ("kind", "status")))
+JOB_RETRIES = metrics.registry.register(metrics.Counter(
+    "job_retries_total", "Job attempts that failed transiently or were lost and were queued again", ("kind",)))
+JOB_DURATION = metrics.registry.register(metrics.Histogram(
+    "job_duration_seconds", "Wall time of one job attempt", ("kind",)))
+CALLBACKS = metrics.registry.register(metrics.Counter(
+    "job_callbacks_total", "Callback deliveries by outcome (delivered, retry, failed, rejected)", ("outcome",)))
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, params TEXT NOT NULL, audio_path TEXT, "
+    "attempts INTEGER NOT NULL DEFAULT 0, available_at REAL NOT NULL, lease_expires_at REAL, worker TEXT, "
+    "result TEXT, result_status INTEGER, error TEXT, "
+    "created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+    "callback_url TEXT, callback_status TEXT, callback_attempts INTEGER NOT NULL DEFAULT 0, callback_next_at REAL)",
+    # Claiming: queued jobs in order of availability, and running ones whose lease ran out
+    "CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs (status, available_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_callbacks ON jobs (callback_status, callback_next_at)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)",
+    # Progress snapshots of /speech-to-text/batch directory jobs, which run inside a web process
+    "CREATE TABLE IF NOT EXISTS batch_jobs ("
+    "id TEXT PRIMARY KEY, output_path TEXT NOT NULL, status TEXT NOT NULL, state TEXT NOT NULL, "
+    "updated_at REAL NOT NULL)",
+)
+
+
+def retry_delay(attempt):
+    return min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** max(0, attempt - 1))
+
+
+class JobStore:
+    """
+    Jobs in SQLite (WAL) with their uploads spooled next to it. Every
+    state change is one short transaction, so any number of web and worker
+    processes can share the database; BEGIN IMMEDIATE makes a claim atomic
+    across them. Commits are synchronous=FULL: a 202 promises the job
+    survives a crash.
+    """
+
+    def __init__(self, path, spool_dir):
+        self.path = path
+        self.spool_dir = spool_dir
+        self._local = threading.local()
+        for directory in (os.path.dirname(path), spool_dir):
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        # Uploaded voice notes are user data
+        os.chmod(spool_dir, 0o700)
+        conn = self._conn()
+        for statement in SCHEMA:
+            conn.execute(statement)
+        if hasattr(os, "register_at_fork"):
+            # Connections must not cross into a forked server worker
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._local = threading.local()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self, work):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = work(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _spool(self, job_id, audio):
+        """Copy the upload into the spool directory, durably, and return its path."""
+        ext = os.path.splitext(audio.filename)[1].lower()[:10]
+        path = os.path.join(self.spool_dir, job_id + ext)
+        partial = path + ".part"
+        with open(os.open(partial, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+            for chunk in audio.iter_chunks():
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, path)
+        return path
+
+    def submit(self, kind, params, audio=None, callback_url=None):
+        """Persist a new job (and its audio) and return its public dict."""
+        job_id = uuid.uuid4().hex
+        audio_path = self._spool(job_id, audio) if audio is not None else None
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT INTO jobs (id, kind, status, params, audio_path, available_at, created_at, callback_url, "
+                "callback_status) VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), audio_path, now, now, callback_url,
+                 "pending" if callback_url else None),
+            )
+        except sqlite3.Error:
+            if audio_path:
+                os.remove(audio_path)
+            raise
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Public view of a job for polling and callbacks; None when unknown."""
+        row = self._conn().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _public(row) if row is not None else None
+
+    def claim(self, worker):
+        """Lease the next ready job to `worker`; None when there is nothing to do."""
+        def work(conn):
+            now = time.time()
+            self._requeue_expired(conn, now)
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = 'queued' AND available_at <= ? ORDER BY available_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                "lease_expires_at = ?, started_at = ? WHERE id = ?",
+                (worker, now + JOB_LEASE_SECONDS, now, row["id"]),
+            )
+            return {**dict(row), "attempts": row["attempts"] + 1, "params": json.loads(row["params"])}
+        return self._transaction(work)
+
+    def _requeue_expired(self, conn, now):
+        """Jobs of workers that stopped renewing their lease go back to the queue, or fail after the last attempt."""
+        for row in conn.execute(
+            "SELECT id, kind, attempts FROM jobs WHERE status = 'running' AND lease_expires_at < ?", (now,)
+        ).fetchall():
+            if row["attempts"] >= JOB_MAX_ATTEMPTS:
+                self._finish(conn, row["id"], row["kind"], "failed", None, None,
+                             f"Abandoned by its worker {row['attempts']} times", now)
+            else:
+                logger.warning(f"Job {row['id']} lost its worker, queueing it again")
+                JOB_RETRIES.inc(kind=row["kind"])
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires_at = NULL, available_at = ? "
+                    "WHERE id = ?", (now, row["id"]))
+
+    def renew(self, job_ids, worker):
+        """Extend the leases `worker` holds on job_ids."""
+        if job_ids:
+            self._conn().executemany(
+                "UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                [(time.time() + JOB_LEASE_SECONDS, job_id, worker) for job_id in job_ids],
+            )
+
+    def complete(self, job, worker, result_status, result, error=None, retryable=False):
+        """
+        Record the outcome of an attempt. A retryable failure with attempts
+        left goes back to the queue after a backoff instead. Returns the
+        job's new status, or None when the lease had already been lost.
+        """
+        def work(conn):
+            row = conn.execute("SELECT worker, status FROM jobs WHERE id = ?", (job["id"],)).fetchone()
+            if row is None or row["worker"] != worker or row["status"] != "running":
+                return None
+            now = time.time()
+            if retryable and job["attempts"] < JOB_MAX_ATTEMPTS:
+                JOB_RETRIES.inc(kind=job["kind"])
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires_at = NULL, available_at = ?, "
+                    "error = ? WHERE id = ?", (now + retry_delay(job["attempts"]), error, job["id"]))
+                return "queued"
+            status = "succeeded" if result_status < 400 else "failed"
+            self._finish(conn, job["id"], job["kind"], status, result_status, result, error, now)
+            return status
+        return self._transaction(work)
+
+    def release(self, job_ids, worker):
+        """Hand unfinished jobs back to the queue without counting the attempt (worker shutdown)."""
+        if job_ids:
+            self._conn().executemany(
+                "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires_at = NULL, available_at = ?, "
+                "attempts = attempts - 1 WHERE id = ? AND worker = ? AND status = 'running'",
+                [(time.time(), job_id, worker) for job_id in job_ids],
+            )
+
+    def _finish(self, conn, job_id, kind, status, result_status, result, error, now):
+        conn.execute(
+            "UPDATE jobs SET status = ?, result_status = ?, result = ?, error = ?, finished_at = ?, "
+            "worker = NULL, lease_expires_at = NULL, callback_next_at = ? WHERE id = ?",
+            (status, result_status, json.dumps(result) if result is not None else None, error, now, now, job_id),
+        )
+        JOBS_FINISHED.inc(kind=kind, status=status)
+        path = conn.execute("SELECT audio_path FROM jobs WHERE id = ?", (job_id,)).fetchone()["audio_path"]
+        if path:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def due_callbacks(self, limit=16):
+        """Finished jobs whose callback is due, as (job_id, url, attempts)."""
+        return [tuple(row) for row in self._conn().execute(
+            "SELECT id, callback_url, callback_attempts FROM jobs "
+            "WHERE callback_status = 'pending' AND callback_next_at <= ? LIMIT ?", (time.time(), limit))]
+
+    def callback_result(self, job_id, delivered, attempts):
+        """Record one delivery attempt; undelivered callbacks are retried with backoff until they run out."""
+        if delivered:
+            status, next_at = "delivered", None
+        elif attempts >= JOB_CALLBACK_MAX_ATTEMPTS:
+            status, next_at = "failed", None
+        else:
+            status, next_at = "pending", time.time() + retry_delay(attempts)
+        self._conn().execute(
+            "UPDATE jobs SET callback_status = ?, callback_attempts = ?, callback_next_at = ? WHERE id = ?",
+            (status, attempts, next_at, job_id))
+        return status
+
+    def purge(self, older_than=JOB_RETENTION_SECONDS):
+        """Delete jobs finished more than `older_than` seconds ago; returns how many."""
+        conn = self._conn()
+        cutoff = time.time() - older_than
+        conn.execute("DELETE FROM batch_jobs WHERE updated_at < ? AND status != 'running'", (cutoff,))
+        return conn.execute(
+            "DELETE FROM jobs WHERE finished_at < ? AND (callback_status IS NULL OR callback_status != 'pending')",
+            (cutoff,)).rowcount
+
+    def save_batch(self, state):
+        """Store the as_dict() snapshot of a batch directory job so any server process can report it."""
+        self._conn().execute(
+            "INSERT INTO batch_jobs (id, output_path, status, state, updated_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(id) DO UPDATE SET status = excluded.status, state = excluded.state, "
+            "updated_at = excluded.updated_at",
+            (state["job_id"], state["output"], state["status"], json.dumps(state), time.time()))
+
+    def get_batch(self, job_id):
+        row = self._conn().execute("SELECT state FROM batch_jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row["state"]) if row is not None else None
+
+    def running_batch(self, output_path):
+        """Id of the batch job recorded as running for output_path, if any."""
+        row = self._conn().execute(
+            "SELECT id FROM batch_jobs WHERE output_path = ? AND status = 'running' ORDER BY updated_at DESC LIMIT 1",
+            (output_path,)).fetchone()
+        return row["id"] if row is not None else None
+
+    def stats(self):
+        counts = dict.fromkeys(("queued", "running", *FINISHED), 0)
+        counts.update(self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return counts
+
+
+def _public(row):
+    job = {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "created_at": row["created_at"],
+        "started_at": row["started_at"],
+        "finished_at": row["finished_at"],
+    }
+    if row["status"] in FINISHED:
+        job["result_status"] = row["result_status"]
+        job["result"] = json.loads(row["result"]) if row["result"] else None
+    if row["error"]:
+        job["error"] = row["error"]
+    if row["callback_url"]:
+        job["callback"] = {"status": row["callback_status"], "attempts": row["callback_attempts"]}
+    return job
+
+
+_job_store = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store():
+    """
+    The process-wide JobStore, opened on first use (the server opens it in its
+    preload step); None when background jobs are disabled.
+    """
+    global _job_store
+    if _job_store is None and JOBS_ENABLED and JOBS_DB_PATH:
+        with _job_store_lock:
+            if _job_store is None:
+                _job_store = JobStore(JOBS_DB_PATH, JOBS_SPOOL_DIR)
+    return _job_store
+
+
+metrics.registry.register(metrics.Gauge(
+    "jobs_in_queue", "Background jobs by status in the shared job database", ("status",),
+    # A scrape reports the store once something opened it, it does not open it
+    collect=lambda: {(status,): count for status, count in _job_store.stats().items()} if _job_store else {},
+))
+
+
+##### SPEECH JOBS #####
+async def process_speech_job(job):
+    """
+    Run the /speech-to-text pipeline for a spooled upload. Returns
+    (http_status, body, retryable) with the body the synchronous endpoint
+    would have answered; retryable marks upstream failures worth another
+    attempt.
+    """
+    params = job["params"]
+    audio = AudioBuffer.from_path(job["audio_path"], params.get("content_type"))
+    audio.filename = params.get("filename") or audio.filename
+    categories, backend, mode = params["categories"], params.get("backend"), params.get("mode")
+    bypass_cache = params.get("bypass_cache", False)
+    try:
+        with request_budget(JOB_BUDGET_SECONDS):
+            prepared, preprocessing = await preprocess_audio_async(audio)
+            if not preprocessing["speech_detected"]:
+                return 400, {
+                    "error": "No speech detected",
+                    "details": "The audio file contains only silence",
+                    "original_text": "",
+                    "translated_text": "",
+                    "classified_items": [],
+                    "audio_preprocessing": preprocessing
+                }, False
+            try:
+                chunked = await transcribe_long_audio_async(prepared, categories, backend, mode, bypass_cache=bypass_cache,
+                                                            seconds=preprocessing.get("seconds_out"))
+                transcript = chunked["original_text"] if chunked else await transcribe_audio_async(prepared, backend)
+            except TranscriptionError as e:
+                return 500, {"error": "Speech-to-text service unavailable", "details": str(e)}, True
+
+            transcript = (transcript or "").strip()
+            if not transcript:
+                return 400, {
+                    "error": "No speech detected",
+                    "details": "The audio file did not produce any transcribed text",
+                    "original_text": "",
+                    "translated_text": "",
+                    "classified_items": []
+                }, False
+            if chunked:
+                chunked["audio_preprocessing"] = preprocessing
+                record_items(chunked["classified_items"], params.get("user_id"), "speech_job")
+                return 200, chunked, False
+
+            translation, items = await run_pipeline_async(transcript, categories, mode, bypass_cache=bypass_cache)
+            if translation.get("status") == "error":
+                return 500, {
+                    "error": "Translation failed",
+                    "details": translation.get("error"),
+                    "original_text": transcript,
+                    "translated_text": "",
+                    "classified_items": []
+                }, True
+            translated_text = translation.get("translated_text", transcript)
+            if not items:
+                items = [{"category": categories[0], "item": translated_text[:50], "amount": 0}]
+            record_items(items, params.get("user_id"), "speech_job")
+            result = {
+                "original_text": transcript,
+                "translated_text": translated_text,
+                "classified_items": items,
+                "audio_preprocessing": preprocessing,
+                "status": "success"
+            }
+            result.update(response_flags(translation))
+            return 200, result, False
+    finally:
+        audio.close()
+
+
+HANDLERS = {"speech": process_speech_job}
+
+
+##### CALLBACKS #####
+def _host_allowed(host):
+    return any(host == allowed or (allowed.startswith(".") and host.endswith(allowed))
+               for allowed in JOB_CALLBACK_ALLOWED_HOSTS)
+
+
+def callback_url_error(url, resolve=True):
+    """
+    Why `url` may not receive callbacks, or None when it may. Callbacks go
+    out from inside the deployment, so unless the host is in
+    JOB_CALLBACK_ALLOWED_HOSTS every address it resolves to must be public:
+    no loopback, private, link-local (cloud metadata), multicast or reserved
+    ranges. resolve=False checks literal addresses only (request time);
+    delivery resolves the name again right before connecting.
+    """
+    return _check_callback_url(url, resolve)[0]
+
+
+def _check_callback_url(url, resolve):
+    """(error or None, whether the error is permanent); a failed lookup may succeed later."""
+    parsed = urlparse(url)
+    try:
+        host = (parsed.hostname or "").rstrip(".")
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+    except ValueError:
+        host = ""
+    if parsed.scheme not in ("http", "https") or not host:
+        return "callback_url must be an absolute http(s) URL", True
+    if JOB_CALLBACK_ALLOWED_HOSTS:
+        return (None, False) if _host_allowed(host) else (f"callback host {host} is not in JOB_CALLBACK_ALLOWED_HOSTS", True)
+    try:
+        addresses = [ipaddress.ip_address(host)]
+    except ValueError:
+        if host == "localhost" or host.endswith(".localhost"):
+            return f"callback host {host} is not public", True
+        if not resolve:
+            return None, False
+        try:
+            infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+        except (OSError, UnicodeError) as e:
+            return f"cannot resolve callback host {host}: {e}", False
+        addresses = [ipaddress.ip_address(info[4][0].split("%")[0]) for info in infos]
+    for address in addresses:
+        if not address.is_global or address.is_multicast:
+            return f"callback host {host} resolves to non-public address {address}", True
+    return None, False
+
+
+def deliver_callback(store, job_id, url, attempts):
+    """POST the finished job to its callback URL once; any 2xx counts as delivered, redirects are not followed."""
+    import requests
+    rejected, permanent = _check_callback_url(url, resolve=True)
+    if rejected:
+        # A refused address is not retried; a failed lookup is, like a failed POST
+        status = store.callback_result(job_id, False, max(attempts + 1, JOB_CALLBACK_MAX_ATTEMPTS) if permanent
+                                       else attempts + 1)
+        CALLBACKS.inc(outcome="rejected" if permanent else ("failed" if status == "failed" else "retry"))
+        logger.warning(f"Callback for job {job_id} to {url} not sent ({rejected}), {status}")
+        return
+    body = json.dumps(store.get(job_id)).encode()
+    headers = {"Content-Type": "application/json", "X-Job-Id": job_id}
+    if JOB_CALLBACK_SECRET:
+        digest = hmac.new(JOB_CALLBACK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        headers["X-Job-Signature"] = f"sha256={digest}"
+    try:
+        response = requests.post(url, data=body, headers=headers, timeout=JOB_CALLBACK_TIMEOUT_SECONDS,
+                                 allow_redirects=False)
+        delivered = 200 <= response.status_code < 300
+        reason = f"HTTP {response.status_code}"
+    except requests.RequestException as e:
+        delivered, reason = False, str(e)
+    status = store.callback_result(job_id, delivered, attempts + 1)
+    outcome = "delivered" if delivered else ("failed" if status == "failed" else "retry")
+    CALLBACKS.inc(outcome=outcome)
+    if not delivered:
+        logger.warning(f"Callback for job {job_id} to {url} failed ({reason}), {status}")
+
+
+##### WORKER #####
+class JobWorker:
+    """
+    One worker process: claims up to `concurrency` jobs, runs them on the
+    pipeline engine loop, renews their leases and delivers callbacks.
+    stop() lets running jobs finish for up to JOB_GRACEFUL_TIMEOUT and
+    hands the rest back to the queue.
+    """
+
+    def __init__(self, store, concurrency=JOB_WORKER_CONCURRENCY):
+        self.store = store
+        self.concurrency = max(1, concurrency)
+        self.name = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.running = {}
+        self.stopping = False
+        self._callbacks = ThreadPoolExecutor(2, thread_name_prefix="job-callback")
+        self._delivering = set()
+
+    def stop(self, *args):
+        # Only a flag: this runs as a signal handler
+        self.stopping = True
+
+    def _start(self, job):
+        handler = HANDLERS.get(job["kind"])
+        logger.info(f"Job {job['id']} ({job['kind']}) attempt {job['attempts']} started")
+        started = time.perf_counter()
+
+        async def attempt():
+            try:
+                if handler is None:
+                    return 400, {"error": f"Unknown job kind '{job['kind']}'"}, False
+                return await handler(job)
+            finally:
+                JOB_DURATION.observe(time.perf_counter() - started, kind=job["kind"])
+
+        self.running[job["id"]] = (job, engine.submit(attempt()))
+
+    def _collect(self):
+        for job_id, (job, future) in list(self.running.items()):
+            if not future.done():
+                continue
+            del self.running[job_id]
+            try:
+                result_status, body, retryable = future.result()
+                error = body.get("error") if result_status >= 400 else None
+            except Exception as e:
+                logger.exception(f"Job {job_id} failed")
+                result_status, body, retryable, error = 500, None, True, f"{type(e).__name__}: {e}"
+            status = self.store.complete(job, self.name, result_status, body, error, retryable)
+            logger.info(f"Job {job_id} attempt {job['attempts']} finished with {result_status}: {status}")
+
+    def _deliver_callbacks(self):
+        for job_id, url, attempts in self.store.due_callbacks():
+            if job_id in self._delivering:
+                continue
+            self._delivering.add(job_id)
+            future = self._callbacks.submit(deliver_callback, self.store, job_id, url, attempts)
+            future.add_done_callback(lambda _, job_id=job_id: self._delivering.discard(job_id))
+
+    def run(self):
+        logger.info(f"Job worker {self.name} started with concurrency {self.concurrency}")
+        renewed = purged = 0.0
+        while not self.stopping:
+            self._collect()
+            claimed = False
+            while len(self.running) < self.concurrency:
+                job = self.store.claim(self.name)
+                if job is None:
+                    break
+                self._start(job)
+                claimed = True
+            now = time.monotonic()
+            if now - renewed >= JOB_LEASE_SECONDS / 3:
+                self.store.renew(list(self.running), self.name)
+                renewed = now
+            if now - purged >= PURGE_EVERY_SECONDS:
+                purged = now
+                removed = self.store.purge()
+                if removed:
+                    logger.info(f"Purged {removed} finished jobs")
+            self._deliver_callbacks()
+            if not claimed:
+                time.sleep(JOB_POLL_SECONDS)
+        self._drain()
+
+    def _drain(self):
+        deadline = time.monotonic() + JOB_GRACEFUL_TIMEOUT
+        logger.info(f"Job worker {self.name} stopping, {len(self.running)} jobs running")
+        while self.running and time.monotonic() < deadline:
+            self._collect()
+            self.store.renew(list(self.running), self.name)
+            time.sleep(0.2)
+        if self.running:
+            logger.warning(f"Handing {len(self.running)} unfinished jobs back to the queue")
+            for _, future in self.running.values():
+                future.cancel()
+            self.store.release(list(self.running), self.name)
+            self.running.clear()
+        self._callbacks.shutdown(wait=True)
+
+
+def run_worker(concurrency=JOB_WORKER_CONCURRENCY):
+    """Process jobs until SIGTERM/SIGINT."""
+    store = get_job_store()
+    if store is None:
+        raise SystemExit("Background jobs are disabled (JOBS_ENABLED / JOBS_DB_PATH)")
+    import local_stt
+
+    worker = JobWorker(store, concurrency)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    warm_up_models()
+    if resolve_backend() == "local":
+        local_stt.warm_up()
+    try:
+        worker.run()
+    finally:
+        local_stt.shutdown()
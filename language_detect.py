@@ -0,0 +1,71 @@
+import os
+import re
+
+
+LANGUAGE_DETECTION_ENABLED = os.getenv("LANGUAGE_DETECTION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Scores below this margin are reported as "unknown"
+MIN_MARGIN = 1.0
+
+ROMANIAN_DIACRITICS = set("ăâîșşțţ")
+
+ENGLISH_STOPWORDS = {
+    "the", "a", "an", "and", "or", "of", "to", "in", "on", "at", "for", "with", "from", "by",
+    "i", "you", "he", "she", "we", "they", "it", "my", "our", "your", "his", "her", "their",
+    "is", "was", "were", "are", "be", "been", "have", "has", "had", "do", "did", "this", "that",
+    "these", "those", "some", "today", "yesterday", "spent", "paid", "bought", "buy", "got",
+    "went", "out", "friends", "just", "also", "about", "per", "week", "month", "dollars",
+    "bucks", "me", "us", "what", "which", "who", "when", "there", "here", "like", "lunch", "dinner",
+}
+
+ROMANIAN_STOPWORDS = {
+    "si", "și", "de", "la", "pe", "cu", "din", "in", "în", "un", "o", "una", "niste", "niște",
+    "am", "ai", "au", "a", "este", "e", "sunt", "era", "fost", "eu", "tu", "el", "ea", "noi",
+    "voi", "ei", "ele", "meu", "mea", "mei", "mele", "nostru", "noastra", "noastră", "azi",
+    "astazi", "astăzi", "ieri", "cheltuit", "platit", "plătit", "cumparat", "cumpărat", "pentru",
+    "care", "ce", "cand", "când", "mai", "foarte", "prietenii", "prieteni", "lei", "bani",
+    "iar", "dar", "sau", "acasa", "acasă", "luna", "săptămâna", "saptamana",
+}
+
+# Word endings that are frequent in one language and rare in the other
+ENGLISH_SUFFIXES = ("ing", "ed", "ght", "tion", "ly", "ies", "th")
+ROMANIAN_SUFFIXES = ("ul", "ului", "ilor", "lor", "ii", "eau", "are", "ele", "ție", "tie", "esc", "ească", "uri")
+ENGLISH_BIGRAMS = ("th", "wh", "sh", "ck", "ee", "oo", "ou", "w", "y")
+ROMANIAN_BIGRAMS = ("ce", "ci", "ea", "ii", "âi", "ie", "ș", "ț", "ă", "î")
+
+WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def score_language(text):
+    """Return (english_score, romanian_score) for a piece of text."""
+    lowered = text.casefold()
+    words = WORD_RE.findall(lowered)
+    english = romanian = 0.0
+
+    romanian += 3.0 * sum(1 for char in lowered if char in ROMANIAN_DIACRITICS)
+    for word in words:
+        if word in ENGLISH_STOPWORDS:
+            english += 2.0
+        if word in ROMANIAN_STOPWORDS:
+            romanian += 2.0
+        if len(word) > 3:
+            if word.endswith(ENGLISH_SUFFIXES):
+                english += 1.0
+            if word.endswith(ROMANIAN_SUFFIXES):
+                romanian += 1.0
+        english += 0.25 * sum(1 for gram in ENGLISH_BIGRAMS if gram in word)
+        romanian += 0.25 * sum(1 for gram in ROMANIAN_BIGRAMS if gram in word)
+    return english, romanian
+
+
+def detect_language(text):
+    """
+    Classify text as "en", "ro" or "unknown" with stopword, diacritic and
+    character n-gram scoring. Pure Python, tens of microseconds per call.
+    Always "unknown" when LANGUAGE_DETECTION_ENABLED is off.
+    """
+    if not LANGUAGE_DETECTION_ENABLED:
+        return "unknown"
+    english, romanian = score_language(text or "")
+    if abs(english - romanian) < MIN_MARGIN:
+        return "unknown"
+    return "en" if english > romanian else "ro"
@@ -0,0 +1,219 @@
+from audio_preprocess import decode_pcm
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+
+# Offline engine used by the "local" transcription backend: whisper_cpp, vosk or sphinx
+LOCAL_STT_ENGINE = os.getenv("LOCAL_STT_ENGINE", "whisper_cpp").strip().lower()
+# whisper_cpp: model name ("base", "small") or ggml file; vosk: model directory; sphinx: unused
+LOCAL_STT_MODEL = os.getenv("LOCAL_STT_MODEL", "")
+# Empty lets whisper auto-detect; sphinx reads it as the name of a speech_recognition
+# pocketsphinx-data directory (fr-FR) and uses pocketsphinx's bundled en-us model otherwise
+LOCAL_STT_LANGUAGE = os.getenv("LOCAL_STT_LANGUAGE", "")
+LOCAL_STT_WORKERS = int(os.getenv("LOCAL_STT_WORKERS", str(max(1, min(4, os.cpu_count() or 1)))))
+# Decoder threads inside each worker process (whisper_cpp only)
+LOCAL_STT_THREADS = int(os.getenv("LOCAL_STT_THREADS", str(max(1, (os.cpu_count() or 1) // LOCAL_STT_WORKERS))))
+# forkserver starts workers from a clean single-threaded process; spawn where it is unavailable
+LOCAL_STT_START_METHOD = os.getenv("LOCAL_STT_START_METHOD", "forkserver")
+# How long warm_up() waits for every worker to load its model (a first run may download it)
+LOCAL_STT_LOAD_TIMEOUT_SECONDS = float(os.getenv("LOCAL_STT_LOAD_TIMEOUT_SECONDS", "300"))
+
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+DEFAULT_MODELS = {"whisper_cpp": "base", "vosk": "models/vosk", "sphinx": ""}
+
+
+class LocalSTTUnavailable(Exception):
+    """The configured engine or its model could not be loaded in the worker."""
+
+
+def _load_whisper_cpp():
+    import numpy as np
+    from pywhispercpp.model import Model
+
+    options = {"n_threads": LOCAL_STT_THREADS, "print_progress": False, "print_realtime": False}
+    if LOCAL_STT_LANGUAGE:
+        options["language"] = LOCAL_STT_LANGUAGE.split("-")[0]
+    model = Model(LOCAL_STT_MODEL or DEFAULT_MODELS["whisper_cpp"], **options)
+
+    def recognize(pcm):
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        return " ".join(segment.text.strip() for segment in model.transcribe(samples))
+
+    return recognize
+
+
+def _load_vosk():
+    from vosk import KaldiRecognizer, Model, SetLogLevel
+
+    SetLogLevel(-1)
+    model = Model(LOCAL_STT_MODEL or DEFAULT_MODELS["vosk"])
+
+    def recognize(pcm):
+        recognizer = KaldiRecognizer(model, SAMPLE_RATE)
+        recognizer.AcceptWaveform(pcm)
+        return json.loads(recognizer.FinalResult()).get("text", "")
+
+    return recognize
+
+
+def _load_sphinx():
+    # pocketsphinx >= 5 API (Decoder keyword arguments)
+    import speech_recognition
+    from pocketsphinx import Decoder, get_model_path
+
+    data = os.path.join(os.path.dirname(speech_recognition.__file__), "pocketsphinx-data", LOCAL_STT_LANGUAGE)
+    if LOCAL_STT_LANGUAGE and os.path.isdir(data):
+        model = {
+            "hmm": os.path.join(data, "acoustic-model"),
+            "lm": os.path.join(data, "language-model.lm.bin"),
+            "dict": os.path.join(data, "pronounciation-dictionary.dict"),
+        }
+    else:
+        bundled = get_model_path("en-us")
+        model = {
+            "hmm": os.path.join(bundled, "en-us"),
+            "lm": os.path.join(bundled, "en-us.lm.bin"),
+            "dict": os.path.join(bundled, "cmudict-en-us.dict"),
+        }
+    decoder = Decoder(logfn=os.devnull, **model)
+
+    def recognize(pcm):
+        decoder.start_utt()
+        decoder.process_raw(pcm, False, True)
+        decoder.end_utt()
+        hypothesis = decoder.hyp()
+        return hypothesis.hypstr if hypothesis is not None else ""
+
+    return recognize
+
+
+# Engine name -> loader returning recognize(pcm) -> text; runs once per worker process
+ENGINES = {
+    "whisper_cpp": _load_whisper_cpp,
+    "vosk": _load_vosk,
+    "sphinx": _load_sphinx,
+}
+
+# Worker-process state, set by _init_worker
+_recognize = None
+_load_error = None
+
+
+def _init_worker(engine_name, load, reports):
+    # A failed load is kept and reported per job: raising here would break the whole pool
+    global _recognize, _load_error
+    try:
+        _recognize = load()
+    except Exception as e:
+        _load_error = f"{engine_name}: {type(e).__name__}: {e}"
+    # Tells warm_up() this worker is done loading, whichever tasks it ends up running
+    reports.put((os.getpid(), _load_error))
+
+
+def _transcribe_job(data, filename):
+    """Worker side: returns (transcript, audio_seconds, decode_seconds)."""
+    if _recognize is None:
+        raise LocalSTTUnavailable(_load_error or "engine not loaded")
+    pcm = decode_pcm(data, filename, SAMPLE_RATE)
+    started = time.perf_counter()
+    text = _recognize(pcm)
+    return text.strip(), len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH), time.perf_counter() - started
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Model load reports from the workers (queue) and those warm_up() has read (pid -> error)
+_reports = None
+_loaded = {}
+
+
+def get_pool():
+    """The shared worker pool, started on first use with LOCAL_STT_WORKERS processes."""
+    global _pool, _reports
+    with _pool_lock:
+        if _pool is None:
+            if LOCAL_STT_ENGINE not in ENGINES:
+                raise LocalSTTUnavailable(
+                    f"Unknown LOCAL_STT_ENGINE '{LOCAL_STT_ENGINE}', expected one of {', '.join(ENGINES)}")
+            method = LOCAL_STT_START_METHOD
+            if method not in multiprocessing.get_all_start_methods():
+                method = "spawn"
+            context = multiprocessing.get_context(method)
+            _reports = context.Queue()
+            _loaded.clear()
+            _pool = ProcessPoolExecutor(
+                max_workers=LOCAL_STT_WORKERS,
+                mp_context=context,
+                initializer=_init_worker,
+                initargs=(LOCAL_STT_ENGINE, ENGINES[LOCAL_STT_ENGINE], _reports),
+            )
+        return _pool
+
+
+def warm_up():
+    """
+    Start every worker and wait until each has loaded its model, instead of
+    loading on the first request. Returns the worker pids; raises
+    LocalSTTUnavailable if any worker could not load the engine in time. Must not run at import time of the main module,
+    which worker processes import as well.
+    """
+    pool = get_pool()
+    # The pool starts a process for each task submitted while none is idle, so
+    # this starts them all; any one of them may answer several of the tasks
+    for future in [pool.submit(os.getpid) for _ in range(LOCAL_STT_WORKERS)]:
+        future.result()
+    # Every worker reports once its initializer has loaded (or failed to load) the model
+    deadline = time.monotonic() + LOCAL_STT_LOAD_TIMEOUT_SECONDS
+    while len(_loaded) < LOCAL_STT_WORKERS:
+        try:
+            pid, error = _reports.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            raise LocalSTTUnavailable(
+                f"{LOCAL_STT_WORKERS - len(_loaded)} worker(s) did not load the model "
+                f"within {LOCAL_STT_LOAD_TIMEOUT_SECONDS}s") from None
+        _loaded[pid] = error
+    errors = [error for error in _loaded.values() if error]
+    if errors:
+        raise LocalSTTUnavailable(errors[0])
+    return sorted(_loaded)
+
+
+def _forget_pool():
+    # The parent's workers and queues are not usable from a forked process
+    global _pool, _pool_lock, _reports
+    _pool = None
+    _pool_lock = threading.Lock()
+    _reports = None
+    _loaded.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_pool)
+
+
+def shutdown():
+    global _pool, _reports
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+            _pool = None
+            _reports = None
+            _loaded.clear()
+
+
+async def transcribe_async(audio):
+    """
+    Transcribe an AudioBuffer in the worker pool. Decoding and recognition
+    run in the worker, so neither blocks the event loop or holds the GIL.
+    Returns (transcript, audio_seconds, decode_seconds).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(), _transcribe_job, audio.read_all(), audio.filename)
@@ -0,0 +1,466 @@
+"""
+Offline analytics over logs/app.log: rebuilds one record per request
+(transcript, translation, raw model responses, final classification,
+errors) from the multi-line loguru text format, or the one-object-per-line
+format LOG_JSON=true writes, and writes them as JSONL or Parquet.
+
+    python log_analytics.py logs/app.log logs/app.2025-*.log --output requests.jsonl --workers 8
+
+Files are memory-mapped and cut into chunks at entry boundaries; chunks are
+scanned in parallel worker processes and stitched back together in order,
+so a request whose lines straddle a chunk boundary still becomes one
+record. Pass files oldest first, the live app.log last.
+
+The log has no request ids: lines are grouped by the order in which a
+request's messages appear, which is exact for one request at a time and
+best-effort when concurrent requests interleave. Standard library only,
+apart from pyarrow for Parquet output; nothing from the app is imported,
+so running it never writes to the log it reads.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import ast
+import json
+import mmap
+import os
+import re
+import sys
+import time
+
+
+CHUNK_BYTES = 64 * 1024 * 1024
+
+# LOG_JSON lines are loguru's serialized records: {"text": "<the text-format entry>", "record": {...}}
+JSON_PREFIX = b'{"text": "'
+# "2025-09-20 17:32:51.145 | DEBUG    | module:function:104 - message", either bare or as
+# the start of a LOG_JSON line. Headers hold nothing JSON escapes, so one pattern reads both
+HEADER_RE = re.compile(
+    rb'^(?:\{"text": ")?(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3}) \| ([A-Z]+) *\| [^\n]*? - ', re.M)
+# Start of the first entry at or after an offset
+ENTRY_START_RE = re.compile(rb'\n(?=(?:\{"text": ")?\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d{3} \| )')
+# Messages worth keeping, by kind; everything else below WARNING is skipped without decoding
+MESSAGE_RE = re.compile(
+    rb"(?P<restart>Starting Flask server|GEMINI_API_KEY found)"
+    rb"|(?P<request>Incoming request data: )"
+    rb"|(?P<audio>Processing audio file: )"
+    rb"|(?P<audio_stream>Streaming audio file: )"
+    rb"|(?P<batch>Batch of \d+ records)"
+    rb"|(?P<pipeline>Running \w+ pipeline)"
+    rb"|(?P<transcript>(?:Final transcript \(length: \d+\)|SDK transcription successful"
+    rb"|API transcription successful|Local transcription successful): )"
+    rb"|(?P<translation_raw>Translation response received: )"
+    rb"|(?P<translation>Translation result: )"
+    rb"|(?P<english>Input detected as English)"
+    rb"|(?P<translated_text>Processing text for classification: )"
+    rb"|(?P<raw_response>(?:Raw model response|Raw fused model response|Raw response was): )"
+    rb"|(?P<items>(?:Final cleaned results|Classification result|Streamed classification results): )"
+    rb"|(?P<fallback>(?:Using fallback result|Exception fallback result): )"
+    rb"|(?P<final>Final result: )"
+    rb"|(?P<fast_path>Fast path resolved )"
+)
+HARD_STARTS = {"restart", "request", "audio", "audio_stream", "batch"}
+# Start a record unless the open one is a speech request still waiting for its pipeline
+SOFT_STARTS = {"pipeline", "fast_path"}
+PROBLEM_LEVELS = {b"WARNING", b"ERROR", b"CRITICAL"}
+TRUNCATED_RE = re.compile(r"\.\.\. \[\+\d+ chars\]$")
+
+FIELDS = (
+    "id", "file", "offset", "started_at", "ended_at", "source", "mode", "audio_file", "original_text",
+    "categories", "transcript", "translation_raw", "translated_text", "raw_responses", "classified_items",
+    "fallback", "fast_path", "truncated", "errors", "warnings", "status",
+)
+# Nested fields; stored as JSON text in Parquet
+JSON_FIELDS = ("categories", "raw_responses", "classified_items", "errors", "warnings")
+
+
+def _literal(text):
+    """(value, truncated): a Python literal logged with str()/repr(), else the text itself."""
+    if TRUNCATED_RE.search(text):
+        return text, True
+    if text[:1] in "[{'\"":
+        try:
+            return ast.literal_eval(text), False
+        except (ValueError, SyntaxError, MemoryError, RecursionError):
+            pass
+    return text, False
+
+
+def _problem(level, message):
+    """First line of a WARNING/ERROR message plus the exception line that ends its traceback."""
+    lines = message.splitlines()
+    summary = lines[0] if lines else ""
+    for line in reversed(lines[1:]):
+        if line and not line[0].isspace() and not line.startswith(("Traceback", "│", "└", "├", ">")):
+            if line != summary:
+                summary = f"{summary} ({line.strip()})"
+            break
+    return {"level": level, "message": summary}
+
+
+def align(mm, offset):
+    """Offset of the first log entry starting at or after `offset`."""
+    if offset <= 0:
+        return 0
+    match = ENTRY_START_RE.search(mm, offset - 1)
+    return match.end() if match else len(mm)
+
+
+def _json_body(line, body_offset):
+    """
+    Message body of a LOG_JSON line from `body_offset` (counted from the line
+    start) on, like the text format's; None for a line that is not valid JSON.
+    """
+    try:
+        text = json.loads(line.decode("utf-8", "replace"))["text"]
+    except (ValueError, KeyError, TypeError):
+        return None
+    # The header and message marker were not escaped, so they are as long in "text"
+    return text.encode("utf-8")[body_offset - len(JSON_PREFIX):].decode("utf-8", "replace").rstrip("\n")
+
+
+def iter_events(mm, start, end):
+    """
+    (offset, time, level, kind, value) for the interesting entries starting
+    in [start, end). An entry runs to the next header, which may lie past
+    `end`; uninteresting entries are skipped without being decoded.
+    """
+    headers = HEADER_RE.finditer(mm, start)
+    current = next(headers, None)
+    while current is not None and current.start() < end:
+        following = next(headers, None)
+        level = current.group(2)
+        kind = MESSAGE_RE.match(mm, current.end())
+        if kind is not None or level in PROBLEM_LEVELS:
+            stop = following.start() if following is not None else len(mm)
+            body_start = kind.end() if kind is not None else current.end()
+            if mm[current.start()] == JSON_PREFIX[0]:
+                # One entry per line; anything after it up to the next header is not part of it
+                line = mm[current.start():stop].split(b"\n", 1)[0]
+                value = _json_body(line, body_start - current.start())
+                if value is None:
+                    current = following
+                    continue
+            else:
+                value = mm[body_start:stop].decode("utf-8", "replace").rstrip("\n")
+            if kind is None:
+                kind_name = "problem"
+            else:
+                kind_name = kind.lastgroup
+                if kind_name in ("batch", "pipeline"):
+                    value = kind.group(0).decode()
+            yield current.start(), current.group(1).decode(), level.decode(), kind_name, value
+        current = following
+
+
+class RecordAssembler:
+    """
+    Turns events into request records. A record starts at a request
+    marker (incoming request, audio upload, batch, server restart) or at a
+    pipeline run or fast-path answer when the open record already has one,
+    and ends where the next starts. Pass `current` to continue a record from an earlier chunk.
+    """
+
+    def __init__(self, filename, current=None):
+        self.filename = filename
+        self.current = current
+        self.done = []
+
+    def _open(self, offset, timestamp, source):
+        self.close()
+        self.current = {
+            "id": f"{self.filename}:{offset}", "file": self.filename, "offset": offset,
+            "started_at": timestamp, "ended_at": timestamp, "source": source,
+            "raw_responses": [], "errors": [], "warnings": [],
+            "fallback": False, "fast_path": False, "truncated": False,
+        }
+        return self.current
+
+    def close(self):
+        if self.current is not None:
+            self.done.append(finalize(self.current))
+            self.current = None
+
+    def feed(self, event):
+        offset, timestamp, level, kind, value = event
+        if kind == "restart":
+            self.close()
+            return
+        record = self.current
+        if kind == "request":
+            record = self._open(offset, timestamp, "classify")
+            request, truncated = _literal(value)
+            record["truncated"] |= truncated
+            if isinstance(request, dict):
+                record["original_text"] = request.get("text")
+                record["categories"] = request.get("categories")
+            else:
+                record["original_text"] = value
+        elif kind in ("audio", "audio_stream"):
+            record = self._open(offset, timestamp, "speech" if kind == "audio" else "speech_stream")
+            record["audio_file"] = value
+        elif kind == "batch":
+            self._open(offset, timestamp, "classify_batch")
+        elif kind in SOFT_STARTS:
+            # Speech requests run the pipeline after their transcript; anything else starts a new request
+            if record is None or record.get("mode") or record.get("classified_items") is not None:
+                record = self._open(offset, timestamp, "classify")
+            if kind == "pipeline":
+                record["mode"] = value.split()[1]
+            else:
+                self._field(record, level, kind, value)
+        else:
+            if record is None:
+                # Lines of a request whose start is not in the log (rotated away)
+                record = self._open(offset, timestamp, "unknown")
+            self._field(record, level, kind, value)
+        self.current["ended_at"] = timestamp
+
+    def _field(self, record, level, kind, value):
+        if kind == "problem":
+            bucket = "warnings" if level == "WARNING" else "errors"
+            record[bucket].append(_problem(level, value))
+            return
+        if kind in ("transcript", "translation_raw", "translated_text", "raw_response"):
+            record["truncated"] |= bool(TRUNCATED_RE.search(value))
+            if kind == "raw_response":
+                record["raw_responses"].append(value)
+            else:
+                record[kind] = value
+                if kind == "transcript":
+                    record.setdefault("original_text", value)
+            return
+        if kind == "english":
+            record.setdefault("translated_text", record.get("original_text"))
+            return
+        if kind == "fast_path":
+            record["fast_path"] = True
+            value = value[value.find(": [") + 2:] if ": [" in value else value
+            kind = "items"
+        if kind in ("items", "fallback"):
+            # Logged more than once per request; only the last one is parsed, in finalize()
+            record["fallback"] |= kind == "fallback"
+            record["classified_items"] = value
+            record["items_text"] = True
+            return
+        parsed, truncated = _literal(value)
+        record["truncated"] |= truncated
+        if kind == "translation":
+            if isinstance(parsed, dict):
+                record["translated_text"] = parsed.get("translated_text", record.get("translated_text"))
+                if parsed.get("status") == "error":
+                    record["errors"].append({"level": "ERROR", "message": str(parsed.get("error"))})
+            return
+        if kind == "final":
+            # Whole response dict logged by older versions
+            if not isinstance(parsed, dict):
+                return
+            record.setdefault("original_text", parsed.get("original_text"))
+            record["translated_text"] = parsed.get("translated_text", record.get("translated_text"))
+            if "classified_items" in parsed:
+                parsed = parsed["classified_items"]
+            elif parsed.get("predicted_category"):
+                # Single-category responses from before item extraction
+                parsed = [{"category": parsed["predicted_category"]}]
+            else:
+                return
+        record["classified_items"] = parsed
+        record["items_text"] = False
+
+
+def finalize(record):
+    """Fill every field and derive the status."""
+    if record.get("items_text"):
+        items, truncated = _literal(record["classified_items"])
+        record["classified_items"] = items
+        record["truncated"] |= truncated
+    record = {field: record.get(field) for field in FIELDS}
+    if record["classified_items"] and not record["fallback"]:
+        record["status"] = "success"
+    elif record["errors"]:
+        record["status"] = "error"
+    elif record["fallback"]:
+        record["status"] = "fallback"
+    else:
+        record["status"] = "incomplete"
+    return record
+
+
+def scan_chunk(path, start, end):
+    """
+    Worker: records for one chunk. Returns (head, records, open_record,
+    started). head holds the events whose record depends on the
+    previous chunk, replayed in order by the caller; open_record is the
+    unfinished record at the end of the chunk. started is False when the
+    whole chunk is head.
+
+    A hard start (request, upload, restart) never depends on what came
+    before. Whether a pipeline run starts a new record depends on the open
+    one, so the first one goes to head too; after it the open record is
+    known to have a mode or items, and every later start is decided here.
+    """
+    filename = os.path.basename(path)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start, end = align(mm, start), align(mm, end)
+        assembler = RecordAssembler(filename)
+        head, started, soft_seen = [], False, False
+        for event in iter_events(mm, start, end):
+            if not started:
+                if event[3] in HARD_STARTS or (soft_seen and event[3] in SOFT_STARTS):
+                    started = True
+                else:
+                    soft_seen = soft_seen or event[3] in SOFT_STARTS
+                    head.append(event)
+                    continue
+            assembler.feed(event)
+        return head, assembler.done, assembler.current, started
+
+
+def plan_chunks(paths, chunk_bytes=CHUNK_BYTES):
+    """(path, start, end) byte ranges; workers align them to entry boundaries."""
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, size, chunk_bytes):
+            chunks.append((path, start, min(size, start + chunk_bytes)))
+    return chunks
+
+
+def iter_records(paths, workers=None, chunk_bytes=CHUNK_BYTES):
+    """Records of all files in order, scanning chunks on `workers` processes."""
+    chunks = plan_chunks([path for path in paths if os.path.getsize(path)], chunk_bytes)
+    workers = workers or os.cpu_count() or 1
+    carry, carry_path = None, None
+
+    def results():
+        if workers == 1:
+            yield from (scan_chunk(*chunk) for chunk in chunks)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Ordered, and at most a few chunks ahead of the writer
+            yield from pool.map(scan_chunk, *zip(*chunks), chunksize=1) if chunks else ()
+
+    for (path, _, _), (head, records, open_record, started) in zip(chunks, results()):
+        if carry_path != path:
+            # A new file starts fresh; its leading lines are orphans
+            if carry is not None:
+                yield finalize(carry)
+            carry = None
+        stitcher = RecordAssembler(os.path.basename(path), carry)
+        for event in head:
+            stitcher.feed(event)
+        carry_path = path
+        if not started:
+            # No record of its own: the open one continues into the next chunk
+            yield from stitcher.done
+            carry = stitcher.current
+            continue
+        stitcher.close()
+        yield from stitcher.done
+        yield from records
+        carry = open_record
+    if carry is not None:
+        yield finalize(carry)
+
+
+class JSONLWriter:
+    def __init__(self, path):
+        self._file = sys.stdout if path == "-" else open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+
+class ParquetWriter:
+    """Buffers records into row groups; nested fields become JSON text."""
+
+    ROW_GROUP = 50_000
+
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow (pip install pyarrow); use --format jsonl otherwise")
+        self._pa = pa
+        types = {"offset": pa.int64(), "fallback": pa.bool_(), "fast_path": pa.bool_(), "truncated": pa.bool_()}
+        self._schema = pa.schema([(field, types.get(field, pa.string())) for field in FIELDS])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+        self._rows = []
+
+    def write(self, record):
+        row = dict(record)
+        for field in JSON_FIELDS:
+            if row[field] is not None:
+                row[field] = json.dumps(row[field], ensure_ascii=False, default=str)
+        for field in ("original_text", "translated_text", "transcript", "audio_file"):
+            if row[field] is not None and not isinstance(row[field], str):
+                row[field] = str(row[field])
+        self._rows.append(row)
+        if len(self._rows) >= self.ROW_GROUP:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(self._pa.Table.from_pylist(self._rows, schema=self._schema))
+            self._rows = []
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+
+WRITERS = {"jsonl": JSONLWriter, "parquet": ParquetWriter}
+
+
+def run(paths, output, fmt="jsonl", workers=None, chunk_bytes=CHUNK_BYTES):
+    """Parse `paths` into `output`; returns a summary dict."""
+    started = time.perf_counter()
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    writer = WRITERS[fmt](output)
+    counts = {}
+    try:
+        for record in iter_records(paths, workers, chunk_bytes):
+            writer.write(record)
+            counts[record["status"]] = counts.get(record["status"], 0) + 1
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+    return {
+        "files": len(paths),
+        "bytes": total_bytes,
+        "records": sum(counts.values()),
+        "by_status": counts,
+        "seconds": round(elapsed, 3),
+        "mb_per_second": round(total_bytes / 1024 / 1024 / elapsed, 1) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("paths", nargs="+", help="log files, oldest first")
+    parser.add_argument("--output", "-o", default="-", help="output file ('-' for stdout, JSONL only)")
+    parser.add_argument("--format", choices=sorted(WRITERS), default=None,
+                        help="jsonl or parquet (default from the output extension)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-mb", type=int, default=CHUNK_BYTES // 1024 // 1024)
+    args = parser.parse_args()
+
+    for path in args.paths:
+        if not os.path.isfile(path):
+            parser.error(f"not a file: {path}")
+    fmt = args.format or ("parquet" if args.output.endswith(".parquet") else "jsonl")
+    if fmt == "parquet" and args.output == "-":
+        parser.error("parquet output needs --output")
+    summary = run(args.paths, args.output, fmt, args.workers, args.chunk_mb * 1024 * 1024)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    if summary["bytes"] and not summary["records"]:
+        # Most likely a log format this parser does not know, rather than a log without requests
+        parser.exit(1, "error: no request records found; expected loguru's text format or LOG_JSON lines\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,200 @@
 from loguru import logger
 
+import os
+import queue
+import random
+import re
 import sys
- 
-logger.add("logs/app.log", rotation="500 MB", backtrace=True, diagnose=True)
- 
\ No newline at end of file
+import threading
+import time
+
+
+LOG_ENABLED = os.getenv("LOG_ENABLED", "true").lower() in ("1", "true", "yes")
+LOG_FILE = os.getenv("LOG_FILE", "logs/app.log")
+# Any loguru rotation spec; with LOG_ENQUEUE only sizes ("500 MB") are supported
+LOG_ROTATION = os.getenv("LOG_ROTATION", "500 MB")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG").upper()
+# Per-module overrides, e.g. "translate_and_classify=WARNING,fast_path=INFO"
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_STDERR = os.getenv("LOG_STDERR", "true").lower() in ("1", "true", "yes")
+# Hand formatted records to a background writer thread; file I/O and
+# rotation stay off the request thread
+LOG_ENQUEUE = os.getenv("LOG_ENQUEUE", "true").lower() in ("1", "true", "yes")
+# One JSON object per line instead of the text format
+LOG_JSON = os.getenv("LOG_JSON", "false").lower() in ("1", "true", "yes")
+LOG_BACKTRACE = os.getenv("LOG_BACKTRACE", "true").lower() in ("1", "true", "yes")
+# Variable values in tracebacks: useful locally, slow and leaky in production
+LOG_DIAGNOSE = os.getenv("LOG_DIAGNOSE", "false").lower() in ("1", "true", "yes")
+# Large payloads (raw LLM text, item lists) are cut to this many characters; 0 keeps them whole
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "500"))
+# Fraction of payload log lines that are emitted at all
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "1.0"))
+
+
+SIZE_UNITS = {"b": 1, "kb": 1024, "mb": 1024 ** 2, "gb": 1024 ** 3}
+
+
+class BackgroundFileSink:
+    """
+    Queue-backed file sink. loguru formats each record on the calling thread
+    and hands the string over; a daemon thread batches the writes and rotates
+    by size. Unlike loguru's enqueue=True (built for multiprocessing) nothing
+    is pickled or sent through a pipe, which is slower than a direct write.
+    """
+
+    def __init__(self, path, rotation_bytes=None):
+        self.path = path
+        self.rotation_bytes = rotation_bytes
+        self._stopped = False
+        self._start()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start(self):
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self):
+        # Threads do not survive fork: a forked server worker gets its own
+        # writer, and leaves what the parent had queued to the parent
+        if not self._stopped:
+            self._start()
+
+    def write(self, message):
+        self._queue.put(str(message))
+
+    def stop(self):
+        # Called by logger.remove(), including loguru's own exit hook: drain first
+        self._stopped = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def _open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _rotate(self, inode):
+        self._file.close()
+        # Worker processes append to the same file; only the first to notice
+        # renames it, the others just follow to the new one
+        try:
+            current = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            current = None
+        if current == inode:
+            os.rename(self.path, self._rotated_path())
+        self._open()
+
+    def _rotated_path(self):
+        # Microseconds as in loguru's own rotation names, plus a counter so that
+        # two rotations within one clock tick never overwrite each other
+        root, ext = os.path.splitext(self.path)
+        now = time.time()
+        stamp = f"{time.strftime('%Y-%m-%d_%H-%M-%S', time.localtime(now))}_{int(now % 1 * 1e6):06d}"
+        target, counter = f"{root}.{stamp}{ext}", 1
+        while os.path.exists(target):
+            target = f"{root}.{stamp}.{counter}{ext}"
+            counter += 1
+        return target
+
+    def _run(self):
+        self._open()
+        while True:
+            message = self._queue.get()
+            batch = []
+            while message is not None:
+                batch.append(message)
+                if len(batch) >= 1024:
+                    break
+                try:
+                    message = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                data = "".join(batch)
+                self._file.write(data)
+                self._file.flush()
+                if self.rotation_bytes:
+                    # The file size, not this process's share of it
+                    stat = os.fstat(self._file.fileno())
+                    if stat.st_size >= self.rotation_bytes:
+                        self._rotate(stat.st_ino)
+            if message is None:
+                self._file.close()
+                return
+
+
+def parse_size(spec):
+    """'500 MB' -> 524288000; None when spec is not a plain size."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmg]?b)\s*", str(spec).lower())
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2)])
+
+
+def parse_levels(spec):
+    """'a=WARNING,b.c=INFO' -> {"a": "WARNING", "b.c": "INFO"}"""
+    levels = {}
+    for part in spec.split(","):
+        name, _, level = part.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """(Re)install the sinks from the LOG_* settings. Returns the handler ids."""
+    logger.remove()
+    if not LOG_ENABLED:
+        return []
+
+    overrides = parse_levels(LOG_LEVELS)
+    # loguru drops records below the sink level before the filter runs, so the
+    # sink has to accept the most verbose level any module asks for
+    level_filter = {"": LOG_LEVEL, **overrides}
+    sink_level = min((logger.level(level).no for level in level_filter.values()))
+
+    options = dict(
+        level=sink_level,
+        filter=level_filter,
+        serialize=LOG_JSON,
+        backtrace=LOG_BACKTRACE,
+        diagnose=LOG_DIAGNOSE,
+    )
+    if LOG_ENQUEUE:
+        rotation_bytes = parse_size(LOG_ROTATION)
+        handlers = [logger.add(BackgroundFileSink(LOG_FILE, rotation_bytes), **options)]
+        if LOG_ROTATION and rotation_bytes is None:
+            logger.warning(f"LOG_ROTATION '{LOG_ROTATION}' is not a size; {LOG_FILE} will not rotate")
+    else:
+        handlers = [logger.add(LOG_FILE, rotation=LOG_ROTATION, **options)]
+    if LOG_STDERR:
+        handlers.append(logger.add(sys.stderr, **options))
+    return handlers
+
+
+def truncate_payload(value, limit=None):
+    """str(value), cut to LOG_PAYLOAD_MAX_CHARS with a note of how much was dropped."""
+    limit = LOG_PAYLOAD_MAX_CHARS if limit is None else limit
+    text = value if isinstance(value, str) else str(value)
+    if limit and len(text) > limit:
+        return f"{text[:limit]}... [+{len(text) - limit} chars]"
+    return text
+
+
+def log_payload(level, message, value):
+    """
+    Log `message: value` for a potentially large payload. Sampled by
+    LOG_PAYLOAD_SAMPLE_RATE and truncated; the payload is only converted to
+    text when a sink will actually write the record.
+    """
+    if LOG_PAYLOAD_SAMPLE_RATE < 1.0 and random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    logger.opt(depth=1, lazy=True).log(level, message + ": {}", lambda: truncate_payload(value))
+
+
+configure_logging()
@@ -0,0 +1,165 @@
+from logger import logger
+from pipeline_engine import engine
+from audio_upload import AudioBuffer
+from transcription import transcribe_audio_async
+from translate_and_classify import response_flags, run_pipeline_async
+import asyncio
+import audio_preprocess
+import os
+import re
+import time
+
+
+# Recordings longer than this are split and transcribed segment by segment
+AUDIO_CHUNKING_ENABLED = os.getenv("AUDIO_CHUNKING_ENABLED", "true").lower() in ("1", "true", "yes")
+AUDIO_CHUNK_MIN_SECONDS = float(os.getenv("AUDIO_CHUNK_MIN_SECONDS", "60"))
+AUDIO_CHUNK_TARGET_SECONDS = float(os.getenv("AUDIO_CHUNK_TARGET_SECONDS", "30"))
+# Audio repeated on both sides of a cut; the duplicated words are removed when stitching
+AUDIO_CHUNK_OVERLAP_MS = int(os.getenv("AUDIO_CHUNK_OVERLAP_MS", "300"))
+# Longest run of words treated as a boundary repeat; 2 x 300 ms of shared audio holds about 3 words
+MAX_OVERLAP_WORDS = 4
+
+_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def _normalize_word(word):
+    return _WORD_RE.sub("", word.casefold())
+
+
+def boundary_overlap(previous_words, words, limit=MAX_OVERLAP_WORDS):
+    """Number of leading `words` repeating the tail of `previous_words`."""
+    for size in range(min(limit, len(previous_words), len(words)), 0, -1):
+        tail = [_normalize_word(w) for w in previous_words[-size:]]
+        head = [_normalize_word(w) for w in words[:size]]
+        if tail == head and any(tail):
+            return size
+    return 0
+
+
+def stitch_transcripts(texts):
+    """Join segment transcripts, dropping words repeated across each boundary. Returns (text, overlaps)."""
+    merged, overlaps = [], []
+    for text in texts:
+        words = (text or "").split()
+        size = boundary_overlap(merged, words)
+        overlaps.append(size)
+        merged.extend(words[size:])
+    return " ".join(merged), overlaps
+
+
+def split_audio(audio, seconds=None):
+    """
+    Segment AudioBuffers for a long recording as [(start_s, end_s, audio)],
+    or None when chunking is off or the recording is short enough.
+    seconds is the duration when it is already known (the preprocessing
+    report's seconds_out), so short recordings are not decoded again.
+    """
+    if not AUDIO_CHUNKING_ENABLED:
+        return None
+    if seconds is not None and seconds <= AUDIO_CHUNK_MIN_SECONDS:
+        return None
+    rate = audio_preprocess.AUDIO_PREPROCESS_SAMPLE_RATE
+    pcm = audio_preprocess.decode_pcm(audio.read_all(), audio.filename, rate)
+    if audio_preprocess.pcm_seconds(pcm, rate) <= AUDIO_CHUNK_MIN_SECONDS:
+        return None
+    content_type, extension = audio_preprocess.FORMATS[audio_preprocess.AUDIO_PREPROCESS_FORMAT]
+    name = os.path.splitext(audio.filename)[0]
+    bytes_per_second = rate * audio_preprocess.SAMPLE_WIDTH
+    segments = []
+    for index, (start, end) in enumerate(audio_preprocess.plan_segments(
+            pcm, rate, AUDIO_CHUNK_TARGET_SECONDS, AUDIO_CHUNK_OVERLAP_MS)):
+        data = audio_preprocess.encode(pcm[start:end], rate)
+        segments.append((start / bytes_per_second, end / bytes_per_second,
+                         AudioBuffer.from_bytes(data, f"{name}.part{index}{extension}", content_type)))
+    return segments
+
+
+async def _process_segment(index, start, end, audio, categories, backend, mode, bypass_cache):
+    segment = {"index": index, "start": round(start, 3), "end": round(end, 3)}
+    began = time.perf_counter()
+    transcript = (await transcribe_audio_async(audio, backend) or "").strip()
+    transcribed = time.perf_counter()
+    segment.update(transcript=transcript, transcribe_ms=round((transcribed - began) * 1000, 1))
+    # Classified as soon as this segment's text is in, independent of the other segments
+    if transcript:
+        translation, items = await run_pipeline_async(transcript, categories, mode, bypass_cache=bypass_cache)
+    else:
+        translation, items = {"translated_text": "", "status": "success"}, []
+    segment.update(
+        translated_text=translation.get("translated_text", transcript),
+        translation_error=translation.get("error") if translation.get("status") == "error" else None,
+        classified_items=items,
+        classify_ms=round((time.perf_counter() - transcribed) * 1000, 1),
+    )
+    segment.update(response_flags(translation))
+    return segment
+
+
+def _same_item(a, b):
+    return (str(a.get("category")).casefold(), str(a.get("item")).casefold().strip(), a.get("amount")) == \
+        (str(b.get("category")).casefold(), str(b.get("item")).casefold().strip(), b.get("amount"))
+
+
+async def transcribe_long_audio_async(audio, categories, backend=None, mode=None, bypass_cache=False, seconds=None):
+    """
+    Transcribe and classify a long recording in overlapping segments, all
+    at once: the transcribe and LLM stages bound the real concurrency, and
+    total latency follows the slowest segment rather than their sum.
+
+    Returns None for audio that does not need chunking, otherwise a dict
+    shaped like the /speech-to-text response plus per-segment timings.
+    seconds is the known duration, see split_audio(). Raises
+    TranscriptionError if any segment cannot be transcribed.
+    """
+    try:
+        segments = await asyncio.to_thread(split_audio, audio, seconds)
+    except Exception as e:
+        logger.warning(f"Could not split audio, transcribing it whole: {type(e).__name__}: {e}")
+        return None
+    if not segments:
+        return None
+
+    started = time.perf_counter()
+    logger.info(f"Transcribing {len(segments)} segments of {segments[-1][1]:.0f}s audio concurrently")
+    tasks = [
+        asyncio.create_task(_process_segment(index, start, end, segment_audio, categories, backend, mode, bypass_cache))
+        for index, (start, end, segment_audio) in enumerate(segments)
+    ]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # One failed segment fails the recording; stop paying for the rest
+        for task in tasks:
+            task.cancel()
+
+    transcript, overlaps = stitch_transcripts([segment["transcript"] for segment in results])
+    items, previous = [], []
+    for segment, overlap in zip(results, overlaps):
+        segment["overlap_words"] = overlap
+        kept = []
+        # Words repeated at the boundary can yield the same item in both segments; keep the first
+        for item in segment.pop("classified_items"):
+            if not (overlap and any(_same_item(item, seen) for seen in previous)):
+                kept.append(item)
+        segment["items"] = len(kept)
+        items.extend(kept)
+        previous = kept
+    errors = [segment["translation_error"] for segment in results if segment["translation_error"]]
+    result = {
+        "original_text": transcript,
+        "translated_text": " ".join(s["translated_text"] for s in results if s["translated_text"]),
+        "classified_items": items,
+        "segments": results,
+        "chunked_ms": round((time.perf_counter() - started) * 1000, 1),
+        "status": "partial" if errors else "success",
+    }
+    if any(segment.get("truncated") for segment in results):
+        result["truncated"] = True
+    if any(segment.get("translated") is False for segment in results):
+        result["translated"] = False
+    return result
+
+
+def transcribe_long_audio(audio, categories, backend=None, mode=None, bypass_cache=False, seconds=None):
+    """Sync wrapper around transcribe_long_audio_async()."""
+    return engine.run_sync(transcribe_long_audio_async(audio, categories, backend, mode, bypass_cache, seconds))
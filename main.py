@@ -0,0 +1,103 @@
+"""
+Production server: gunicorn with a pre-forked pool of worker processes,
+each serving the Flask app from a fixed number of threads. Settings live in
+gunicorn.conf.py and come from the SERVE_* environment variables or .env.
+
+    python main.py                       # same as: gunicorn -c gunicorn.conf.py "main:preload()"
+    SERVE_WORKERS=4 SERVE_THREADS=16 python main.py
+    python main.py worker --concurrency 4  # background job worker (see job_queue)
+
+The master loads the app once (SDKs, model clients, category index) and
+warms it up before forking, so workers start ready and share that memory
+copy-on-write. gunicorn replaces workers that die; on SIGTERM every worker
+stops accepting, finishes its in-flight requests for up to
+SERVE_GRACEFUL_TIMEOUT seconds and flushes its queued log lines and
+expense rows before exiting. `python endpoints.py` remains the single
+process debug server for development.
+
+`worker` is the second process type: it serves no HTTP and runs the
+background jobs the web processes queue (POST /speech-to-text with
+Prefer: respond-async). Run it next to the server, as many as needed.
+"""
+from dotenv import load_dotenv
+
+# Every module reads its settings at import, so .env has to be applied first;
+# variables already set in the environment win
+load_dotenv()
+
+from logger import logger  # noqa: E402
+import argparse  # noqa: E402
+import os  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+
+
+GUNICORN_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gunicorn.conf.py")
+
+
+def preload():
+    """Import and warm up the app in the master; returns the WSGI app."""
+    started = time.perf_counter()
+    from endpoints import DEFAULT_CATEGORIES, app, warm_up
+    from category_index import get_index
+    from expense_store import get_expense_store
+    from job_queue import get_job_store
+    import fast_path
+
+    # Imports the SDKs and builds every model client. No upstream connection is
+    # opened here: gRPC channels and pooled sockets must not be shared across
+    # fork, each worker opens its own on first use
+    warm_up()
+    import elevenlabs.client  # noqa: F401 - inherited by the workers, which create their own clients
+    get_index(DEFAULT_CATEGORIES)
+    fast_path.build_index(DEFAULT_CATEGORIES)
+    # Creates the data directories and SQLite schemas once, before the workers share them
+    get_expense_store()
+    get_job_store()
+    # Compiles the URL map, which Flask otherwise does on the first request
+    with app.test_request_context("/"):
+        pass
+    logger.info(f"App preloaded in {time.perf_counter() - started:.2f}s")
+    return app
+
+
+def warm_up_worker():
+    """Per-worker warm-up for what cannot be inherited across fork (gunicorn's post_fork hook)."""
+    from transcription import resolve_backend
+    import local_stt
+
+    if resolve_backend() == "local":
+        # Each worker owns its recognizer processes
+        local_stt.warm_up()
+
+
+def finish_worker():
+    """Flush what this worker queued before it exits (gunicorn's worker_exit hook)."""
+    from expense_store import get_expense_store
+    import local_stt
+
+    expense_store = get_expense_store()
+    if expense_store is not None:
+        expense_store.stop()
+    local_stt.shutdown()
+    logger.remove()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("process", nargs="?", choices=("web", "worker"), default="web")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="jobs run at once by a worker (default JOB_WORKER_CONCURRENCY)")
+    args = parser.parse_args()
+
+    if args.process == "worker":
+        from job_queue import JOB_WORKER_CONCURRENCY, run_worker
+        run_worker(args.concurrency or JOB_WORKER_CONCURRENCY)
+        return
+    from gunicorn.app.wsgiapp import run
+    sys.argv = [sys.argv[0], "--config", GUNICORN_CONFIG, "main:preload()"]
+    run()
+
+
+if __name__ == "__main__":
+    main()
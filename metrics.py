@@ -0,0 +1,203 @@
+import contextvars
+import os
+import threading
+
+
+# Adds a Server-Timing header with per-stage durations to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# Per-request list of (stage, seconds) feeding the Server-Timing header
+_timings = contextvars.ContextVar("server_timings", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Base for the in-process metrics below; thread-safe, labelled by keyword.
+    With `collect() -> {label tuple: value}` the values are read from
+    existing state at scrape time instead.
+    """
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labels=(), collect=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._collect = collect
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, label_values):
+        return tuple(str(label_values.get(label, "")) for label in self.labels)
+
+    def samples(self):
+        """Yield (suffix, label_values, extra_labels, value) tuples."""
+        if self._collect is not None:
+            items = list(self._collect().items())
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        for key, value in items:
+            yield "", key, (), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, key, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labels, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(entry["counts"]), entry["sum"], entry["count"]) for key, entry in self._values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield "_bucket", key, (("le", _format_value(float(bound))),), cumulative
+            yield "_sum", key, (), total
+            yield "_count", key, (), count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+STAGE_DURATION = registry.register(Histogram(
+    "pipeline_stage_duration_seconds", "Duration of pipeline stage calls", ("stage", "outcome")))
+STAGE_ERRORS = registry.register(Counter(
+    "pipeline_stage_errors_total", "Failed pipeline stage calls by error type", ("stage", "error")))
+TRANSCRIPTIONS = registry.register(Counter(
+    "transcriptions_total", "Transcriptions by the path that produced them (sdk, direct_api, local, failed)", ("path",)))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total", "Gemini tokens reported in usage_metadata", ("stage", "kind")))
+LLM_PROMPT_TOKENS = registry.register(Histogram(
+    "llm_prompt_tokens", "Prompt tokens per Gemini call", ("stage",), buckets=TOKEN_BUCKETS))
+# Savings are in minus out; a compressed upload can grow when re-encoded as WAV
+AUDIO_PREPROCESS_BYTES = registry.register(Counter(
+    "audio_preprocess_bytes_total", "Audio bytes before (in) and after (out) preprocessing", ("direction",)))
+AUDIO_PREPROCESS_SECONDS = registry.register(Counter(
+    "audio_preprocess_seconds_total", "Audio duration before (in) and after (out) silence trimming", ("direction",)))
+HTTP_DURATION = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request duration", ("endpoint", "method", "status")))
+
+
+def observe_stage(stage, seconds, error=None):
+    STAGE_DURATION.observe(seconds, stage=stage, outcome="error" if error else "ok")
+    if error:
+        STAGE_ERRORS.inc(stage=stage, error=error)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def record_usage(stage, response):
+    """Count the tokens a Gemini response reports; responses without usage_metadata are ignored."""
+    try:
+        usage = response.usage_metadata
+    except (AttributeError, ValueError, IndexError):
+        return
+    if usage is None:
+        return
+    prompt = getattr(usage, "prompt_token_count", 0) or 0
+    output = getattr(usage, "candidates_token_count", 0) or 0
+    total = getattr(usage, "total_token_count", 0) or prompt + output
+    if not total:
+        return
+    LLM_TOKENS.inc(prompt, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(output, stage=stage, kind="output")
+    LLM_TOKENS.inc(total, stage=stage, kind="total")
+    LLM_PROMPT_TOKENS.observe(prompt, stage=stage)
+
+
+def start_request_timings():
+    """Collect stage timings for the current request; returns the reset token."""
+    return _timings.set([])
+
+
+def finish_request_timings(token):
+    """Stop collecting and return {stage: (total_seconds, calls)}."""
+    timings = _timings.get() or []
+    _timings.reset(token)
+    summary = {}
+    for stage, seconds in timings:
+        total, calls = summary.get(stage, (0.0, 0))
+        summary[stage] = (total + seconds, calls + 1)
+    return summary
+
+
+def server_timing_header(summary, total_seconds=None):
+    """Format {stage: (seconds, calls)} as a Server-Timing header value (milliseconds)."""
+    parts = [
+        f'{stage};dur={seconds * 1000:.1f};desc="{calls} call(s)"'
+        for stage, (seconds, calls) in summary.items()
+    ]
+    if total_seconds is not None:
+        parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
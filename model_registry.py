@@ -0,0 +1,76 @@
+from logger import logger
+import json
+import os
+import threading
+
+
+_models = {}
+# Fast path keyed on the identity of the config object callers pass (module
+# constants in practice), so hot lookups skip serializing the config.
+_by_identity = {}
+_lock = threading.Lock()
+_configured = False
+
+
+def configure(api_key=None):
+    """Configure the genai SDK once per process."""
+    global _configured
+    with _lock:
+        if _configured:
+            return
+        # The SDK takes about half a second to import; only pay for it once a model is needed
+        import google.generativeai as genai
+        genai.configure(api_key=api_key or os.getenv('GEMINI_API_KEY'))
+        _configured = True
+
+
+def _config_key(generation_config):
+    return json.dumps(generation_config or {}, sort_keys=True)
+
+
+def get_model(model_name, generation_config=None):
+    """
+    Return the shared GenerativeModel for (model_name, generation_config).
+
+    Models are built once and reused by every request thread; the underlying
+    SDK client is thread-safe, the model object itself holds no per-call state.
+    """
+    entry = _by_identity.get((model_name, id(generation_config)))
+    if entry is not None and entry[0] is generation_config:
+        return entry[1]
+
+    key = (model_name, _config_key(generation_config))
+
+    if not _configured:
+        configure()
+
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            logger.debug(f"Building model client for {model_name} ({key[1]})")
+            import google.generativeai as genai
+            model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
+            _models[key] = model
+        _by_identity[(model_name, id(generation_config))] = (generation_config, model)
+    return model
+
+
+def warm_up(model_name, generation_configs=(None,)):
+    """Build the model clients ahead of the first request. Never raises."""
+    try:
+        # Importing or configuring the SDK fails the same way a model client does
+        configure()
+        for generation_config in generation_configs:
+            get_model(model_name, generation_config)
+    except Exception as e:
+        logger.warning(f"Model warm-up failed for {model_name}: {e}")
+        return False
+    logger.info(f"Warmed up {len(_models)} model client(s) for {model_name}")
+    return True
+
+
+def clear():
+    """Drop all cached models (used by benchmarks and after reconfiguration)."""
+    with _lock:
+        _models.clear()
+        _by_identity.clear()
@@ -0,0 +1,206 @@
+from logger import logger
+from contextlib import contextmanager
+import asyncio
+import contextvars
+import os
+import metrics
+import threading
+import time
+
+
+# Wall-clock budget for a whole HTTP request, shared by every upstream call it makes
+REQUEST_BUDGET_SECONDS = float(os.getenv("REQUEST_BUDGET_SECONDS", "120"))
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+
+
+class StageTimeout(Exception):
+    """A pipeline stage did not finish within its timeout."""
+
+    def __init__(self, stage, timeout):
+        super().__init__(f"{stage} stage timed out after {timeout}s")
+        self.stage = stage
+        self.timeout = timeout
+
+
+@contextmanager
+def request_budget(seconds=None):
+    """
+    Give everything run inside the block (including coroutines submitted to
+    the engine) a shared deadline. Nested budgets never extend an outer one.
+    """
+    deadline = time.monotonic() + (REQUEST_BUDGET_SECONDS if seconds is None else seconds)
+    outer = _deadline.get()
+    token = _deadline.set(deadline if outer is None else min(outer, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget():
+    """Seconds left in the current request budget, or None without one."""
+    deadline = _deadline.get()
+    return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+
+async def _in_context(coro, context):
+    # Tasks get a copy of the engine thread's context, so re-apply the caller's
+    # request-scoped variables (deadline, Server-Timing collector)
+    for var, value in context.items():
+        var.set(value)
+    return await coro
+
+
+class Stage:
+    """
+    One awaitable step of the speech -> translate -> classify flow with its own
+    timeout and concurrency limit. Limits are process-wide because every stage
+    runs on the shared engine loop.
+    """
+
+    def __init__(self, name, timeout, concurrency):
+        self.name = name
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self._semaphore = None
+
+    def budgeted_timeout(self):
+        """The stage timeout cut short by the request budget; raises StageTimeout once it is spent."""
+        remaining = remaining_budget()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise StageTimeout(self.name, 0)
+        return min(self.timeout, remaining)
+
+    async def run(self, func, *args, **kwargs):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            # Each call gets the stage timeout, cut short by the request budget
+            timeout = self.budgeted_timeout()
+            self.in_flight += 1
+            started = time.perf_counter()
+            error = None
+            try:
+                return await asyncio.wait_for(func(*args, **kwargs), timeout)
+            except asyncio.TimeoutError:
+                error = "timeout"
+                logger.error(f"Stage '{self.name}' timed out after {timeout:.1f}s")
+                raise StageTimeout(self.name, round(timeout, 3)) from None
+            except asyncio.CancelledError:
+                error = "cancelled"
+                raise
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                self.in_flight -= 1
+                metrics.observe_stage(self.name, time.perf_counter() - started, error)
+
+
+def _stage_from_env(name, default_timeout, default_concurrency):
+    prefix = name.upper()
+    return Stage(
+        name,
+        timeout=float(os.getenv(f"{prefix}_TIMEOUT_SECONDS", default_timeout)),
+        concurrency=int(os.getenv(f"{prefix}_CONCURRENCY", default_concurrency)),
+    )
+
+
+STAGES = {
+    # Silence trimming and resampling, CPU work in threads
+    "preprocess": _stage_from_env("preprocess", 30, 8),
+    "transcribe": _stage_from_env("transcribe", 60, 64),
+    "translate": _stage_from_env("translate", 30, 128),
+    "classify": _stage_from_env("classify", 30, 128),
+    "fused": _stage_from_env("fused", 45, 128),
+    # Packed multi-record prompts from /classify-expense/batch
+    "batch": _stage_from_env("batch", 90, 8),
+}
+
+
+metrics.registry.register(metrics.Gauge(
+    "pipeline_stage_in_flight", "Calls currently running in each pipeline stage", ("stage",),
+    collect=lambda: {(name,): stage.in_flight for name, stage in STAGES.items()},
+))
+
+
+async def run_stage(name, func, *args, **kwargs):
+    """Run func(*args, **kwargs) under the timeout and limit of stage `name`."""
+    return await STAGES[name].run(func, *args, **kwargs)
+
+
+class PipelineEngine:
+    """
+    Owns a single background event loop. Sync callers (Flask views, scripts)
+    submit coroutines to it, so upstream I/O from every worker thread is
+    multiplexed on one loop instead of each call holding its own socket wait.
+    """
+
+    def __init__(self):
+        self._reset()
+        if hasattr(os, "register_at_fork"):
+            # The loop thread does not survive fork; a forked server worker starts its own
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    loop = asyncio.new_event_loop()
+                    self._thread = threading.Thread(
+                        target=loop.run_forever, name="pipeline-engine", daemon=True
+                    )
+                    self._thread.start()
+                    self._loop = loop
+                    logger.info("Pipeline engine loop started")
+        return self._loop
+
+    def in_engine_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def submit(self, coro):
+        """Schedule a coroutine on the engine loop and return a concurrent Future."""
+        context = contextvars.copy_context()
+        if len(context):
+            coro = _in_context(coro, context)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run_sync(self, coro, timeout=None):
+        """Block the calling thread until the coroutine finishes on the engine loop."""
+        if self.in_engine_loop():
+            coro.close()
+            raise RuntimeError("run_sync() cannot be called from the engine loop; await the coroutine instead")
+        return self.submit(coro).result(timeout)
+
+    def iterate_sync(self, agen):
+        """Drive an async generator on the engine loop from a sync generator."""
+        try:
+            while True:
+                try:
+                    yield self.run_sync(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self.run_sync(agen.aclose())
+
+    def stats(self):
+        return {
+            name: {"in_flight": stage.in_flight, "concurrency": stage.concurrency, "timeout": stage.timeout}
+            for name, stage in STAGES.items()
+        }
+
+
+engine = PipelineEngine()
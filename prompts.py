@@ -0,0 +1,279 @@
+"""
+Prompt templates for every Gemini call, built within a token budget.
+
+Each template is written once, without the indentation and repeated
+instructions the inline f-strings used to carry. User text is normalized
+before it is embedded (whitespace runs collapsed, categories listed once
+and without duplicates) and capped at PROMPT_MAX_INPUT_TOKENS;
+run_pipeline_async (and the batch path, for oversized records) splits
+longer inputs into parts first, so only direct callers ever hit the cut.
+Parts beyond PROMPT_MAX_INPUT_PARTS are dropped and the result is flagged
+"truncated". Output is capped through max_output_tokens in
+each stage's generation_config.
+
+Token counts are a local estimate (no count_tokens round trip before every
+call); what was removed is counted in prompt_tokens_saved_total and
+prompt_tokens_saved, next to the usage the model reports in llm_tokens_total.
+"""
+from logger import logger
+import json
+import metrics
+import os
+import re
+import textwrap
+
+
+# Estimated tokens of user text one prompt may carry; longer input is split into parts
+PROMPT_MAX_INPUT_TOKENS = int(os.getenv("PROMPT_MAX_INPUT_TOKENS", "1500"))
+# Parts one oversized input is split into at most; text beyond them is dropped
+PROMPT_MAX_INPUT_PARTS = int(os.getenv("PROMPT_MAX_INPUT_PARTS", "4"))
+# max_output_tokens per stage: a translation is about as long as its input,
+# a classification is a short JSON array, a batch answers for many records
+TRANSLATE_MAX_OUTPUT_TOKENS = int(os.getenv("TRANSLATE_MAX_OUTPUT_TOKENS", "2048"))
+CLASSIFY_MAX_OUTPUT_TOKENS = int(os.getenv("CLASSIFY_MAX_OUTPUT_TOKENS", "1024"))
+FUSED_MAX_OUTPUT_TOKENS = int(os.getenv("FUSED_MAX_OUTPUT_TOKENS", "3072"))
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv("BATCH_MAX_OUTPUT_TOKENS", "8192"))
+
+# Rough characters per token, for estimates and for cutting text to a token count
+CHARS_PER_TOKEN = 4
+
+PROMPT_TOKENS_SAVED = metrics.registry.register(metrics.Counter(
+    "prompt_tokens_saved_total", "Estimated prompt tokens removed before sending, by stage and reason "
+    "(dedupe, truncate)", ("stage", "reason")))
+PROMPT_SAVED_PER_CALL = metrics.registry.register(metrics.Histogram(
+    "prompt_tokens_saved", "Estimated prompt tokens removed from one prompt", ("stage",),
+    buckets=metrics.TOKEN_BUCKETS))
+PROMPT_TOKENS_ESTIMATED = metrics.registry.register(metrics.Histogram(
+    "prompt_tokens_estimated", "Estimated prompt tokens per prompt as sent", ("stage",),
+    buckets=metrics.TOKEN_BUCKETS))
+OVERSIZED_INPUTS = metrics.registry.register(metrics.Counter(
+    "prompt_oversized_inputs_total", "Inputs over PROMPT_MAX_INPUT_TOKENS by how they were fitted (split, truncate)",
+    ("stage", "action")))
+
+_WHITESPACE = re.compile(r"\s+")
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+
+
+def estimate_tokens(text):
+    """Cheap ~4 characters per token estimate, good enough for budgets."""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def normalize_text(text):
+    return _WHITESPACE.sub(" ", text or "").strip()
+
+
+def unique_categories(categories):
+    """Categories in order with case-insensitive repeats dropped."""
+    seen, unique = set(), []
+    for category in categories:
+        key = str(category).strip().casefold()
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(str(category).strip())
+    return unique
+
+
+def truncate_text(text, max_tokens):
+    """Text cut at a word boundary so that it estimates at no more than max_tokens."""
+    limit = max(1, max_tokens * CHARS_PER_TOKEN - 1)
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    space = cut.rfind(" ")
+    return cut[:space] if space > limit // 2 else cut
+
+
+def split_text(text, max_tokens=PROMPT_MAX_INPUT_TOKENS):
+    """Text in parts of at most max_tokens, on sentence boundaries where possible."""
+    parts, current = [], ""
+    for sentence in _SENTENCE_END.split(text):
+        while estimate_tokens(sentence) > max_tokens:
+            head = truncate_text(sentence, max_tokens)
+            if current:
+                parts.append(current)
+                current = ""
+            parts.append(head)
+            sentence = sentence[len(head):].lstrip()
+        candidate = f"{current} {sentence}" if current else sentence
+        if current and estimate_tokens(candidate) > max_tokens:
+            parts.append(current)
+            candidate = sentence
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def fits_prompt(text, max_tokens=PROMPT_MAX_INPUT_TOKENS):
+    """True when the normalized text fits one prompt without splitting."""
+    return estimate_tokens(normalize_text(text)) <= max_tokens
+
+
+def split_input(text, stage="pipeline", max_tokens=PROMPT_MAX_INPUT_TOKENS, max_parts=PROMPT_MAX_INPUT_PARTS):
+    """
+    (parts, truncated): the normalized text as parts that each fit one
+    prompt, [text] when it already fits. At most max_parts are kept;
+    truncated is True when text beyond them was dropped.
+    """
+    text = normalize_text(text)
+    if estimate_tokens(text) <= max_tokens:
+        return [text], False
+    parts = split_text(text, max_tokens)
+    OVERSIZED_INPUTS.inc(stage=stage, action="split")
+    truncated = len(parts) > max_parts
+    if truncated:
+        dropped = sum(estimate_tokens(part) for part in parts[max_parts:])
+        logger.warning(f"Input of ~{estimate_tokens(text)} tokens exceeds {max_parts} parts, dropping ~{dropped} tokens")
+        OVERSIZED_INPUTS.inc(stage=stage, action="truncate")
+        PROMPT_TOKENS_SAVED.inc(dropped, stage=stage, reason="truncate")
+        parts = parts[:max_parts]
+    logger.info(f"Split input of ~{estimate_tokens(text)} tokens into {len(parts)} parts")
+    return parts, truncated
+
+
+class _Budget:
+    """Tokens removed while filling one prompt, recorded once it is built."""
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.saved = {}
+
+    def text(self, text, max_tokens=PROMPT_MAX_INPUT_TOKENS):
+        raw = text or ""
+        normalized = normalize_text(raw)
+        self._save("dedupe", estimate_tokens(raw) - estimate_tokens(normalized))
+        if estimate_tokens(normalized) <= max_tokens:
+            return normalized
+        fitted = truncate_text(normalized, max_tokens)
+        logger.warning(f"{self.stage} input of ~{estimate_tokens(normalized)} tokens truncated to {max_tokens}")
+        OVERSIZED_INPUTS.inc(stage=self.stage, action="truncate")
+        self._save("truncate", estimate_tokens(normalized) - estimate_tokens(fitted))
+        return fitted
+
+    def categories(self, categories):
+        unique = unique_categories(categories)
+        self._save("dedupe", estimate_tokens(json.dumps(list(categories), ensure_ascii=False))
+                   - estimate_tokens(json.dumps(unique, ensure_ascii=False)))
+        return json.dumps(unique, ensure_ascii=False)
+
+    def _save(self, reason, tokens):
+        if tokens > 0:
+            self.saved[reason] = self.saved.get(reason, 0) + tokens
+
+    def finish(self, prompt):
+        saved = sum(self.saved.values())
+        for reason, tokens in self.saved.items():
+            PROMPT_TOKENS_SAVED.inc(tokens, stage=self.stage, reason=reason)
+        PROMPT_SAVED_PER_CALL.observe(saved, stage=self.stage)
+        PROMPT_TOKENS_ESTIMATED.observe(estimate_tokens(prompt), stage=self.stage)
+        if saved:
+            logger.debug(f"{self.stage} prompt ~{estimate_tokens(prompt)} tokens, saved ~{saved} ({self.saved})")
+        return prompt
+
+
+def _template(text):
+    return textwrap.dedent(text).strip()
+
+
+TRANSLATE_TEMPLATE = _template("""
+    You translate user input for expense tracking. {task}
+    Convert informal or ambiguous expressions into clear language, keep every amount and number
+    and keep the meaning and context intact.
+
+    Original text: "{text}"
+
+    Respond with the translated text only.
+""")
+
+TRANSLATE_TASKS = {
+    "ro": "The input is in Romanian; translate it to clear English.",
+    None: "The input is in English or Romanian; translate Romanian to clear English and return English unchanged.",
+}
+
+CLASSIFY_TEMPLATE = _template("""
+    You are an expense classification assistant.
+
+    Expense description: "{text}"
+    Available categories: {categories}
+
+    1. Classify each individual expense into the most appropriate category, choosing only from the list above.
+    2. Extract every monetary amount (a number, no currency symbols) and the item it was spent on;
+       use 0 when no amount is mentioned and the general description when no item is.
+    3. If the text doesn't seem like an expense, still extract something meaningful.
+
+    Return only a JSON array with at least one item, without markdown or code fences:
+    [{{"category": "category_from_list", "item": "description_of_item_or_expense", "amount": 0}}]
+""")
+
+FUSED_TEMPLATE = _template("""
+    You are an expense tracking assistant. The input can be in English or Romanian.
+
+    Original text: "{text}"
+    Available categories: {categories}
+
+    1. If the text is in Romanian, translate it to clear English; if it is already in English,
+       return it unchanged. Preserve all amounts and numbers.
+    2. Using the English text, classify each individual expense into the most appropriate category,
+       choosing only from the list above, and extract its item and amount (a number, no currency symbols).
+    3. Use 0 when no amount is mentioned and the general description when no item is; always return
+       at least one item in "classified_items".
+""")
+
+BATCH_TEMPLATE = _template("""
+    You are an expense tracking assistant. Each line below is an independent expense record
+    with an "id", a "text" in English or Romanian and its own list of "categories".
+
+    Records:
+    {records}
+
+    For EVERY record, echoing its "id":
+    1. If the text is in Romanian, translate it to clear English; if it is already in English,
+       return it unchanged. Preserve all amounts and numbers.
+    2. Classify each individual expense into the most appropriate of that record's own categories and
+       extract its item and amount (a number, no currency symbols; 0 when none is mentioned).
+""")
+
+# Estimated tokens of the batch instructions around the records
+BATCH_OVERHEAD_TOKENS = estimate_tokens(BATCH_TEMPLATE.format(records=""))
+
+
+def translation_prompt(text, source_language=None):
+    """Translation only; the direction is fixed when the language is known."""
+    budget = _Budget("translate")
+    task = TRANSLATE_TASKS.get(source_language, TRANSLATE_TASKS[None])
+    return budget.finish(TRANSLATE_TEMPLATE.format(task=task, text=budget.text(text)))
+
+
+def parse_translation(raw_response):
+    """The translated text, also when the model wraps it in a label or quotes."""
+    text = raw_response.strip()
+    match = re.match(r'-?\s*Translation:\s*"?(.*?)"?\s*(?:\n|$)', text, re.I | re.S)
+    if match:
+        text = match.group(1).strip()
+    if len(text) > 1 and text[0] == text[-1] == '"':
+        text = text[1:-1].strip()
+    return text
+
+
+def classification_prompt(translated_text, categories):
+    """Prompt asking for a JSON array of {category, item, amount} entries."""
+    budget = _Budget("classify")
+    return budget.finish(CLASSIFY_TEMPLATE.format(
+        text=budget.text(translated_text), categories=budget.categories(categories)))
+
+
+def fused_prompt(text, categories):
+    budget = _Budget("fused")
+    return budget.finish(FUSED_TEMPLATE.format(text=budget.text(text), categories=budget.categories(categories)))
+
+
+def batch_record_line(index, text, categories):
+    # Oversized records are split through run_pipeline_async before packing, so
+    # the cut is only a guard; not counted, lines are rebuilt for every estimate
+    return json.dumps({"id": index, "text": truncate_text(normalize_text(text), PROMPT_MAX_INPUT_TOKENS),
+                       "categories": unique_categories(categories)}, ensure_ascii=False)
+
+
+def batch_prompt(lines):
+    return _Budget("batch").finish(BATCH_TEMPLATE.format(records="\n".join(lines)))
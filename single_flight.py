@@ -0,0 +1,224 @@
+from logger import logger
+from pipeline_engine import remaining_budget
+import asyncio
+import copy
+import json
+import metrics
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Longest a follower waits for someone else's call before making its own (also capped by its request budget)
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", "60"))
+# Shared SQLite file coordinating identical calls across worker processes; empty keeps it per process
+SINGLE_FLIGHT_DB_PATH = os.getenv("SINGLE_FLIGHT_DB_PATH", "")
+# A leader that has not published after this long is presumed dead and its lease taken over
+SINGLE_FLIGHT_LEASE_SECONDS = float(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "90"))
+
+# How long a published result stays readable for followers in other processes
+RESULT_TTL_SECONDS = 10
+POLL_INTERVAL_SECONDS = 0.05
+
+FLIGHTS = metrics.registry.register(metrics.Counter(
+    "single_flight_calls_total",
+    "Coalesced LLM calls by role (leader, follower, remote_follower, wait_timeout)", ("role",)))
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class SharedFlightStore:
+    """
+    Cross-process leases and results in one SQLite table. The first process
+    to insert a key leads; the others poll until the result is published,
+    the lease is released (leader failed) or it expires (leader died).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._reset()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS single_flight ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, result TEXT, expires_at REAL NOT NULL)"
+            )
+        if hasattr(os, "register_at_fork"):
+            # Forked server workers are separate leaders with their own connections
+            os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self.owner = uuid.uuid4().hex
+        self._local = threading.local()
+
+    def _conn(self):
+        # One connection per thread; calls arrive from asyncio.to_thread workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def acquire(self, key):
+        """True if this process now leads `key`."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM single_flight WHERE key = ? AND expires_at < ?", (key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO single_flight (key, owner, expires_at) VALUES (?, ?, ?)",
+            (key, self.owner, now + SINGLE_FLIGHT_LEASE_SECONDS),
+        )
+        return cursor.rowcount == 1
+
+    def publish(self, key, result):
+        self._conn().execute(
+            "UPDATE single_flight SET result = ?, expires_at = ? WHERE key = ? AND owner = ?",
+            (json.dumps(result, ensure_ascii=False), time.time() + RESULT_TTL_SECONDS, key, self.owner),
+        )
+
+    def release(self, key):
+        self._conn().execute("DELETE FROM single_flight WHERE key = ? AND owner = ? AND result IS NULL",
+                             (key, self.owner))
+
+    def poll(self, key):
+        """("done", result), ("pending", None) or ("gone", None) when there is no live leader."""
+        row = self._conn().execute(
+            "SELECT result, expires_at FROM single_flight WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return "gone", None
+        if row[0] is None:
+            return "pending", None
+        return "done", json.loads(row[0])
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight async calls: the first caller for a key
+    starts the call, later callers await the same task, and every caller
+    gets its own copy of the result. Every Flask thread submits its LLM
+    calls to the one engine loop, so this covers all threads of the
+    process; with a SharedFlightStore it also spans processes.
+
+    Waiting is bounded by SINGLE_FLIGHT_WAIT_SECONDS and the caller's own
+    request budget; a follower that gives up makes its own call. A caller
+    that is cancelled simply stops waiting; the shared call is only
+    cancelled once nobody is waiting for it any more.
+    """
+
+    def __init__(self, store=None, enabled=True):
+        self.store = store
+        self.enabled = enabled
+        self._flights = {}
+
+    def _wait_timeout(self):
+        remaining = remaining_budget()
+        return SINGLE_FLIGHT_WAIT_SECONDS if remaining is None else min(SINGLE_FLIGHT_WAIT_SECONDS, remaining)
+
+    async def do(self, key, factory):
+        """
+        Return (result, leader) for factory(), a zero-argument coroutine
+        function. leader is False when another caller in this process
+        started the call; only leaders should store the result.
+        """
+        if not self.enabled:
+            return await factory(), True
+
+        flight = self._flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _Flight(asyncio.ensure_future(self._lead(key, factory)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            FLIGHTS.inc(role="follower")
+            logger.debug(f"Joining in-flight call {key[:12]}")
+
+        flight.waiters += 1
+        try:
+            # The leader's own call is already bounded by its stage timeouts
+            result = await asyncio.wait_for(asyncio.shield(flight.task), None if leader else self._wait_timeout())
+        except asyncio.TimeoutError:
+            FLIGHTS.inc(role="wait_timeout")
+            logger.warning(f"Gave up waiting for in-flight call {key[:12]}, calling directly")
+            return await factory(), True
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Forget it now: a caller arriving before the done-callback runs
+                # must start a new call, not join the cancelled one
+                self._forget(key, flight)
+                flight.task.cancel()
+        # Results are dicts the callers go on to modify: each caller, the leader
+        # included, gets its own copy, since the leader may resume first and
+        # change its result before any follower has copied it
+        return copy.deepcopy(result), leader
+
+    def _forget(self, key, flight):
+        # Only this flight's own entry: a newer call for the key may have replaced it
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def _lead(self, key, factory):
+        if self.store is None:
+            FLIGHTS.inc(role="leader")
+            return await factory()
+        try:
+            give_up = time.monotonic() + self._wait_timeout()
+            while not await asyncio.to_thread(self.store.acquire, key):
+                # Another process leads; poll for its result
+                state, result = await asyncio.to_thread(self.store.poll, key)
+                if state == "done":
+                    FLIGHTS.inc(role="remote_follower")
+                    return result
+                if time.monotonic() >= give_up:
+                    FLIGHTS.inc(role="wait_timeout")
+                    logger.warning(f"Gave up waiting for call {key[:12]} in another process, calling directly")
+                    return await factory()
+                if state == "pending":
+                    await asyncio.sleep(POLL_INTERVAL_SECONDS)
+        except sqlite3.Error as e:
+            logger.warning(f"Single-flight store unavailable, calling directly: {e}")
+            return await factory()
+
+        FLIGHTS.inc(role="leader")
+        published = False
+        try:
+            result = await factory()
+            try:
+                await asyncio.to_thread(self.store.publish, key, result)
+                published = True
+            except (sqlite3.Error, TypeError, ValueError) as e:
+                logger.warning(f"Could not publish single-flight result: {e}")
+            return result
+        finally:
+            if not published:
+                # Followers elsewhere stop waiting and make their own call
+                try:
+                    await asyncio.to_thread(self.store.release, key)
+                except sqlite3.Error:
+                    pass
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "shared_store": self.store is not None,
+            "in_flight": len(self._flights),
+        }
+
+
+single_flight = SingleFlight(
+    store=SharedFlightStore(SINGLE_FLIGHT_DB_PATH) if SINGLE_FLIGHT_DB_PATH else None,
+    enabled=SINGLE_FLIGHT_ENABLED,
+)
@@ -0,0 +1,245 @@
+from logger import log_payload, logger
+from cache import result_cache
+from pipeline_engine import STAGES, StageTimeout, run_stage
+from transcription import TranscriptionError, preprocess_audio_async, transcribe_audio_async
+from fast_path import try_fast_path
+from translate_and_classify import (
+    CLASSIFY_GENERATION_CONFIG,
+    LLM_MODEL_NAME,
+    classification_ok,
+    classification_prompt,
+    classify_cache_key,
+    clean_classification,
+    fallback_classification,
+    response_flags,
+    translate_text_async,
+    untranslated,
+)
+import asyncio
+import json
+import metrics
+import model_registry
+import upstream
+
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+SSE_MIMETYPE = "text/event-stream"
+
+
+class JSONArrayStreamParser:
+    """
+    Incrementally pulls complete top-level elements out of a JSON array that
+    arrives in arbitrary chunks. Anything before the opening bracket (such as
+    a ```json fence) is skipped.
+    """
+
+    def __init__(self):
+        self._started = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._element = []
+
+    def feed(self, chunk):
+        """Consume a chunk and return the list of elements it completed."""
+        completed = []
+        for char in chunk:
+            if self._done:
+                break
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                continue
+
+            if self._depth == 0:
+                if char == "]":
+                    self._done = True
+                elif char in "{[":
+                    self._depth = 1
+                    self._element = [char]
+                # Whitespace, commas and bare scalars between elements are ignored
+                continue
+
+            self._element.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    raw = "".join(self._element)
+                    self._element = []
+                    try:
+                        completed.append(json.loads(raw))
+                    except json.JSONDecodeError as e:
+                        logger.warning(f"Skipping malformed streamed element: {e}")
+        return completed
+
+
+def _chunk_text(chunk):
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without parts (e.g. the final usage-only chunk) have no text
+        return ""
+
+
+async def classify_expense_stream_async(translated_text, categories, bypass_cache=False):
+    """
+    Streaming classify_expense(): yields each cleaned item as soon as the model
+    has produced it. Uses and fills the same cache entry as classify_expense().
+    """
+    translated_text = translated_text.strip()
+    key = classify_cache_key(translated_text, categories)
+    if result_cache.enabled and not bypass_cache:
+        cached = result_cache.get(key)
+        if cached is not None:
+            for item in cached:
+                yield item
+            return
+
+    items = []
+    try:
+        model = model_registry.get_model(LLM_MODEL_NAME, CLASSIFY_GENERATION_CONFIG)
+        response = await run_stage(
+            "classify", upstream.call_async, "gemini", model.generate_content_async,
+            classification_prompt(translated_text, categories), stream=True,
+        )
+        parser = JSONArrayStreamParser()
+        chunks = response.__aiter__()
+        while True:
+            # Like Stage.run: each wait gets the stage timeout, cut short by the request budget
+            timeout = STAGES["classify"].budgeted_timeout()
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                break
+            except asyncio.TimeoutError:
+                raise StageTimeout("classify", round(timeout, 3)) from None
+            for entry in parser.feed(_chunk_text(chunk)):
+                if not isinstance(entry, dict):
+                    continue
+                item = clean_classification([entry], translated_text, categories)[0]
+                items.append(item)
+                yield item
+        # Usage is only complete once the stream has been consumed
+        metrics.record_usage("classify", response)
+    except Exception as e:
+        logger.exception("Error in classify_expense_stream_async")
+        if not items:
+            fallback = fallback_classification(translated_text, categories)
+            fallback[0]["error"] = str(e)
+            yield fallback[0]
+        return
+
+    if not items:
+        logger.warning("Streamed classification returned no items")
+        yield fallback_classification(translated_text, categories)[0]
+        return
+
+    log_payload("INFO", "Streamed classification results", items)
+    if result_cache.enabled and classification_ok(items):
+        result_cache.set(key, items)
+
+
+async def classify_events(text, categories, bypass_cache=False):
+    """Yield (event, data) pairs: translation, one item per classified item, done."""
+    fast_items = try_fast_path(text, categories)
+    if fast_items is not None:
+        flags = response_flags(untranslated(text))
+        yield "translation", {"original_text": text, "translated_text": text, **flags}
+        for item in fast_items:
+            yield "item", item
+        yield "done", {
+            "original_text": text,
+            "translated_text": text,
+            "classified_items": fast_items,
+            "status": "success",
+            **flags
+        }
+        return
+
+    translation = await translate_text_async(text, categories, bypass_cache=bypass_cache)
+    if translation.get('status') == 'error':
+        yield "error", {
+            "error": "Translation failed",
+            "details": translation.get('error'),
+            "original_text": text,
+            "translated_text": "",
+            "classified_items": []
+        }
+        return
+
+    translated_text = translation['translated_text']
+    yield "translation", {"original_text": text, "translated_text": translated_text}
+
+    classification_list = []
+    async for item in classify_expense_stream_async(translated_text, categories, bypass_cache=bypass_cache):
+        classification_list.append(item)
+        yield "item", item
+
+    yield "done", {
+        "original_text": text,
+        "translated_text": translated_text,
+        "classified_items": classification_list,
+        "status": "success"
+    }
+
+
+async def speech_events(audio, categories, bypass_cache=False, backend=None):
+    """Like classify_events(), preceded by a transcript event."""
+    prepared, preprocessing = await preprocess_audio_async(audio)
+    if not preprocessing["speech_detected"]:
+        yield "error", {
+            "error": "No speech detected",
+            "details": "The audio file contains only silence",
+            "original_text": "",
+            "translated_text": "",
+            "classified_items": [],
+            "audio_preprocessing": preprocessing
+        }
+        return
+
+    try:
+        transcript = await transcribe_audio_async(prepared, backend)
+    except TranscriptionError as e:
+        yield "error", {
+            "error": "Speech-to-text service unavailable",
+            "details": str(e),
+            "suggestion": "Please try using the text classification endpoint directly",
+            "fallback_transcript": "Could not transcribe audio"
+        }
+        return
+
+    if not transcript or not transcript.strip():
+        logger.warning("Empty transcript received")
+        yield "error", {
+            "error": "No speech detected",
+            "details": "The audio file did not produce any transcribed text",
+            "original_text": "",
+            "translated_text": "",
+            "classified_items": []
+        }
+        return
+
+    transcript = transcript.strip()
+    yield "transcript", {"original_text": transcript, "audio_preprocessing": preprocessing}
+
+    async for event in classify_events(transcript, categories, bypass_cache=bypass_cache):
+        yield event
+
+
+def format_event(event, data, fmt):
+    payload = json.dumps(data, ensure_ascii=False)
+    if fmt == "sse":
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, "data": data}, ensure_ascii=False) + "\n"
@@ -0,0 +1,22 @@
+"""
+Shared test setup: the repository root on sys.path, and every log file and
+database the modules open (at import or on first use) pointed at a throwaway directory.
+"""
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+_scratch = tempfile.mkdtemp(prefix="codeshine-tests-")
+for name, value in {
+    "LOG_FILE": os.path.join(_scratch, "app.log"),
+    "LOG_STDERR": "false",
+    "EXPENSE_DB_PATH": os.path.join(_scratch, "expenses.db"),
+    "JOBS_DB_PATH": os.path.join(_scratch, "jobs.db"),
+    "JOBS_SPOOL_DIR": os.path.join(_scratch, "job_spool"),
+    "BATCH_AUDIO_OUTPUT_DIR": os.path.join(_scratch, "batch_results"),
+}.items():
+    os.environ.setdefault(name, value)
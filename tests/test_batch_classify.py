@@ -0,0 +1,34 @@
+from batch_classify import _record_line, pack_records
+from prompts import BATCH_OVERHEAD_TOKENS, estimate_tokens
+
+
+def records(*texts):
+    return [(index, {"text": text, "categories": ["groceries", "going out"]}) for index, text in enumerate(texts)]
+
+
+def pack_tokens(pack):
+    return BATCH_OVERHEAD_TOKENS + sum(estimate_tokens(_record_line(index, record)) for index, record in pack)
+
+
+def test_packs_stay_under_the_token_budget_in_order():
+    indexed = records(*(f"Am dat {i} lei pe paine la magazinul din colt" for i in range(40)))
+    budget = BATCH_OVERHEAD_TOKENS + 100
+    packs = pack_records(indexed, token_budget=budget, max_per_prompt=100)
+    assert len(packs) > 1
+    assert all(pack_tokens(pack) <= budget for pack in packs)
+    assert [index for pack in packs for index, _ in pack] == list(range(40))
+
+
+def test_max_records_per_prompt():
+    packs = pack_records(records(*["bread 5"] * 7), token_budget=10_000, max_per_prompt=3)
+    assert [len(pack) for pack in packs] == [3, 3, 1]
+
+
+def test_record_over_the_budget_gets_its_own_pack():
+    indexed = records("bread 5", "word " * 400, "milk 7")
+    packs = pack_records(indexed, token_budget=BATCH_OVERHEAD_TOKENS + 50, max_per_prompt=25)
+    assert [[index for index, _ in pack] for pack in packs] == [[0], [1], [2]]
+
+
+def test_no_records_no_packs():
+    assert pack_records([]) == []
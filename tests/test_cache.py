@@ -0,0 +1,112 @@
+import asyncio
+
+import pytest
+
+from cache import LRUTier, ResultCache, SQLiteTier, make_key
+
+
+def key(text="Paine si lapte 12 lei", categories=("groceries", "transport"), **overrides):
+    args = {"kind": "classify", "model_name": "gemini-test", "prompt_version": "1", **overrides}
+    return make_key(args["kind"], text, list(categories), args["model_name"], args["prompt_version"])
+
+
+def test_key_ignores_category_order():
+    assert key(categories=["groceries", "transport", "fun"]) == key(categories=["fun", "transport", "groceries"])
+
+
+def test_key_ignores_case_and_whitespace():
+    assert key("  Paine si  LAPTE\n12 lei ") == key("paine si lapte 12 lei")
+    assert key(categories=[" Groceries", "TRANSPORT "]) == key(categories=["groceries", "transport"])
+
+
+@pytest.mark.parametrize("override", [
+    {"text": "Paine si lapte 13 lei"},
+    {"categories": ("groceries",)},
+    {"kind": "translate"},
+    {"model_name": "gemini-other"},
+    {"prompt_version": "2"},
+])
+def test_key_changes_with_every_input(override):
+    assert key(**override) != key()
+
+
+def test_lru_evicts_the_least_recently_used_entry():
+    tier = LRUTier(max_entries=2, ttl_seconds=60)
+    tier.set("a", "1")
+    tier.set("b", "2")
+    assert tier.get("a") == "1"  # "b" is now the oldest
+    tier.set("c", "3")
+    assert tier.get("b") is None
+    assert tier.get("a") == "1" and tier.get("c") == "3"
+    assert tier.evictions == 1
+    assert len(tier) == 2
+
+
+def test_lru_drops_expired_entries():
+    tier = LRUTier(max_entries=2, ttl_seconds=-1)
+    tier.set("a", "1")
+    assert tier.get("a") is None
+    assert len(tier) == 0
+
+
+def test_sqlite_tier_survives_a_reopen(tmp_path):
+    path = str(tmp_path / "cache" / "llm.db")
+    SQLiteTier(path, ttl_seconds=60).set("a", '{"items": []}')
+    assert SQLiteTier(path, ttl_seconds=60).get("a") == '{"items": []}'
+
+
+def test_sqlite_tier_drops_expired_rows(tmp_path):
+    tier = SQLiteTier(str(tmp_path / "llm.db"), ttl_seconds=-1)
+    tier.set("a", "1")
+    assert tier.get("a") is None
+
+
+def test_disk_hit_after_a_restart_fills_the_memory_tier(tmp_path):
+    path = str(tmp_path / "llm.db")
+    ResultCache(LRUTier(), SQLiteTier(path)).set("a", [{"category": "groceries"}])
+
+    cache = ResultCache(LRUTier(), SQLiteTier(path))
+    assert cache.get("a") == [{"category": "groceries"}]
+    assert cache.get("a") == [{"category": "groceries"}]
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["memory_hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_cached_call_runs_once_per_normalized_input():
+    cache, calls = ResultCache(LRUTier()), []
+
+    @cache.cached("classify", lambda text, categories: key(text, categories), lambda result: True)
+    def classify(text, categories):
+        calls.append(text)
+        return [{"category": categories[0]}]
+
+    classify("Paine 12 lei", ["groceries", "fun"])
+    classify("  paine 12 LEI", ["fun", "groceries"])
+    assert len(calls) == 1
+    classify("Paine 12 lei", ["groceries", "fun"], bypass_cache=True)
+    assert len(calls) == 2
+
+
+def test_cached_result_is_a_fresh_copy():
+    cache = ResultCache(LRUTier())
+
+    @cache.cached("classify", lambda text, categories: key(text, categories), lambda result: True)
+    async def classify(text, categories):
+        return [{"category": "groceries"}]
+
+    first = asyncio.run(classify("Paine 12 lei", ["groceries"]))
+    first[0]["category"] = "changed"
+    assert asyncio.run(classify("Paine 12 lei", ["groceries"])) == [{"category": "groceries"}]
+
+
+def test_error_results_are_not_cached():
+    cache, calls = ResultCache(LRUTier()), []
+
+    @cache.cached("classify", lambda text, categories: key(text, categories), lambda result: "error" not in result)
+    def classify(text, categories):
+        calls.append(text)
+        return {"error": "upstream failed"}
+
+    classify("Paine 12 lei", ["groceries"])
+    classify("Paine 12 lei", ["groceries"])
+    assert len(calls) == 2
@@ -0,0 +1,85 @@
+import pytest
+
+import category_index
+from category_index import CategoryIndex, get_index, normalize_category, split_categories
+
+CATEGORIES = ["groceries", "transport", "going out", "house expense", "café"]
+
+
+@pytest.fixture
+def index():
+    return CategoryIndex(CATEGORIES)
+
+
+def test_normalize_category():
+    assert normalize_category(" Going-Out! ") == "going out"
+    assert normalize_category("Café_Bar") == "cafe bar"
+
+
+def test_split_categories_flattens_and_dedupes():
+    assert split_categories(["groceries, Transport", " ", "GROCERIES", "fun"]) == ["groceries", "Transport", "fun"]
+    assert split_categories("groceries,fun") == ["groceries", "fun"]
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("groceries", "groceries"),
+    ("GROCERIES", "groceries"),
+    ("going_out", "going out"),
+    ("Cafe", "café"),
+])
+def test_exact_match(index, name, expected):
+    assert index.match(name) == expected
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("groc", "groceries"),
+    ("trans", "transport"),
+    ("going o", "going out"),
+])
+def test_prefix_match(index, name, expected):
+    assert index.match(name) == expected
+
+
+def test_prefix_shorter_than_the_minimum_does_not_match(index):
+    assert index.match("gr") is None
+
+
+def test_category_inside_the_answer(index):
+    assert index.match("groceries and food") == "groceries"
+    assert index.match("evening going out with friends") == "going out"
+
+
+def test_shared_words(index):
+    assert index.match("house") == "house expense"
+
+
+@pytest.mark.parametrize("name, expected", [
+    ("grocereis", "groceries"),
+    ("transprot", "transport"),
+])
+def test_fuzzy_match(index, name, expected):
+    assert index.match(name) == expected
+
+
+def test_fuzzy_match_can_be_disabled(index, monkeypatch):
+    monkeypatch.setattr(category_index, "CATEGORY_FUZZY_CUTOFF", 0)
+    assert index.match("grocereis") is None
+
+
+def test_unrelated_name_does_not_match(index):
+    assert index.match("electronics") is None
+
+
+def test_resolve_tries_each_part_then_falls_back_to_the_first_category(index):
+    assert index.resolve("electronics, transport") == "transport"
+    assert index.resolve("electronics") == "groceries"
+    assert CategoryIndex([]).resolve("anything") is None
+
+
+def test_earlier_categories_win_ties():
+    assert CategoryIndex(["food out", "food in"]).match("food") == "food out"
+
+
+def test_get_index_is_built_once_per_list():
+    assert get_index(CATEGORIES) is get_index(tuple(CATEGORIES))
+    assert get_index("groceries").categories == ["groceries"]
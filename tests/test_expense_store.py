@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from expense_store import DAY_SECONDS, ExpenseStore, parse_timestamp
+
+BASE = 20000 * DAY_SECONDS  # midnight UTC
+USERS = ["alice", "bob"]
+CATEGORIES = ["groceries", "Transport", "fun"]
+
+
+@pytest.fixture(scope="module")
+def store_and_rows(tmp_path_factory):
+    store = ExpenseStore(str(tmp_path_factory.mktemp("expenses") / "expenses.db"))
+    rng = random.Random(7)
+    rows = []
+    for _ in range(400):
+        row = (
+            rng.choice(USERS), rng.choice(CATEGORIES),
+            round(rng.uniform(1, 200), 2), BASE + rng.uniform(0, 5 * DAY_SECONDS),
+        )
+        rows.append(row)
+        store.record([{"category": row[1], "item": "x", "amount": row[2]}], row[0], "test", row[3])
+    # Case-insensitive categories share a rollup
+    store.record([{"category": "transport", "amount": 10}], "alice", "test", BASE + 1.5 * DAY_SECONDS)
+    rows.append(("alice", "Transport", 10, BASE + 1.5 * DAY_SECONDS))
+    # Edges exactly on midnight
+    for day in range(6):
+        store.record([{"category": "fun", "amount": 1}], "bob", "test", BASE + day * DAY_SECONDS)
+        rows.append(("bob", "fun", 1, BASE + day * DAY_SECONDS))
+    assert store.flush(10)
+    yield store, rows
+    store.stop()
+
+
+def brute_force(rows, user_id=None, category=None, start=None, end=None):
+    totals = {}
+    for user, name, amount, created_at in rows:
+        if user_id is not None and user != user_id:
+            continue
+        if category is not None and name.casefold() != category.casefold():
+            continue
+        if (start is not None and created_at < start) or (end is not None and created_at >= end):
+            continue
+        total, count = totals.get(name.casefold(), (0.0, 0))
+        totals[name.casefold()] = (total + amount, count + 1)
+    return totals
+
+
+def edges():
+    rng = random.Random(11)
+    points = [None, BASE, BASE + DAY_SECONDS, BASE + 3 * DAY_SECONDS, BASE - 10, BASE + 6 * DAY_SECONDS]
+    points += [BASE + rng.uniform(0, 5 * DAY_SECONDS) for _ in range(6)]
+    return points
+
+
+@pytest.mark.parametrize("user_id, category", [(None, None), ("alice", None), (None, "transport"), ("bob", "fun")])
+def test_aggregate_matches_a_brute_force_sum(store_and_rows, user_id, category):
+    store, rows = store_and_rows
+    for start in edges():
+        for end in edges():
+            got = {name.casefold(): value for name, value in store._aggregate(user_id, category, start, end).items()}
+            expected = brute_force(rows, user_id, category, start, end)
+            assert got.keys() == expected.keys(), (start, end)
+            for name, (total, count) in expected.items():
+                assert got[name] == (pytest.approx(total), count), (start, end)
+
+
+def test_range_sum_and_category_totals_agree(store_and_rows):
+    store, _ = store_and_rows
+    start, end = BASE + 0.25 * DAY_SECONDS, BASE + 3.75 * DAY_SECONDS
+    totals = store.category_totals(None, start, end)
+    assert [entry["total"] for entry in totals] == sorted((entry["total"] for entry in totals), reverse=True)
+    summed = store.range_sum(None, None, start, end)
+    assert summed["count"] == sum(entry["count"] for entry in totals)
+    assert summed["total"] == pytest.approx(sum(entry["total"] for entry in totals), abs=0.05)
+
+
+def test_parse_timestamp():
+    assert parse_timestamp("1700000000") == 1700000000
+    assert parse_timestamp("2024-01-02") == parse_timestamp("2024-01-02T00:00:00Z")
+    assert parse_timestamp("2024-01-02T02:00:00+02:00") == parse_timestamp("2024-01-02")
+    assert parse_timestamp(None) is None
+    with pytest.raises(ValueError):
+        parse_timestamp("yesterday")
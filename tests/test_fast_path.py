@@ -0,0 +1,85 @@
+import pytest
+
+import fast_path
+from fast_path import FAST_PATH_THRESHOLD, fast_classify, parse_number, try_fast_path
+from translate_and_classify import response_flags, untranslated
+
+CATEGORIES = ["house expense", "groceries", "going out"]
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(fast_path, "FAST_PATH_ENABLED", True)
+
+
+@pytest.mark.parametrize("token, expected", [
+    ("50", (50.0, False)),
+    ("12,5", (12.5, False)),
+    ("12.50", (12.5, False)),
+    ("0,5", (0.5, False)),
+    ("1,500,000", (1500000.0, False)),
+    ("1.500.000", (1500000.0, False)),
+    ("1,500.50", (1500.5, False)),
+    ("1.500,50", (1500.5, False)),
+    ("1,500", (1500.0, True)),
+    ("2.500", (2500.0, True)),
+])
+def test_parse_number(token, expected):
+    assert parse_number(token) == expected
+
+
+@pytest.mark.parametrize("text, category, amount", [
+    ("pizza 50 lei", "going out", 50.0),
+    ("rent 1500", "house expense", 1500.0),
+    ("paine 12,5 lei", "groceries", 12.5),
+    ("chirie 1.500,50 lei", "house expense", 1500.5),
+    ("douazeci si cinci lei pe cafea", "going out", 25.0),
+])
+def test_confident_hits(text, category, amount):
+    items = try_fast_path(text, CATEGORIES)
+    assert items == [{"category": category, "item": items[0]["item"], "amount": amount}]
+
+
+@pytest.mark.parametrize("text", [
+    # "1,500" is 1500 in English and 1.5 in Romanian
+    "rent 1,500",
+    "chirie 2.500 lei",
+    # Not an expense at all
+    "I did not pay rent 2500",
+    "n-am platit chiria 2500",
+    "nu am dat 50 lei pe pizza",
+    "refund from lidl 50",
+    "am primit 50 lei inapoi de la lidl",
+])
+def test_uncertain_inputs_go_to_the_llm(text):
+    items, confidence = fast_classify(text, CATEGORIES)
+    assert confidence < FAST_PATH_THRESHOLD
+    assert try_fast_path(text, CATEGORIES) is None
+
+
+def test_no_matching_category():
+    assert fast_classify("something odd 12", CATEGORIES) == (None, 0.0)
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(fast_path, "FAST_PATH_ENABLED", False)
+    assert try_fast_path("pizza 50 lei", CATEGORIES) is None
+
+
+def test_stats_count_hits_and_misses():
+    before = fast_path.stats()
+    try_fast_path("pizza 50 lei", CATEGORIES)
+    try_fast_path("refund from lidl 50", CATEGORIES)
+    after = fast_path.stats()
+    assert after["attempts"] == before["attempts"] + 2
+    assert after["hits"] == before["hits"] + 1
+
+
+def test_untranslated_romanian_is_flagged():
+    translation = untranslated("pizza 50 lei cu prietenii")
+    assert translation["translated_text"] == "pizza 50 lei cu prietenii"
+    assert response_flags(translation) == {"translated": False, "source_language": "ro"}
+
+
+def test_untranslated_english_needs_no_flag():
+    assert response_flags(untranslated("pizza with friends for 50 dollars")) == {}
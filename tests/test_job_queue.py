@@ -0,0 +1,98 @@
+import pytest
+
+import job_queue
+from job_queue import JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"), str(tmp_path / "spool"))
+
+
+def expire_leases(monkeypatch):
+    # Leases granted from now on have already run out when the next claim looks
+    monkeypatch.setattr(job_queue, "JOB_LEASE_SECONDS", -1)
+
+
+def test_claim_leases_a_job_once(store):
+    job_id = store.submit("speech", {"n": 1})["job_id"]
+    job = store.claim("worker-a")
+    assert job["id"] == job_id
+    assert job["attempts"] == 1
+    assert job["params"] == {"n": 1}
+    assert store.get(job_id)["status"] == "running"
+    assert store.claim("worker-b") is None
+
+
+def test_expired_lease_is_claimed_again(store, monkeypatch):
+    expire_leases(monkeypatch)
+    job_id = store.submit("speech", {})["job_id"]
+    store.claim("worker-a")
+    job = store.claim("worker-b")
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    # The worker that lost the lease can no longer record an outcome
+    assert store.complete({**job, "attempts": 1}, "worker-a", 200, {"ok": True}) is None
+    assert store.complete(job, "worker-b", 200, {"ok": True}) == "succeeded"
+    assert store.get(job_id)["result"] == {"ok": True}
+
+
+def test_renewed_lease_is_not_taken_over(store):
+    job_id = store.submit("speech", {})["job_id"]
+    store.claim("worker-a")
+    store.renew([job_id], "worker-a")
+    assert store.claim("worker-b") is None
+
+
+def test_job_fails_after_its_last_abandoned_attempt(store, monkeypatch):
+    expire_leases(monkeypatch)
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 2)
+    job_id = store.submit("speech", {})["job_id"]
+    assert store.claim("worker-a")["attempts"] == 1
+    assert store.claim("worker-b")["attempts"] == 2
+    assert store.claim("worker-c") is None
+    job = store.get(job_id)
+    assert job["status"] == "failed"
+    assert "Abandoned" in job["error"]
+
+
+def test_retryable_failure_is_queued_after_a_backoff(store):
+    job_id = store.submit("speech", {})["job_id"]
+    job = store.claim("worker-a")
+    assert store.complete(job, "worker-a", 500, None, error="upstream down", retryable=True) == "queued"
+    assert store.get(job_id)["status"] == "queued"
+    # Not available again before the backoff has passed
+    assert store.claim("worker-a") is None
+
+
+def test_retried_job_is_claimed_again_with_the_next_attempt(store, monkeypatch):
+    monkeypatch.setattr(job_queue, "RETRY_BASE_SECONDS", 0)
+    job_id = store.submit("speech", {})["job_id"]
+    job = store.claim("worker-a")
+    store.complete(job, "worker-a", 500, None, error="upstream down", retryable=True)
+    job = store.claim("worker-b")
+    assert job["id"] == job_id
+    assert job["attempts"] == 2
+    assert store.complete(job, "worker-b", 200, {"ok": True}) == "succeeded"
+
+
+def test_retryable_failure_without_attempts_left_fails(store, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 1)
+    job_id = store.submit("speech", {})["job_id"]
+    job = store.claim("worker-a")
+    assert store.complete(job, "worker-a", 500, {"error": "x"}, error="x", retryable=True) == "failed"
+    assert store.get(job_id)["status"] == "failed"
+
+
+def test_retry_delay_backs_off_up_to_the_maximum():
+    delays = [job_queue.retry_delay(attempt) for attempt in range(1, 12)]
+    assert delays[:3] == [job_queue.RETRY_BASE_SECONDS, 2 * job_queue.RETRY_BASE_SECONDS, 4 * job_queue.RETRY_BASE_SECONDS]
+    assert delays == sorted(delays)
+    assert delays[-1] == job_queue.RETRY_MAX_SECONDS
+
+
+def test_release_hands_the_job_back_without_counting_the_attempt(store):
+    job_id = store.submit("speech", {})["job_id"]
+    store.claim("worker-a")
+    store.release([job_id], "worker-a")
+    assert store.claim("worker-b")["attempts"] == 1
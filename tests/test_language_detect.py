@@ -0,0 +1,28 @@
+import pytest
+
+from bench_language_detect import CORPUS, load_corpus
+from language_detect import detect_language
+
+# The corpus currently scores 100%; the floor leaves room for tuning the weights
+MIN_ACCURACY = 0.95
+
+
+def test_corpus_accuracy():
+    samples = load_corpus(CORPUS)
+    correct = sum(1 for expected, text in samples if detect_language(text) == expected)
+    assert correct / len(samples) >= MIN_ACCURACY
+
+
+def test_romanian_is_never_detected_as_english():
+    # Text detected as English skips translation, so this is the costly mistake
+    wrong = [text for expected, text in load_corpus(CORPUS) if expected == "ro" and detect_language(text) == "en"]
+    assert wrong == []
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("electricity bill 500", "unknown"),
+    ("coffee 15 lei", "ro"),
+    ("", "unknown"),
+])
+def test_edge_cases(text, expected):
+    assert detect_language(text) == expected
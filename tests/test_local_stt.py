@@ -0,0 +1,56 @@
+import os
+import time
+
+import pytest
+
+import local_stt
+
+
+def slow_loader():
+    # The first worker loads at once, the others well after it could have answered every task
+    try:
+        os.close(os.open(os.path.join(os.environ["TEST_STT_DIR"], "first"), os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        time.sleep(float(os.environ["TEST_STT_LOAD_SECONDS"]))
+    return lambda pcm: "loaded"
+
+
+def failing_loader():
+    raise OSError("model file not found")
+
+
+@pytest.fixture
+def engine(monkeypatch, tmp_path):
+    # Spawned workers inherit the environment, not the test's monkeypatches
+    monkeypatch.setenv("TEST_STT_DIR", str(tmp_path))
+    monkeypatch.setenv("TEST_STT_LOAD_SECONDS", "0.5")
+
+    def use(loader, workers=3):
+        monkeypatch.setitem(local_stt.ENGINES, "fake", loader)
+        monkeypatch.setattr(local_stt, "LOCAL_STT_ENGINE", "fake")
+        monkeypatch.setattr(local_stt, "LOCAL_STT_WORKERS", workers)
+        monkeypatch.setattr(local_stt, "LOCAL_STT_START_METHOD", "spawn")
+
+    yield use
+    local_stt.shutdown()
+
+
+def test_warm_up_waits_for_every_worker_to_load(engine):
+    engine(slow_loader)
+    pids = local_stt.warm_up()
+    assert len(pids) == 3
+    # Already loaded: a second warm-up returns at once
+    assert local_stt.warm_up() == pids
+
+
+def test_warm_up_reports_a_failed_load(engine):
+    engine(failing_loader, workers=2)
+    with pytest.raises(local_stt.LocalSTTUnavailable, match="fake: OSError: model file not found"):
+        local_stt.warm_up()
+
+
+def test_warm_up_gives_up_after_the_load_timeout(engine, monkeypatch):
+    engine(slow_loader, workers=2)
+    monkeypatch.setattr(local_stt, "LOCAL_STT_LOAD_TIMEOUT_SECONDS", 0.2)
+    with pytest.raises(local_stt.LocalSTTUnavailable, match="did not load the model"):
+        local_stt.warm_up()
@@ -0,0 +1,107 @@
+import json
+import subprocess
+import sys
+
+import pytest
+from loguru import logger
+
+import logger as app_logger  # noqa: F401 - replaces loguru's default stderr handler
+
+import log_analytics
+
+REQUESTS = [
+    ("INFO", "Incoming request data: {'text': 'Paine si lapte 12 lei', 'categories': ['groceries', 'fun']}"),
+    ("INFO", "Running two_step pipeline"),
+    ("DEBUG", "Translation result: {'translated_text': 'Bread and milk 12 lei', 'status': 'success'}"),
+    ("DEBUG", 'Raw model response: [{"category": "groceries", "item": "bread and milk", "amount": 12}]'),
+    ("INFO", "Final cleaned results: [{'category': 'groceries', 'item': 'bread and milk', 'amount': 12.0}]"),
+    ("INFO", "Processing audio file: receipt.mp3"),
+    ("INFO", "Final transcript (length: 24): Am dat 40 lei pe \"bilete\""),
+    ("INFO", "Running fused pipeline"),
+    ("WARNING", "Model answer was not valid JSON\nsecond line of the warning"),
+    ("EXCEPTION", "Error in classify_expense"),
+    ("INFO", "Using fallback result: [{'category': 'groceries', 'item': 'unknown', 'amount': 0.0}]"),
+    ("INFO", "Incoming request data: {'text': 'Cinema 30 lei', 'categories': ['fun']}"),
+    ("INFO", "Fast path resolved 'Cinema 30 lei' with confidence 0.9: [{'category': 'fun', 'item': 'cinema', 'amount': 30.0}]"),
+    ("INFO", "Unrelated line that is skipped"),
+    ("INFO", "Incoming request data: {'text': 'Taxi 25 lei', 'categories': ['transport']}"),
+    ("INFO", "Running two_step pipeline"),
+    ("DEBUG", "Processing text for classification: Taxi 25 lei"),
+    ("INFO", "Final cleaned results: [{'category': 'transport', 'item': 'taxi', 'amount': 25.0}]"),
+]
+
+
+@pytest.fixture(scope="module")
+def logs(tmp_path_factory):
+    """The same entries in the text format and as LOG_JSON lines, repeated to span many chunks."""
+    directory = tmp_path_factory.mktemp("logs")
+    text_path, json_path = directory / "app.log", directory / "app.json.log"
+    only_fixture = lambda record: record["extra"].get("fixture", False)  # noqa: E731
+    handlers = [
+        logger.add(str(text_path), level="DEBUG", filter=only_fixture),
+        logger.add(str(json_path), level="DEBUG", filter=only_fixture, serialize=True),
+    ]
+    log = logger.bind(fixture=True)
+    try:
+        for _ in range(20):
+            for level, message in REQUESTS:
+                if level == "EXCEPTION":
+                    try:
+                        raise ValueError("bad model output")
+                    except ValueError:
+                        log.exception(message)
+                else:
+                    log.log(level, message)
+    finally:
+        for handler in handlers:
+            logger.remove(handler)
+    return str(text_path), str(json_path)
+
+
+def records(path, **options):
+    # id, file and offset locate the record in its file; everything else must match across formats
+    return [
+        {key: value for key, value in record.items() if key not in ("id", "file", "offset")}
+        for record in log_analytics.iter_records([path], **options)
+    ]
+
+
+def test_text_log_records(logs):
+    found = records(logs[0], workers=1)
+    assert len(found) == 80
+    classify, speech, fast = found[:3]
+    assert classify["status"] == "success"
+    assert classify["mode"] == "two_step"
+    assert classify["categories"] == ["groceries", "fun"]
+    assert classify["translated_text"] == "Bread and milk 12 lei"
+    assert classify["classified_items"] == [{"category": "groceries", "item": "bread and milk", "amount": 12.0}]
+    assert speech["source"] == "speech"
+    assert speech["transcript"] == 'Am dat 40 lei pe "bilete"'
+    assert speech["status"] == "error" and speech["fallback"] is True
+    assert [warning["message"] for warning in speech["warnings"]] == [
+        "Model answer was not valid JSON (second line of the warning)"]
+    assert [error["message"] for error in speech["errors"]] == ["Error in classify_expense (ValueError: bad model output)"]
+    assert fast["fast_path"] is True
+    assert fast["classified_items"] == [{"category": "fun", "item": "cinema", "amount": 30.0}]
+
+
+def test_json_log_gives_the_same_records(logs):
+    assert records(logs[1], workers=1) == records(logs[0], workers=1)
+
+
+@pytest.mark.parametrize("fmt", [0, 1])
+def test_parallel_chunks_match_a_serial_scan(logs, fmt):
+    serial = records(logs[fmt], workers=1)
+    # Chunks far smaller than a request, so records straddle many boundaries
+    assert records(logs[fmt], workers=1, chunk_bytes=700) == serial
+    assert records(logs[fmt], workers=3, chunk_bytes=700) == serial
+
+
+def test_unrecognized_log_fails_loudly(tmp_path):
+    path = tmp_path / "other.log"
+    path.write_text("\n".join(json.dumps({"ts": i, "msg": "hello"}) for i in range(10)) + "\n")
+    result = subprocess.run(
+        [sys.executable, log_analytics.__file__, str(path), "--workers", "1"], capture_output=True, text=True,
+    )
+    assert result.returncode == 1
+    assert "no request records found" in result.stderr
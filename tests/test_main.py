@@ -0,0 +1,70 @@
+import os
+import runpy
+import subprocess
+import sys
+
+import pytest
+
+gunicorn_config = pytest.importorskip("gunicorn.config")
+
+import main
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "gunicorn.conf.py")
+
+
+def load_config(monkeypatch, **env):
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    settings = runpy.run_path(CONFIG_PATH)
+    config = gunicorn_config.Config()
+    # Config.set validates each value the way gunicorn does when it reads the file
+    for name, value in settings.items():
+        if name in config.settings:
+            config.set(name, value)
+    return config
+
+
+def test_config_reads_the_serve_settings(monkeypatch):
+    config = load_config(
+        monkeypatch, SERVE_HOST="127.0.0.1", SERVE_PORT="6000", SERVE_WORKERS="3",
+        SERVE_THREADS="8", SERVE_GRACEFUL_TIMEOUT="12", SERVE_KEEPALIVE_SECONDS="2",
+    )
+    assert config.bind == ["127.0.0.1:6000"]
+    assert config.workers == 3
+    assert config.threads == 8
+    assert config.worker_class_str == "gthread"
+    assert config.graceful_timeout == 12
+    assert config.keepalive == 2
+    assert config.preload_app is True
+
+
+def test_config_brackets_ipv6_hosts(monkeypatch):
+    config = load_config(monkeypatch, SERVE_HOST="::", SERVE_PORT="6000")
+    assert config.bind == ["[::]:6000"]
+
+
+def test_hooks_warm_up_and_finish_each_worker(monkeypatch):
+    calls = []
+    monkeypatch.setattr(main, "warm_up_worker", lambda: calls.append("warm_up"))
+    monkeypatch.setattr(main, "finish_worker", lambda: calls.append("finish"))
+    config = load_config(monkeypatch)
+    config.post_fork(None, None)
+    config.worker_exit(None, None)
+    assert calls == ["warm_up", "finish"]
+
+
+def test_importing_the_app_opens_no_store(tmp_path):
+    data = tmp_path / "data"
+    env = dict(
+        os.environ, EXPENSE_DB_PATH=str(data / "expenses.db"), JOBS_DB_PATH=str(data / "jobs.db"),
+        JOBS_SPOOL_DIR=str(data / "spool"), LOG_FILE=str(tmp_path / "app.log"), LOG_STDERR="false",
+    )
+    root = os.path.dirname(CONFIG_PATH)
+    subprocess.run([sys.executable, "-c", "import endpoints"], cwd=root, env=env, check=True)
+    assert not data.exists()
+
+    subprocess.run(
+        [sys.executable, "-c", "import main; main.preload()"], cwd=root, env=env, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    assert (data / "expenses.db").exists() and (data / "jobs.db").exists()
@@ -0,0 +1,18 @@
+import model_registry
+
+
+def test_warm_up_reports_a_failing_sdk_instead_of_raising(monkeypatch):
+    def configure(api_key=None):
+        raise ImportError("No module named 'google.generativeai'")
+
+    monkeypatch.setattr(model_registry, "configure", configure)
+    assert model_registry.warm_up("gemini-test") is False
+
+
+def test_warm_up_reports_a_failing_model_client(monkeypatch):
+    def get_model(model_name, generation_config=None):
+        raise ValueError("bad generation config")
+
+    monkeypatch.setattr(model_registry, "configure", lambda api_key=None: None)
+    monkeypatch.setattr(model_registry, "get_model", get_model)
+    assert model_registry.warm_up("gemini-test", ({"temperature": 2},)) is False
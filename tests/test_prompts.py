@@ -0,0 +1,73 @@
+import pytest
+
+import prompts
+from prompts import estimate_tokens, normalize_text, parse_translation, split_input, split_text
+
+LONG = " ".join(f"Am dat {i} lei pe paine la magazin." for i in range(60))
+
+
+def test_split_text_parts_fit_and_keep_every_word():
+    text = normalize_text(LONG)
+    parts = split_text(text, 60)
+    assert len(parts) > 1
+    assert all(estimate_tokens(part) <= 60 for part in parts)
+    assert " ".join(parts) == text
+
+
+def test_split_text_cuts_on_sentence_boundaries():
+    for part in split_text(normalize_text(LONG), 60):
+        assert part.endswith(".")
+
+
+def test_split_text_cuts_a_sentence_longer_than_the_budget():
+    text = " ".join(["word"] * 200)
+    parts = split_text(text, 20)
+    assert all(estimate_tokens(part) <= 20 for part in parts)
+    assert " ".join(parts).split() == text.split()
+
+
+def test_split_input_leaves_short_text_whole():
+    assert split_input("  Am dat\n50 lei  ") == (["Am dat 50 lei"], False)
+
+
+def test_split_input_splits_long_text():
+    parts, truncated = split_input(LONG, max_tokens=60, max_parts=100)
+    assert not truncated
+    assert " ".join(parts) == normalize_text(LONG)
+
+
+def test_split_input_drops_parts_beyond_the_limit():
+    parts, truncated = split_input(LONG, max_tokens=60, max_parts=2)
+    assert truncated
+    assert len(parts) == 2
+    assert normalize_text(LONG).startswith(" ".join(parts))
+
+
+def test_split_input_counts_dropped_tokens():
+    before = prompts.PROMPT_TOKENS_SAVED._values.get(("test", "truncate"), 0)
+    split_input(LONG, stage="test", max_tokens=60, max_parts=2)
+    assert prompts.PROMPT_TOKENS_SAVED._values[("test", "truncate")] > before
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("Today I paid 50 lei for bread", "Today I paid 50 lei for bread"),
+    ('  "Today I paid 50 lei"  ', "Today I paid 50 lei"),
+    ('Translation: "Today I paid 50 lei"', "Today I paid 50 lei"),
+    ('- Translation: "Azi am platit 50 lei"\n- Expense type: "food"', "Azi am platit 50 lei"),
+    ("translation: Today I paid 50 lei", "Today I paid 50 lei"),
+    ('"', '"'),
+])
+def test_parse_translation(raw, expected):
+    assert parse_translation(raw) == expected
+
+
+@pytest.mark.parametrize("prompt", [
+    prompts.translation_prompt("Am dat 50 lei", None),
+    prompts.fused_prompt("Am dat 50 lei", ["groceries"]),
+    prompts.batch_prompt([prompts.batch_record_line(0, "Am dat 50 lei", ["groceries"])]),
+])
+def test_every_prompt_translates_to_english_only(prompt):
+    # English input stays English everywhere, as in the two_step path that skips translating it
+    assert "to clear English" in prompt
+    assert "unchanged" in prompt
+    assert "to clear Romanian" not in prompt
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_callers_share_one_call():
+    async def main():
+        flight, calls = SingleFlight(), []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"items": []}
+
+        results = await asyncio.gather(*(flight.do("key", call) for _ in range(3)))
+        return flight, calls, results
+
+    flight, calls, results = run(main())
+    assert len(calls) == 1
+    assert [leader for _, leader in results] == [True, False, False]
+    # Followers get a copy they can modify without touching the leader's result
+    results[1][0]["items"].append("x")
+    assert results[0][0] == {"items": []}
+    assert flight._flights == {}
+
+
+def test_cancelled_follower_leaves_the_call_running():
+    async def main():
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await follower
+        return await leader
+
+    assert run(main()) == ("done", True)
+
+
+def test_last_waiter_cancelling_cancels_the_call_and_forgets_it():
+    async def main():
+        flight, started, cancelled = SingleFlight(), [], []
+
+        async def call():
+            started.append(1)
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+            return "late"
+
+        async def quick():
+            started.append(1)
+            return "fresh"
+
+        waiter = asyncio.ensure_future(flight.do("key", call))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        # Forgotten before the cancelled task finished: the next caller starts over
+        assert "key" not in flight._flights
+        result = await flight.do("key", quick)
+        await asyncio.sleep(0)
+        return flight, started, cancelled, result
+
+    flight, started, cancelled, result = run(main())
+    assert result == ("fresh", True)
+    assert started == [1, 1]
+    assert cancelled == [1]
+    assert flight._flights == {}
+
+
+def test_disabled_calls_every_time():
+    async def main():
+        flight, calls = SingleFlight(enabled=False), []
+
+        async def call():
+            calls.append(1)
+            return len(calls)
+
+        return await asyncio.gather(flight.do("key", call), flight.do("key", call)), calls
+
+    results, calls = run(main())
+    assert len(calls) == 2
+    assert all(leader for _, leader in results)
+
+
+def test_leader_changing_its_result_does_not_reach_followers():
+    async def main():
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return {"translated_text": "bread", "classified_items": [{"item": "bread"}]}
+
+        async def caller():
+            # Like _run_part_async used to: take the items out as soon as the result is in
+            result, _ = await flight.do("key", call)
+            return result.pop("classified_items", [])
+
+        return await asyncio.gather(*(caller() for _ in range(4)))
+
+    assert run(main()) == [[{"item": "bread"}]] * 4
@@ -0,0 +1,49 @@
+from streaming import JSONArrayStreamParser
+
+
+def feed_all(chunks):
+    parser = JSONArrayStreamParser()
+    completed = []
+    for chunk in chunks:
+        completed.extend(parser.feed(chunk))
+    return completed
+
+
+def test_elements_split_across_chunks():
+    text = '[{"category": "food", "amount": 5}, {"category": "rent", "amount": 100}]'
+    for size in (1, 3, 7, len(text)):
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        assert feed_all(chunks) == [{"category": "food", "amount": 5}, {"category": "rent", "amount": 100}]
+
+
+def test_element_is_returned_by_the_chunk_that_completes_it():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"item": "bre') == []
+    assert parser.feed('ad"}, {"item"') == [{"item": "bread"}]
+    assert parser.feed(': "milk"}]') == [{"item": "milk"}]
+
+
+def test_code_fence_before_the_array_is_skipped():
+    assert feed_all(['```json\n', '[{"a": 1}]', '\n```']) == [{"a": 1}]
+
+
+def test_brackets_and_escaped_quotes_inside_strings():
+    text = r'[{"item": "bread [large] {x}", "note": "say \"hi\" \\"}, {"nested": {"list": [1, [2]]}}]'
+    assert feed_all([text]) == [
+        {"item": "bread [large] {x}", "note": 'say "hi" \\'},
+        {"nested": {"list": [1, [2]]}},
+    ]
+
+
+def test_malformed_element_is_skipped():
+    assert feed_all(['[{"a": 1,}, {"b": 2}]']) == [{"b": 2}]
+
+
+def test_scalars_between_elements_are_ignored():
+    assert feed_all(['[1, "x", {"a": 1}, [2]]']) == [{"a": 1}, [2]]
+
+
+def test_nothing_after_the_closing_bracket():
+    parser = JSONArrayStreamParser()
+    assert parser.feed('[{"a": 1}] [{"b": 2}]') == [{"a": 1}]
+    assert parser.feed('{"c": 3}') == []
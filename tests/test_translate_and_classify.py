@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+import fast_path
+import translate_and_classify
+from cache import result_cache
+from fake_upstreams import Faults, FakeGenerativeModel
+from translate_and_classify import resolve_pipeline_mode, run_pipeline, translate_and_classify as fused
+
+CATEGORIES = ["going out", "groceries", "house expense"]
+ROMANIAN = "Ieri am dat 30 lei pe bilete la cinema cu prietenii"
+ENGLISH = "Yesterday I spent 30 dollars on cinema tickets with my friends"
+
+
+class RecordingModel(FakeGenerativeModel):
+    """The fake Gemini model, remembering every prompt; `reply` overrides its answer."""
+
+    def __init__(self, latency="fixed:0"):
+        super().__init__()
+        self.faults = Faults(latency)
+        self.prompts = []
+        self.reply = None
+
+    def _call(self, prompt):
+        self.prompts.append(prompt)
+        delay, fail, text = super()._call(prompt)
+        if isinstance(self.reply, Exception):
+            raise self.reply
+        return delay, fail, text if self.reply is None else self.reply
+
+    def kinds(self):
+        return ["fused" if "Available categories" in p and "Original text" in p
+                else "classify" if "Expense description" in p else "translate" for p in self.prompts]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = RecordingModel()
+    monkeypatch.setattr(translate_and_classify.model_registry, "get_model", lambda name, config=None: model)
+    monkeypatch.setattr(result_cache, "enabled", False)
+    monkeypatch.setattr(fast_path, "FAST_PATH_ENABLED", False)
+    return model
+
+
+@pytest.mark.parametrize("requested, expected", [
+    ("fused", "fused"),
+    (" Fused ", "fused"),
+    ("two_step", "two_step"),
+    ("unknown", "two_step"),
+])
+def test_resolve_pipeline_mode(requested, expected):
+    assert resolve_pipeline_mode(requested) == expected
+
+
+def test_resolve_pipeline_mode_defaults_to_the_setting(monkeypatch):
+    monkeypatch.setattr(translate_and_classify, "PIPELINE_MODE", "fused")
+    assert resolve_pipeline_mode(None) == "fused"
+    monkeypatch.setattr(translate_and_classify, "PIPELINE_MODE", "")
+    assert resolve_pipeline_mode(None) == "two_step"
+
+
+def test_fused_call_returns_translation_and_items(model):
+    model.reply = ('```json\n{"translated_text": "Yesterday I paid 30 lei for cinema tickets", '
+                   '"classified_items": [{"category": "Going Out", "item": "cinema tickets", "amount": "30"}]}\n```')
+    result = fused(ROMANIAN, CATEGORIES)
+    assert model.kinds() == ["fused"]
+    assert result["status"] == "success"
+    assert result["translated_text"] == "Yesterday I paid 30 lei for cinema tickets"
+    assert result["classified_items"] == [{"category": "going out", "item": "cinema tickets", "amount": 30.0}]
+
+
+def test_fused_call_with_unparseable_output_falls_back(model):
+    model.reply = "not json"
+    result = fused(ROMANIAN, CATEGORIES)
+    assert result["status"] == "success"
+    assert result["translated_text"] == ROMANIAN
+    assert len(result["classified_items"]) == 1
+    assert result["classified_items"][0]["category"] in CATEGORIES
+
+
+def test_fused_call_error(model):
+    model.reply = RuntimeError("quota exceeded")
+    result = fused(ROMANIAN, CATEGORIES)
+    assert result["status"] == "error"
+    assert "quota exceeded" in result["error"]
+
+
+def test_fused_mode_makes_one_call(model):
+    translation, items = run_pipeline(ROMANIAN, CATEGORIES, "fused")
+    assert model.kinds() == ["fused"]
+    assert translation["status"] == "success"
+    assert "classified_items" not in translation
+    assert items and items[0]["amount"] == 30.0
+
+
+def test_fused_mode_uses_two_step_for_english(model):
+    # English needs no translation, so the classify prompt alone does the job
+    translation, items = run_pipeline(ENGLISH, CATEGORIES, "fused")
+    assert model.kinds() == ["classify"]
+    assert translation["translated_text"] == ENGLISH
+    assert items
+
+
+def test_two_step_mode_translates_then_classifies(model):
+    translation, items = run_pipeline(ROMANIAN, CATEGORIES, "two_step")
+    assert model.kinds() == ["translate", "classify"]
+    assert items
+
+
+def test_concurrent_identical_fused_requests_all_get_items(model):
+    # Coalesced into one call; every request must still get the items
+    model.faults = Faults("fixed:100")
+    results = []
+
+    def request():
+        results.append(run_pipeline(ROMANIAN, CATEGORIES, "fused"))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert model.kinds() == ["fused"]
+    assert len(results) == 4
+    assert all(translation["status"] == "success" and items for translation, items in results)
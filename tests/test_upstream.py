@@ -0,0 +1,203 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import threading
+import time
+
+import pytest
+
+from pipeline_engine import request_budget
+import upstream
+
+
+class _ScriptedHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            status = server.statuses.pop(0) if server.statuses else 200
+            server.hits += 1
+        body = b"{}"
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    """Local HTTP server answering with the statuses queued in `server.statuses`, then 200."""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _ScriptedHandler)
+    httpd.daemon_threads = True
+    httpd.statuses, httpd.hits, httpd.lock = [], 0, threading.Lock()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    host, port = httpd.server_address[:2]
+    httpd.url = f"http://{host}:{port}/"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = upstream.CircuitBreaker("elevenlabs", failure_threshold=3, reset_timeout=0.2)
+    monkeypatch.setitem(upstream.breakers, "elevenlabs", breaker)
+    return breaker
+
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Record the backoff attempt numbers and keep the actual waits short."""
+    attempts = []
+
+    def backoff_delay(attempt, base=None, cap=None):
+        attempts.append(attempt)
+        return 0.01
+
+    monkeypatch.setattr(upstream, "backoff_delay", backoff_delay)
+    return attempts
+
+
+@pytest.mark.parametrize("status", [500, 503, 429])
+def test_retries_transient_statuses_with_backoff(server, breaker, delays, status):
+    server.statuses = [status, status]
+    response = upstream.request("elevenlabs", "GET", server.url, retries=2)
+    assert response.status_code == 200
+    assert server.hits == 3
+    assert delays == [0, 1]
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+
+
+def test_gives_up_after_the_last_retry(server, breaker, delays):
+    server.statuses = [502, 502, 502]
+    with pytest.raises(upstream.UpstreamHTTPError) as error:
+        upstream.request("elevenlabs", "GET", server.url, retries=2)
+    assert error.value.status_code == 502
+    assert server.hits == 3
+    assert delays == [0, 1]
+
+
+@pytest.mark.parametrize("status", [400, 401, 404, 422])
+def test_client_errors_are_not_retried(server, breaker, delays, status):
+    server.statuses = [status]
+    with pytest.raises(upstream.UpstreamHTTPError) as error:
+        upstream.request("elevenlabs", "GET", server.url, retries=2)
+    assert error.value.status_code == status
+    assert server.hits == 1
+    assert delays == []
+    # A bad request says nothing about the provider's health
+    assert breaker.failures == 0
+
+
+def test_breaker_opens_after_threshold_and_half_opens_after_cooldown(server, breaker, delays):
+    server.statuses = [503] * 3
+    with pytest.raises(upstream.UpstreamHTTPError):
+        upstream.request("elevenlabs", "GET", server.url, retries=2)
+    assert breaker.state == "open"
+
+    # Open: fail fast without reaching the provider
+    with pytest.raises(upstream.CircuitOpenError):
+        upstream.request("elevenlabs", "GET", server.url)
+    assert server.hits == 3
+    assert breaker.rejected == 1
+
+    time.sleep(breaker.reset_timeout)
+    assert breaker.state == "half_open"
+    # One trial call goes out; its success closes the breaker
+    assert upstream.request("elevenlabs", "GET", server.url).status_code == 200
+    assert server.hits == 4
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_call_reopens_the_breaker(server, breaker, delays):
+    server.statuses = [503] * 4
+    with pytest.raises(upstream.UpstreamHTTPError):
+        upstream.request("elevenlabs", "GET", server.url, retries=2)
+    time.sleep(breaker.reset_timeout)
+
+    # The trial fails and reopens the breaker, so the retry is rejected
+    with pytest.raises(upstream.CircuitOpenError):
+        upstream.request("elevenlabs", "GET", server.url, retries=2)
+    assert server.hits == 4
+    assert breaker.state == "open"
+
+
+def test_half_open_lets_a_single_trial_through(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(breaker.reset_timeout)
+    breaker.before_call()
+    with pytest.raises(upstream.CircuitOpenError):
+        breaker.before_call()
+
+
+def test_sleep_budget_without_a_budget_keeps_the_delay():
+    assert upstream._sleep_budget(1.5) == 1.5
+
+
+def test_sleep_budget_honours_the_request_budget():
+    with request_budget(1.0):
+        assert upstream._sleep_budget(0.2) == 0.2
+        # Waiting must leave at least as long again for the next attempt
+        assert upstream._sleep_budget(0.6) is None
+    with request_budget(0):
+        assert upstream._sleep_budget(0.01) is None
+
+
+def test_request_stops_retrying_when_the_budget_runs_out(server, breaker, monkeypatch):
+    monkeypatch.setattr(upstream, "backoff_delay", lambda attempt, base=None, cap=None: 0.5)
+    server.statuses = [503, 503]
+    with request_budget(0.8):
+        with pytest.raises(upstream.UpstreamHTTPError):
+            upstream.request("elevenlabs", "GET", server.url, retries=2)
+    assert server.hits == 1
+
+
+def test_request_with_an_exhausted_budget_is_not_sent(server, breaker):
+    with request_budget(0):
+        with pytest.raises(upstream.DeadlineExceeded):
+            upstream.request("elevenlabs", "GET", server.url)
+    assert server.hits == 0
+    assert breaker.failures == 0
+
+
+def test_call_async_retries_transient_errors(breaker, delays):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        if len(calls) < 3:
+            raise upstream.UpstreamHTTPError("elevenlabs", 503)
+        return "ok"
+
+    assert asyncio.run(upstream.call_async("elevenlabs", call, retries=2)) == "ok"
+    assert len(calls) == 3
+    assert delays == [0, 1]
+
+
+def test_call_async_does_not_retry_client_errors(breaker, delays):
+    calls = []
+
+    async def call():
+        calls.append(1)
+        raise upstream.UpstreamHTTPError("elevenlabs", 400)
+
+    with pytest.raises(upstream.UpstreamHTTPError):
+        asyncio.run(upstream.call_async("elevenlabs", call, retries=2))
+    assert len(calls) == 1
+    assert delays == []
+
+
+def test_call_async_counts_attempt_timeouts_as_failures(breaker, delays):
+    async def call():
+        await asyncio.sleep(1)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(upstream.call_async("elevenlabs", call, retries=2, attempt_timeout=0.02))
+    assert breaker.state == "open"
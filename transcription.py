@@ -0,0 +1,202 @@
+from logger import log_payload, logger
+from pipeline_engine import STAGES, engine, run_stage
+from audio_upload import AudioBuffer, MultipartStream
+import asyncio
+import audio_preprocess
+import local_stt
+import metrics
+import os
+import upstream
+
+
+ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io")
+ELEVENLABS_STT_URL = f"{ELEVENLABS_BASE_URL}/v1/speech-to-text"
+STT_MODEL_ID = "scribe_v1"
+# Default backend when a request does not pick one: elevenlabs (network) or local (on-box)
+TRANSCRIPTION_BACKEND = os.getenv("TRANSCRIPTION_BACKEND", "elevenlabs").strip().lower()
+
+_async_client = None
+
+
+class TranscriptionError(Exception):
+    """The selected transcription backend could not produce a transcript."""
+
+
+class ElevenLabsTranscriptionError(TranscriptionError):
+    """Both the ElevenLabs SDK and the direct API call failed."""
+
+    def __init__(self, sdk_error, api_error):
+        super().__init__(f"Both SDK and API failed. SDK: {str(sdk_error)}, API: {str(api_error)}")
+        self.sdk_error = sdk_error
+        self.api_error = api_error
+
+
+def _get_async_client():
+    # Created lazily on the engine loop so its connection pool belongs to it
+    global _async_client
+    if _async_client is None:
+        # Imported here: the SDK is slow to import and the local backend never needs it
+        from elevenlabs.client import AsyncElevenLabs
+        _async_client = AsyncElevenLabs(api_key=os.getenv('ELEVENLABS_API_KEY'), base_url=ELEVENLABS_BASE_URL)
+    return _async_client
+
+
+def _forget_async_client():
+    # Its pool belongs to the parent's engine loop, which a forked worker does not have
+    global _async_client
+    _async_client = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_forget_async_client)
+
+
+def _extract_transcript(transcript_response):
+    if hasattr(transcript_response, 'text'):
+        return transcript_response.text
+    if hasattr(transcript_response, 'transcript'):
+        return transcript_response.transcript
+    return str(transcript_response)
+
+
+async def _transcribe_sdk(audio):
+    transcript_response = await _get_async_client().speech_to_text.convert(
+        file=(audio.filename, audio.open(), audio.content_type),
+        model_id=STT_MODEL_ID,
+        language_code=None,  # Auto-detect
+        timestamps_granularity="word",
+        diarize=False,  # Simplified - disable speaker detection for now
+        tag_audio_events=False,  # Simplified - disable audio events for now
+    )
+    return _extract_transcript(transcript_response)
+
+
+def _transcribe_direct_api(audio):
+    # Streams the shared buffer instead of re-reading the upload
+    body = MultipartStream(
+        {"model_id": STT_MODEL_ID, "timestamps_granularity": "word"}, "file", audio
+    )
+    headers = {
+        "xi-api-key": os.getenv('ELEVENLABS_API_KEY'),
+        "Content-Type": body.content_type
+    }
+
+    try:
+        # Pooled session, budget-derived timeouts, retries and the elevenlabs breaker
+        response = upstream.request("elevenlabs", "POST", ELEVENLABS_STT_URL, headers=headers, data=body)
+    except upstream.UpstreamHTTPError as e:
+        logger.error(f"API call failed with status {e.status_code}: {e.body}")
+        raise
+    return response.json().get('text', '')
+
+
+async def _transcribe_elevenlabs(audio):
+    """
+    Transcribe an AudioBuffer with ElevenLabs Scribe. Tries the async SDK
+    first, then a direct API call; both read the same buffer. Raises
+    ElevenLabsTranscriptionError if both fail.
+    """
+    try:
+        # Try ElevenLabs SDK first
+        logger.info("Attempting ElevenLabs SDK transcription...")
+        transcript = await run_stage(
+            "transcribe", upstream.call_async, "elevenlabs", _transcribe_sdk, audio,
+            attempt_timeout=STAGES["transcribe"].timeout,
+        )
+        log_payload("INFO", "SDK transcription successful", transcript)
+        metrics.TRANSCRIPTIONS.inc(path="sdk")
+        return transcript
+    except Exception as sdk_error:
+        logger.error(f"ElevenLabs SDK failed: {sdk_error}")
+
+        try:
+            # Fallback to direct API call (blocking client, so run it in a thread)
+            logger.info("Attempting direct API call to ElevenLabs...")
+            transcript = await run_stage("transcribe", asyncio.to_thread, _transcribe_direct_api, audio)
+            log_payload("INFO", "API transcription successful", transcript)
+            metrics.TRANSCRIPTIONS.inc(path="direct_api")
+            return transcript
+        except Exception as api_error:
+            logger.error(f"Direct API call also failed: {api_error}")
+            metrics.TRANSCRIPTIONS.inc(path="failed")
+            raise ElevenLabsTranscriptionError(sdk_error, api_error)
+
+
+async def _transcribe_local(audio):
+    """Transcribe on this machine with LOCAL_STT_ENGINE in the local_stt worker pool."""
+    try:
+        logger.info(f"Attempting local {local_stt.LOCAL_STT_ENGINE} transcription...")
+        transcript, audio_seconds, decode_seconds = await run_stage("transcribe", local_stt.transcribe_async, audio)
+    except Exception as e:
+        logger.error(f"Local transcription failed: {e}")
+        metrics.TRANSCRIPTIONS.inc(path="failed")
+        raise TranscriptionError(f"Local {local_stt.LOCAL_STT_ENGINE} transcription failed: {e}") from e
+    logger.info(f"Local transcription of {audio_seconds:.1f}s audio decoded in {decode_seconds:.2f}s")
+    log_payload("INFO", "Local transcription successful", transcript)
+    metrics.TRANSCRIPTIONS.inc(path="local")
+    return transcript
+
+
+# Backend name -> async transcribe(audio) -> text; add entries to plug in other engines
+BACKENDS = {
+    "elevenlabs": _transcribe_elevenlabs,
+    "local": _transcribe_local,
+}
+
+
+async def preprocess_audio_async(audio):
+    """
+    Trim silence, downmix and resample an AudioBuffer before any backend
+    sees it (audio_preprocess.preprocess). Returns (audio, report): the
+    processed buffer, or the original one when preprocessing is disabled,
+    saves nothing or fails. report["speech_detected"] is False for an
+    all-silent recording, which needs no transcription at all.
+    """
+    if not audio_preprocess.AUDIO_PREPROCESS_ENABLED:
+        return audio, {"applied": False, "speech_detected": True}
+    try:
+        processed, report = await run_stage(
+            "preprocess", asyncio.to_thread, audio_preprocess.preprocess, audio.read_all(), audio.filename
+        )
+    except Exception as e:
+        # Undecodable here (e.g. no ffmpeg for m4a): the backend may still cope with the original
+        logger.warning(f"Audio preprocessing skipped: {type(e).__name__}: {e}")
+        return audio, {"applied": False, "speech_detected": True, "error": str(e)}
+
+    if report["applied"]:
+        metrics.AUDIO_PREPROCESS_BYTES.inc(report["bytes_in"], direction="in")
+        metrics.AUDIO_PREPROCESS_BYTES.inc(report["bytes_out"], direction="out")
+        metrics.AUDIO_PREPROCESS_SECONDS.inc(report["seconds_in"], direction="in")
+        metrics.AUDIO_PREPROCESS_SECONDS.inc(report["seconds_out"], direction="out")
+        logger.info(
+            f"Preprocessed audio: {report['bytes_in']} -> {report['bytes_out']} bytes, "
+            f"{report['seconds_in']:.1f}s -> {report['seconds_out']:.1f}s in {report['ms']:.0f} ms"
+        )
+    if processed is None:
+        return audio, report
+    data, content_type, extension = processed
+    filename = os.path.splitext(audio.filename)[0] + extension
+    return AudioBuffer.from_bytes(data, filename, content_type), report
+
+
+def preprocess_audio(audio):
+    """Sync wrapper around preprocess_audio_async()."""
+    return engine.run_sync(preprocess_audio_async(audio))
+
+
+def resolve_backend(requested=None):
+    """Pick the backend from the request, falling back to TRANSCRIPTION_BACKEND. Raises ValueError if unknown."""
+    name = (requested or TRANSCRIPTION_BACKEND or "elevenlabs").strip().lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend '{name}', expected one of: {', '.join(BACKENDS)}")
+    return name
+
+
+async def transcribe_audio_async(audio, backend=None):
+    """Transcribe an AudioBuffer with `backend` (default TRANSCRIPTION_BACKEND). Raises TranscriptionError."""
+    return await BACKENDS[resolve_backend(backend)](audio)
+
+
+def transcribe_audio(audio, backend=None):
+    """Sync wrapper around transcribe_audio_async() for WSGI views and scripts."""
+    return engine.run_sync(transcribe_audio_async(audio, backend))
@@ -1,44 +1,162 @@
-from logger import logger
-import google.generativeai as genai
+from logger import log_payload, logger
+from cache import make_key, result_cache
+from pipeline_engine import engine, run_stage
+from fast_path import try_fast_path
+from language_detect import detect_language
+from category_index import get_index
+from prompts import (
+    CLASSIFY_MAX_OUTPUT_TOKENS,
+    FUSED_MAX_OUTPUT_TOKENS,
+    TRANSLATE_MAX_OUTPUT_TOKENS,
+    classification_prompt,
+    fused_prompt,
+    parse_translation,
+    split_input,
+    translation_prompt,
+)
+import asyncio
+import metrics
+import model_registry
+import upstream
+import json
 import os
 
 
 LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME")
 
-def translate_text(text, categories):
-    """Your original translation prompt"""
-    prompt = f"""
-    You are a helpful assistant that translates, clarifies, and categorizes user input for expense tracking.
-    The input can be in English or Romanian.
+# "two_step" keeps the original translate_text -> classify_expense flow,
+# "fused" asks the model for translation and items in a single call.
+PIPELINE_MODES = ("two_step", "fused")
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "two_step")
 
-    Task: Determine the language of the input and provide a clear translation in the other language (English ↔ Romanian), then identify the type of expense it represents.
+# Part of every cache key: bump whenever a prompt or the output cleaning changes
+PROMPT_VERSION = "4"
 
-    Original text: "{text}"
 
-    Instructions:
-    1. Detect the language of the text.
-    2. If the text is in Romanian, translate it to clear English; if it is in English, translate it to clear Romanian.
-    3. Convert informal or ambiguous expressions into proper, understandable language.
-    4. Identify the type of expense (e.g., food, transport, office supplies, utilities, etc.).
-    5. Preserve any mentioned amounts or numbers.
-    6. Keep the meaning and context intact.
+def strip_code_fences(raw_response):
+    """Remove ```json / ``` markers the model sometimes wraps around JSON."""
+    if raw_response.startswith('```json'):
+        return raw_response.replace('```json', '').replace('```', '').strip()
+    if raw_response.startswith('```'):
+        return raw_response.replace('```', '').strip()
+    return raw_response
 
-    Respond in the following format:
-    - Translation: "<translated text>"
-    - Expense type: "<expense category>"
+
+def fallback_classification(translated_text, categories):
+    """Basic single-item result used whenever the model output is unusable."""
+    return [{
+        "category": get_index(categories).default,
+        "item": translated_text[:50],  # First 50 chars
+        "amount": 0
+    }]
+
+
+def clean_classification(result_list, translated_text, categories):
     """
-    
+    Validate parsed model output: keep dict entries only, map categories onto
+    the provided list and coerce amounts to numbers.
+    """
+    # Validate that we got a list
+    if not isinstance(result_list, list):
+        logger.warning(f"Expected list but got {type(result_list)}")
+        return fallback_classification(translated_text, categories)
+
+    # Ensure we have at least one item
+    if not result_list:
+        logger.warning("Model returned empty list")
+        return fallback_classification(translated_text, categories)
+
+    # Built once per category list and cached
+    index = get_index(categories)
+
+    # Clean up and validate each entry
+    cleaned_results = []
+    for entry in result_list:
+        if not isinstance(entry, dict):
+            continue
+
+        # Ensure required fields exist
+        item = entry.get("item", translated_text[:50])
+        amount = entry.get("amount", 0)
+
+        # Map onto the provided list, defaulting to the first category
+        category = index.resolve(entry.get("category", ""))
+
+        # Ensure amount is numeric
+        try:
+            amount = float(amount)
+        except (ValueError, TypeError):
+            amount = 0
+
+        cleaned_results.append({
+            "category": category,
+            "item": str(item),
+            "amount": amount
+        })
+
+    log_payload("INFO", "Final cleaned results", cleaned_results)
+    return cleaned_results if cleaned_results else fallback_classification(translated_text, categories)
+
+
+def translation_ok(result):
+    return result.get("status") == "success"
+
+
+def classification_ok(result_list):
+    return bool(result_list) and not any("error" in item for item in result_list)
+
+
+def fused_ok(result):
+    return translation_ok(result) and classification_ok(result.get("classified_items"))
+
+
+def _cache_key(kind, with_categories=True):
+    # The translation prompt does not include the categories, so they are
+    # left out of its key to let every tenant share translations.
+    def key_func(text, categories):
+        return make_key(kind, text, categories if with_categories else [], LLM_MODEL_NAME, PROMPT_VERSION)
+    return key_func
+
+
+classify_cache_key = _cache_key("classify")
+fused_cache_key = _cache_key("fused")
+
+# Output caps keep a pathological input from producing a huge, slow response
+TRANSLATE_GENERATION_CONFIG = {"max_output_tokens": TRANSLATE_MAX_OUTPUT_TOKENS}
+CLASSIFY_GENERATION_CONFIG = {"max_output_tokens": CLASSIFY_MAX_OUTPUT_TOKENS}
+
+
+@result_cache.cached("translate", _cache_key("translate", with_categories=False), translation_ok)
+async def _translate_with_model_async(text, categories, source_language):
+    prompt = translation_prompt(text, source_language)
     try:
         logger.debug("Initializing translation model...")
-        model = genai.GenerativeModel(model_name=LLM_MODEL_NAME)
-        response = model.generate_content(prompt)
-        logger.info(f"Translation response received: {response.text[:100]}...")  
-        return {"translated_text": response.text.strip(), "status": "success"}
+        model = model_registry.get_model(LLM_MODEL_NAME, TRANSLATE_GENERATION_CONFIG)
+        response = await run_stage("translate", upstream.call_async, "gemini", model.generate_content_async, prompt)
+        metrics.record_usage("translate", response)
+        log_payload("INFO", "Translation response received", response.text)
+        return {"translated_text": parse_translation(response.text), "status": "success", "source_language": source_language}
     except Exception as e:
         logger.exception("Error in translate_text")
         return {"translated_text": text, "status": "error", "error": str(e)}
 
-def classify_expense(translated_text, categories):
+
+async def translate_text_async(text, categories, bypass_cache=False):
+    """
+    Translate text to English for classification. Input detected locally as
+    English is returned as-is without a model call; Romanian is translated
+    Romanian -> English only; undetermined input gets a prompt that translates
+    Romanian and returns English unchanged, like the fused and batch prompts.
+    """
+    source_language = detect_language(text)
+    if source_language == "en":
+        logger.info("Input detected as English, skipping translation")
+        return {"translated_text": text.strip(), "status": "success", "source_language": "en"}
+    return await _translate_with_model_async(text, categories, source_language, bypass_cache=bypass_cache)
+
+
+@result_cache.cached("classify", classify_cache_key, classification_ok)
+async def classify_expense_async(translated_text, categories):
     """
     Classify expense and extract items with their amounts into a structured list.
     """
@@ -54,140 +172,222 @@ def classify_expense(translated_text, categories):
     
     # Clean the text
     translated_text = translated_text.strip()
-    logger.info(f"Processing text for classification: '{translated_text}'")
+    log_payload("INFO", "Processing text for classification", translated_text)
     
-    prompt = f"""
-    You are an expense classification assistant.
-
-    Expense description: "{translated_text}"
-    Available categories: {categories}
-
-    Task:
-    1. Classify each individual expense into the most appropriate category from the list.
-    2. Extract all monetary amounts and the corresponding items purchased.
-    3. If no specific amount is mentioned, use 0 as the amount.
-    4. If no specific item is mentioned, extract the general expense description.
-
-    Rules:
-    - Choose only from the provided categories: {categories}
-    - Provide amounts as numbers (no currency symbols)
-    - Return ONLY a valid JSON array, no markdown formatting, no code blocks, no additional text
-    - If the text doesn't seem like an expense, still try to extract something meaningful
-    - Always return at least one item in the array
-
-    Respond strictly in this JSON format:
-    [
-        {{
-            "category": "category_from_list",
-            "item": "description_of_item_or_expense",
-            "amount": 0
-        }}
-    ]
-
-    IMPORTANT: Return only the JSON array above, no ```json``` markers, no explanations.
-    """
+    prompt = classification_prompt(translated_text, categories)
 
     try:
         logger.debug("Initializing classification and extraction model...")
-        model = genai.GenerativeModel(model_name=LLM_MODEL_NAME)
-        response = model.generate_content(prompt)
+        model = model_registry.get_model(LLM_MODEL_NAME, CLASSIFY_GENERATION_CONFIG)
+        response = await run_stage("classify", upstream.call_async, "gemini", model.generate_content_async, prompt)
+        metrics.record_usage("classify", response)
         
         raw_response = response.text.strip()
-        logger.info(f"Raw model response: '{raw_response}'")
-
-        # Clean up the response - remove code block markers if present
-        if raw_response.startswith('```json'):
-            raw_response = raw_response.replace('```json', '').replace('```', '').strip()
-        elif raw_response.startswith('```'):
-            raw_response = raw_response.replace('```', '').strip()
+        log_payload("INFO", "Raw model response", raw_response)
 
         # Parse JSON safely
-        import json
         try:
-            result_list = json.loads(raw_response)
-            logger.info(f"Parsed JSON successfully: {result_list}")
+            result_list = json.loads(strip_code_fences(raw_response))
+            log_payload("DEBUG", "Parsed JSON successfully", result_list)
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse model output as JSON: {e}")
-            logger.warning(f"Raw response was: '{raw_response}'")
+            log_payload("WARNING", "Raw response was", raw_response)
             
             # Fallback: create a basic classification
-            fallback_result = [{
-                "category": categories[0],
-                "item": translated_text[:50],  # First 50 chars
-                "amount": 0
-            }]
-            logger.info(f"Using fallback result: {fallback_result}")
+            fallback_result = fallback_classification(translated_text, categories)
+            log_payload("INFO", "Using fallback result", fallback_result)
             return fallback_result
 
-        # Validate that we got a list
-        if not isinstance(result_list, list):
-            logger.warning(f"Expected list but got {type(result_list)}")
-            return [{
-                "category": categories[0],
-                "item": translated_text[:50],
-                "amount": 0
-            }]
-
-        # Ensure we have at least one item
-        if not result_list:
-            logger.warning("Model returned empty list")
-            return [{
-                "category": categories[0],
-                "item": translated_text[:50],
-                "amount": 0
-            }]
-
-        # Clean up and validate each entry
-        cleaned_results = []
-        for entry in result_list:
-            if not isinstance(entry, dict):
-                continue
-                
-            # Ensure required fields exist
-            category = entry.get("category", categories[0])
-            item = entry.get("item", translated_text[:50])
-            amount = entry.get("amount", 0)
-            
-            # Validate category is from the list
-            category_found = False
-            for valid_category in categories:
-                if (category.lower() == valid_category.lower() or 
-                    category.lower() in valid_category.lower() or
-                    valid_category.lower() in category.lower()):
-                    category = valid_category
-                    category_found = True
-                    break
-            
-            if not category_found:
-                category = categories[0]  # Default to first category
-            
-            # Ensure amount is numeric
-            try:
-                amount = float(amount)
-            except (ValueError, TypeError):
-                amount = 0
-                
-            cleaned_results.append({
-                "category": category,
-                "item": str(item),
-                "amount": amount
-            })
-
-        logger.info(f"Final cleaned results: {cleaned_results}")
-        return cleaned_results if cleaned_results else [{
-            "category": categories[0],
-            "item": translated_text[:50],
-            "amount": 0
-        }]
+        return clean_classification(result_list, translated_text, categories)
 
     except Exception as e:
         logger.exception("Error in classify_expense")
         # Return a fallback result instead of error
         fallback_result = [{
-            "category": categories[0], 
+            "category": get_index(categories).default, 
             "item": translated_text[:50] if translated_text else "unknown expense", 
             "amount": 0, 
             "error": str(e)
         }]
-        logger.info(f"Exception fallback result: {fallback_result}")
-        return fallback_result
\ No newline at end of file
+        log_payload("INFO", "Exception fallback result", fallback_result)
+        return fallback_result
+
+FUSED_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "translated_text": {"type": "string"},
+        "classified_items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "category": {"type": "string"},
+                    "item": {"type": "string"},
+                    "amount": {"type": "number"},
+                },
+                "required": ["category", "item", "amount"],
+            },
+        },
+    },
+    "required": ["translated_text", "classified_items"],
+}
+
+FUSED_GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": FUSED_RESPONSE_SCHEMA,
+    "max_output_tokens": FUSED_MAX_OUTPUT_TOKENS,
+}
+
+
+@result_cache.cached("fused", fused_cache_key, fused_ok)
+async def translate_and_classify_async(text, categories):
+    """
+    Fused pipeline: translate and classify in a single structured-output call.
+
+    Returns the translation dict in the same shape as translate_text() plus a
+    "classified_items" list cleaned exactly like classify_expense() output.
+    """
+    prompt = fused_prompt(text, categories)
+
+    try:
+        logger.debug("Initializing fused translation and classification model...")
+        model = model_registry.get_model(LLM_MODEL_NAME, FUSED_GENERATION_CONFIG)
+        response = await run_stage("fused", upstream.call_async, "gemini", model.generate_content_async, prompt)
+        metrics.record_usage("fused", response)
+        raw_response = response.text.strip()
+        log_payload("INFO", "Raw fused model response", raw_response)
+    except Exception as e:
+        logger.exception("Error in translate_and_classify_async")
+        return {"translated_text": text, "status": "error", "error": str(e)}
+
+    try:
+        result = json.loads(strip_code_fences(raw_response))
+    except json.JSONDecodeError as e:
+        logger.warning(f"Failed to parse fused model output as JSON: {e}")
+        result = {}
+    if not isinstance(result, dict):
+        logger.warning(f"Expected object but got {type(result)}")
+        result = {}
+
+    translated_text = str(result.get("translated_text") or text).strip()
+    try:
+        classified_items = clean_classification(result.get("classified_items"), translated_text, categories)
+    except Exception as e:
+        logger.exception("Error cleaning fused classification")
+        classified_items = fallback_classification(translated_text, categories)
+        classified_items[0]["error"] = str(e)
+
+    return {
+        "translated_text": translated_text,
+        "classified_items": classified_items,
+        "status": "success"
+    }
+
+
+def warm_up_models(extra_configs=()):
+    """Build every model client the pipelines use before the first request."""
+    return model_registry.warm_up(LLM_MODEL_NAME, (
+        TRANSLATE_GENERATION_CONFIG, CLASSIFY_GENERATION_CONFIG, FUSED_GENERATION_CONFIG, *extra_configs))
+
+
+def untranslated(text):
+    """
+    Translation dict for text answered without any model call (the fast
+    path). translated_text is then the original text, so input not detected
+    as English is marked "translated": False with its source_language.
+    """
+    source_language = detect_language(text)
+    translation = {"translated_text": text, "status": "success", "source_language": source_language}
+    if source_language != "en":
+        translation["translated"] = False
+    return translation
+
+
+def response_flags(translation):
+    """
+    Fields qualifying translated_text that responses pass on when set:
+    "truncated": True when input was dropped, "translated": False (with
+    source_language) when translated_text is the untranslated original.
+    """
+    flags = {}
+    if translation.get("truncated"):
+        flags["truncated"] = True
+    if translation.get("translated") is False:
+        flags.update(translated=False, source_language=translation.get("source_language"))
+    return flags
+
+
+def resolve_pipeline_mode(requested=None):
+    """Pick the pipeline mode from the request, falling back to PIPELINE_MODE."""
+    mode = (requested or PIPELINE_MODE or "two_step").strip().lower()
+    if mode not in PIPELINE_MODES:
+        logger.warning(f"Unknown pipeline mode '{mode}', using two_step")
+        return "two_step"
+    return mode
+
+
+async def run_pipeline_async(text, categories, mode=None, bypass_cache=False):
+    """
+    Translate and classify text using the selected pipeline mode.
+
+    Returns (translation, classification_list) where translation has the
+    translate_text() shape. On translation error the list is empty.
+    bypass_cache forces fresh model calls. Text over the prompt input budget
+    is split into parts that run concurrently and are merged in order; when
+    parts had to be dropped the translation carries "truncated": True. See
+    response_flags() for what callers pass on.
+    """
+    # Short formulaic inputs are resolved locally without any model call
+    fast_items = try_fast_path(text, categories)
+    if fast_items is not None:
+        return untranslated(text), fast_items
+
+    parts, truncated = split_input(text)
+    if len(parts) == 1:
+        translation, items = await _run_part_async(parts[0] if truncated else text, categories, mode, bypass_cache)
+    else:
+        results = await asyncio.gather(*(_run_part_async(part, categories, mode, bypass_cache) for part in parts))
+        for translation, items in results:
+            if translation.get("status") == "error":
+                return translation, []
+        translation = {**results[0][0], "translated_text": " ".join(t["translated_text"] for t, _ in results)}
+        items = [item for _, items in results for item in items]
+    if truncated and translation.get("status") != "error":
+        translation = {**translation, "truncated": True}
+    return translation, items
+
+
+async def _run_part_async(text, categories, mode, bypass_cache):
+    mode = resolve_pipeline_mode(mode)
+    # English input needs no translation, so a single classify call does the job
+    if mode == "fused" and detect_language(text) == "en":
+        mode = "two_step"
+    logger.info(f"Running {mode} pipeline")
+
+    if mode == "fused":
+        result = await translate_and_classify_async(text, categories, bypass_cache=bypass_cache)
+        translation = {key: value for key, value in result.items() if key != "classified_items"}
+        return translation, result.get("classified_items", [])
+
+    translation = await translate_text_async(text, categories, bypass_cache=bypass_cache)
+    if translation.get('status') == 'error':
+        return translation, []
+    return translation, await classify_expense_async(translation['translated_text'], categories, bypass_cache=bypass_cache)
+
+
+###### Sync wrappers: run the coroutines above on the shared engine loop ######
+
+def translate_text(text, categories, bypass_cache=False):
+    return engine.run_sync(translate_text_async(text, categories, bypass_cache=bypass_cache))
+
+
+def classify_expense(translated_text, categories, bypass_cache=False):
+    return engine.run_sync(classify_expense_async(translated_text, categories, bypass_cache=bypass_cache))
+
+
+def translate_and_classify(text, categories, bypass_cache=False):
+    return engine.run_sync(translate_and_classify_async(text, categories, bypass_cache=bypass_cache))
+
+
+def run_pipeline(text, categories, mode=None, bypass_cache=False):
+    return engine.run_sync(run_pipeline_async(text, categories, mode, bypass_cache=bypass_cache))
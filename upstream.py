@@ -0,0 +1,296 @@
+from logger import logger
+from pipeline_engine import remaining_budget
+import asyncio
+import metrics
+import os
+import random
+import threading
+import time
+
+
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF_BASE_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_BASE_SECONDS", "0.25"))
+UPSTREAM_BACKOFF_MAX_SECONDS = float(os.getenv("UPSTREAM_BACKOFF_MAX_SECONDS", "4"))
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5"))
+# Read timeout of a single HTTP attempt, further capped by the request budget
+UPSTREAM_READ_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_READ_TIMEOUT_SECONDS", "60"))
+# Total time of a single SDK attempt; below the stage timeouts so a hung
+# provider counts as a failure and leaves room for a retry
+UPSTREAM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_ATTEMPT_TIMEOUT_SECONDS", "20"))
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "32"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Responses that mean "the provider is struggling", worth a retry
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+PROVIDERS = ("gemini", "elevenlabs")
+
+
+class CircuitOpenError(Exception):
+    """The provider's circuit breaker is open; the call was not attempted."""
+
+    def __init__(self, provider, retry_in):
+        super().__init__(f"{provider} circuit open, retry in {retry_in:.1f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+
+class UpstreamHTTPError(Exception):
+    """A provider answered with a non-2xx status."""
+
+    def __init__(self, provider, status_code, body=""):
+        super().__init__(f"{provider} API call failed: {status_code}")
+        self.provider = provider
+        self.status_code = status_code
+        self.body = body
+
+
+class DeadlineExceeded(Exception):
+    """The request budget ran out before (another) upstream attempt could start."""
+
+
+class CircuitBreaker:
+    """
+    Classic closed -> open -> half-open breaker. After `failure_threshold`
+    consecutive provider failures calls fail fast for `reset_timeout`
+    seconds, then a single trial call decides whether to close again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return
+            if state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+        raise CircuitOpenError(self.name, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logger.info(f"Circuit for {self.name} closed")
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self.trial_in_flight:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failure(s)")
+                self.opened_at = time.monotonic()
+            self.trial_in_flight = False
+
+    def record_neutral(self):
+        """The call finished without telling us anything about provider health."""
+        with self._lock:
+            self.trial_in_flight = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state": self._state(),
+                "consecutive_failures": self.failures,
+                "rejected": self.rejected,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+            }
+
+
+breakers = {provider: CircuitBreaker(provider) for provider in PROVIDERS}
+
+RETRIES = metrics.registry.register(metrics.Counter(
+    "upstream_retries_total", "Upstream attempts retried after a transient failure", ("provider",)))
+REJECTED = metrics.registry.register(metrics.Counter(
+    "upstream_circuit_rejected_total", "Calls rejected by an open circuit breaker", ("provider",),
+    collect=lambda: {(provider,): breaker.rejected for provider, breaker in breakers.items()},
+))
+CIRCUIT_OPEN = metrics.registry.register(metrics.Gauge(
+    "upstream_circuit_open", "1 while the provider's circuit breaker is open or half-open", ("provider",),
+    collect=lambda: {(provider,): int(breaker.state != "closed") for provider, breaker in breakers.items()},
+))
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(provider):
+    """Shared keep-alive requests.Session for a provider, created on first use."""
+    session = _sessions.get(provider)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(provider)
+            if session is None:
+                # requests is only imported once a provider is called through it
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                # Retries are handled here (with the breaker), not by urllib3
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=UPSTREAM_POOL_SIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[provider] = session
+    return session
+
+
+def _reset_sessions():
+    # Pooled sockets must not be shared with a forked server worker
+    global _sessions, _sessions_lock
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_sessions)
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt))."""
+    base = UPSTREAM_BACKOFF_BASE_SECONDS if base is None else base
+    cap = UPSTREAM_BACKOFF_MAX_SECONDS if cap is None else cap
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def is_retryable(error):
+    """Connection problems, timeouts and 408/429/5xx answers; never client errors."""
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+    import requests
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    # UpstreamHTTPError, elevenlabs ApiError (status_code), google.api_core errors (code)
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRY_STATUSES
+    # httpx transport errors raised by the async SDKs
+    return type(error).__module__.startswith("httpx") and "Error" in type(error).__name__
+
+
+def _sleep_budget(delay):
+    """Clip a backoff delay to the request budget; None when no attempt would fit."""
+    remaining = remaining_budget()
+    if remaining is None:
+        return delay
+    # Leave at least as much time for the next attempt as we spend waiting
+    if remaining <= delay * 2:
+        return None
+    return delay
+
+
+def _attempt_timeout():
+    remaining = remaining_budget()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded("Request budget exhausted before the upstream call")
+    read = UPSTREAM_READ_TIMEOUT_SECONDS if remaining is None else min(UPSTREAM_READ_TIMEOUT_SECONDS, remaining)
+    return (min(UPSTREAM_CONNECT_TIMEOUT_SECONDS, read), read)
+
+
+def request(provider, method, url, data=None, retries=None, **kwargs):
+    """
+    requests call through the provider's pooled session, with per-attempt
+    timeouts from the request budget, jittered retries and the breaker.
+    A seekable `data` stream is rewound before every retry. Returns the 2xx
+    response or raises.
+    """
+    breaker = breakers[provider]
+    retries = UPSTREAM_MAX_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        breaker.before_call()
+        try:
+            timeout = _attempt_timeout()
+        except DeadlineExceeded:
+            breaker.record_neutral()
+            raise
+        try:
+            if attempt and hasattr(data, "seek"):
+                data.seek(0)
+            response = get_session(provider).request(method, url, data=data, timeout=timeout, **kwargs)
+            if response.status_code >= 400:
+                raise UpstreamHTTPError(provider, response.status_code, response.text[:500])
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_neutral()
+            delay = _sleep_budget(backoff_delay(attempt)) if retryable and attempt < retries else None
+            if delay is None:
+                raise
+            logger.warning(f"{provider} attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+            RETRIES.inc(provider=provider)
+            time.sleep(delay)
+            continue
+        breaker.record_success()
+        return response
+
+
+async def call_async(provider, func, *args, retries=None, attempt_timeout=None, **kwargs):
+    """
+    Await func(*args, **kwargs) (an SDK coroutine) behind the provider's
+    breaker, retrying transient failures with jittered backoff. Each attempt
+    is capped by attempt_timeout and the request budget; the pipeline stage
+    wrapping this call bounds the total.
+    """
+    breaker = breakers[provider]
+    retries = UPSTREAM_MAX_RETRIES if retries is None else retries
+    attempt_timeout = UPSTREAM_ATTEMPT_TIMEOUT_SECONDS if attempt_timeout is None else attempt_timeout
+    for attempt in range(retries + 1):
+        breaker.before_call()
+        remaining = remaining_budget()
+        if remaining is not None and remaining <= 0:
+            breaker.record_neutral()
+            raise DeadlineExceeded("Request budget exhausted before the upstream call")
+        timeout = attempt_timeout if remaining is None else min(attempt_timeout, remaining)
+        try:
+            result = await asyncio.wait_for(func(*args, **kwargs), timeout)
+        except asyncio.CancelledError:
+            # Stage timeout or client gone: say nothing about provider health
+            breaker.record_neutral()
+            raise
+        except Exception as e:
+            retryable = is_retryable(e)
+            if retryable:
+                breaker.record_failure()
+            else:
+                breaker.record_neutral()
+            delay = _sleep_budget(backoff_delay(attempt)) if retryable and attempt < retries else None
+            if delay is None:
+                raise
+            logger.warning(f"{provider} attempt {attempt + 1} failed ({e}), retrying in {delay:.2f}s")
+            RETRIES.inc(provider=provider)
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def stats():
+    return {provider: breaker.stats() for provider, breaker in breakers.items()}